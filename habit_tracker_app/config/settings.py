@@ -145,4 +145,42 @@ SPECTACULAR_SETTINGS = {
     'DESCRIPTION': 'API для отслеживания привычек',
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False, 
-}
\ No newline at end of file
+}
+
+# Кэш ответов API (habits/cache.py) и закрытых недель (get_serialized_habit_weeks) сбрасывают не только запросы к веб-серверу,
+# но и команды в других процессах (process_check_ins, import_habits, rollover_habits --workers), поэтому кэш должен быть общим для всех процессов:
+# Redis, если задан REDIS_URL, иначе таблица в БД (manage.py createcachetable). Кэш в памяти процесса (LocMemCache, по умолчанию в Django) не подходит -
+# сброс из другого процесса до него не доходит. Исключение - тесты: они выполняются в одном процессе, а запросы кэша в БД исказили бы подсчёт запросов
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+elif 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100_000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'habits_cache',
+            'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+        }
+    }
+
+# Хранить ли пропущенные дни в БД логами forgot_to_mark. Если нет - они достраиваются при чтении истории привычки
+HABITS_STORE_FORGOT_TO_MARK_LOGS = os.environ.get('HABITS_STORE_FORGOT_TO_MARK_LOGS', '1') == '1'
+
+# Принимать ли check-in через API асинхронно: запрос попадает в очередь в БД, ответ - 202 со ссылкой на статус,
+# логи создаёт воркер (manage.py process_check_ins). Без настройки асинхронный режим включается заголовком Prefer: respond-async
+HABITS_ASYNC_CHECK_IN = os.environ.get('HABITS_ASYNC_CHECK_IN', '0') == '1'
+
+# Сколько секунд перед курсором /api/sync/ изменения отдаются повторно (см. HabitSyncCursor): запас на расхождение часов серверов приложения и БД
+# и на время, которое сервис берёт через timezone.now() до первого запроса своей транзакции
+HABITS_SYNC_CURSOR_OVERLAP_SECONDS = int(os.environ.get('HABITS_SYNC_CURSOR_OVERLAP_SECONDS', '5'))
@@ -1,12 +1,27 @@
 from django.contrib import admin
 
 from .models import Habit, HabitLog
+from .services import save_habit_log, delete_habit_logs
 
 class HabitAdmin(admin.ModelAdmin):
-   readonly_fields = ['streak']
+   readonly_fields = ['streak', 'period_start', 'period_complited', 'last_log_date', 'schedule_epoch']
 
 class HabitLogAdmin(admin.ModelAdmin):
-   readonly_fields = ['date']
+   readonly_fields = ['date', 'epoch']
+
+   def save_model(self, request, obj, form, change):
+      if not change:
+         # новый лог относится к текущему расписанию привычки - логи прошлых расписаний не видны for_habit
+         obj.epoch = obj.habit.schedule_epoch
+      # изменение статуса меняет streak привычки и должно попасть в /api/sync/ (см. save_habit_log)
+      save_habit_log(obj)
+
+   def delete_model(self, request, obj):
+      # удаление лога меняет streak привычки и должно попасть в /api/sync/ (см. delete_habit_logs)
+      delete_habit_logs(HabitLog.objects.filter(pk=obj.pk))
+
+   def delete_queryset(self, request, queryset):
+      delete_habit_logs(queryset)
 
 admin.site.register(Habit, HabitAdmin)
-admin.site.register(HabitLog, HabitLogAdmin)
\ No newline at end of file
+admin.site.register(HabitLog, HabitLogAdmin)
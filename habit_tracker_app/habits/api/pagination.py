@@ -0,0 +1,123 @@
+from base64 import b64decode, b64encode
+from datetime import date, datetime, timedelta
+from urllib import parse
+
+from django.conf import settings
+
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+from ..helpers import get_habit_logs_page, get_habit_weeks_page, get_habits_page
+from ..models import HabitLog
+
+
+class KeysetCursorPagination:
+    '''
+        Основа курсорной (keyset) пагинации: позиция следующей страницы кодируется в непрозрачный курсор в query-параметре,
+        как в rest_framework.pagination.CursorPagination, а выборка страницы выполняется по индексу и не зависит от номера страницы.
+        Query-параметры читаются из request.GET, поэтому пагинация работает и в API, и в HTML-представлениях.
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 30
+    max_page_size = 365
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request, page_size=None, max_page_size=None):
+        try:
+            requested_page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size or self.page_size
+        return min(max(requested_page_size, 1), max_page_size or self.max_page_size)
+
+    def decode_cursor(self, request):
+        '''Возвращает позицию из курсора запроса (словарь строк) или None для первой страницы'''
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            return dict(parse.parse_qsl(b64decode(encoded.encode('ascii')).decode('ascii'), strict_parsing=True))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position: dict):
+        return b64encode(parse.urlencode(position).encode('ascii')).decode('ascii')
+
+    def get_link(self, request, position, url=None):
+        '''Ссылка на страницу с позицией position; url - адрес ресурса, если он отличается от адреса запроса'''
+        if position is None:
+            return None
+        return replace_query_param(url or request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(position))
+
+
+class HabitHistoryCursorPagination(KeysetCursorPagination):
+    '''
+        Пагинация истории привычки от новых логов к старым (см. get_habit_logs_page и get_habit_weeks_page).
+        Ежедневная привычка листается по записям, еженедельная - целыми неделями, поэтому page_size для неё - кол-во недель.
+    '''
+    weekly_page_size = 8
+    weekly_max_page_size = 53
+
+    def paginate_habit_history(self, habit, request, url=None, date_range=(None, None), serialize_week=None):
+        '''
+            Возвращает записи (или недели) страницы истории в пределах date_range (см. get_habit_logs_date_range) и ссылку на следующую страницу.
+            Недели возвращаются уже сериализованными serialize_week, если он передан (закрытые недели - из кэша, см. get_serialized_habit_weeks)
+        '''
+        before = self.get_before_date(request)
+        habit_logs = HabitLog.objects.for_habit(habit)
+        if habit.datetype == 'weekly':
+            weeks_count = self.get_page_size(request, self.weekly_page_size, self.weekly_max_page_size)
+            page, next_before = get_habit_weeks_page(habit, habit_logs, weeks_count, before, *date_range, serialize_week=serialize_week)
+        else:
+            page, next_before = get_habit_logs_page(habit_logs, self.get_page_size(request), before, *date_range)
+        next_position = None if next_before is None else {'before': next_before.isoformat()}
+        return page, self.get_link(request, next_position, url)
+
+    def get_before_date(self, request):
+        position = self.decode_cursor(request)
+        if position is None:
+            return None
+        try:
+            return date.fromisoformat(position['before'])
+        except (KeyError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class HabitListCursorPagination(KeysetCursorPagination):
+    '''Пагинация списка привычек от новых к старым по ключу (creation_date, id) (см. get_habits_page)'''
+    page_size = 50
+    max_page_size = 500
+
+    def paginate_habits(self, habits, request):
+        '''Возвращает привычки страницы и ссылку на следующую страницу'''
+        page, next_after = get_habits_page(habits, self.get_page_size(request), self.get_after(request))
+        next_position = None if next_after is None else {'creation_date': next_after[0].isoformat(), 'id': next_after[1]}
+        return page, self.get_link(request, next_position)
+
+    def get_after(self, request):
+        position = self.decode_cursor(request)
+        if position is None:
+            return None
+        try:
+            return datetime.fromisoformat(position['creation_date']), int(position['id'])
+        except (KeyError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class HabitSyncCursor(KeysetCursorPagination):
+    '''Курсор синхронизации /api/sync/: момент, после которого клиенту нужны изменения, в query-параметре since'''
+    cursor_query_param = 'since'
+    # курсор - начало самой старой незавершённой транзакции (см. get_sync_cursor_time), поэтому изменения долгих транзакций не теряются;
+    # изменения за последние секунды перед курсором отдаются повторно только на случай расхождения часов (HABITS_SYNC_CURSOR_OVERLAP_SECONDS)
+
+    def get_since(self, request):
+        position = self.decode_cursor(request)
+        if position is None:
+            return None
+        try:
+            return datetime.fromisoformat(position['since']) - timedelta(seconds=settings.HABITS_SYNC_CURSOR_OVERLAP_SECONDS)
+        except (KeyError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_cursor(self, now):
+        return self.encode_cursor({'since': now.isoformat()})
@@ -0,0 +1,41 @@
+import csv
+import json
+
+from .serializers import HabitImportSerializer, HabitLogImportSerializer
+from ..services import HabitImportError
+
+IMPORT_RECORD_SERIALIZERS = {'habit': HabitImportSerializer, 'habit_log': HabitLogImportSerializer}
+
+
+def read_habit_import(lines, import_format):
+    '''
+        Проверенные записи импорта (номер строки, тип, данные) из строк файла в формате /api/export/ - по одной, не читая файл в память целиком.
+        NDJSON - записи habit и habit_log, CSV - только логи (habit_id, habit_title, date, status, comment) существующих привычек.
+        На первой ошибке выбрасывается HabitImportError с номером строки.
+    '''
+    records = read_csv_records(lines) if import_format == 'csv' else read_ndjson_records(lines)
+    for line_number, record in records:
+        serializer_class = IMPORT_RECORD_SERIALIZERS.get(record.get('type'))
+        if serializer_class is None:
+            raise HabitImportError(line_number, {'type': ['Expected "habit" or "habit_log".']})
+        serializer = serializer_class(data=record)
+        if not serializer.is_valid():
+            raise HabitImportError(line_number, serializer.errors)
+        yield line_number, record['type'], serializer.validated_data
+
+def read_ndjson_records(lines):
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise HabitImportError(line_number, {'non_field_errors': ['Invalid JSON.']})
+        if not isinstance(record, dict):
+            raise HabitImportError(line_number, {'non_field_errors': ['Expected a JSON object.']})
+        yield line_number, record
+
+def read_csv_records(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, {'type': 'habit_log', 'habit': row.get('habit_id'), 'date': row.get('date'), 'status': row.get('status'), 'comment': row.get('comment')}
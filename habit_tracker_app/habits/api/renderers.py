@@ -0,0 +1,64 @@
+import csv
+from itertools import chain, islice
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError: # orjson указан в requirements.txt, но рендерер работает и без него - тогда ответы кодирует стандартный json
+    orjson = None
+
+STREAM_BATCH_SIZE = 500
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+        JSONRenderer, кодирующий ответ через orjson - в несколько раз быстрее json.dumps на длинных историях привычек.
+        Для данных API (строки, целые числа, bool, None, даты и время) результат побайтно совпадает с JSONRenderer: компактные разделители,
+        UTF-8 без экранирования, даты и время - через encoder_class. Числа с плавающей точкой orjson записывает по-своему (1e16 вместо 1e+16),
+        а NaN и Infinity - как null, тогда как JSONRenderer на них падает, поэтому полей float в ответах, которые кодирует этот рендерер, быть не должно.
+        Если orjson не установлен, запрошен отступ (indent) или данные orjson закодировать не может, ответ кодирует JSONRenderer
+    '''
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # даты и время отдаются в encoder_class, чтобы формат совпадал с JSONRenderer (например, 'Z' вместо '+00:00')
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # как и JSONRenderer, экранируем U+2028 и U+2029 - они допустимы в JSON, но не в JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class CompactHistoryJSONRenderer(FastJSONRenderer):
+    '''
+        Компактный формат ответа (Accept: application/vnd.habit-tracker.compact+json или ?format=compact):
+        история привычки - начальная дата и упакованные статусы по дням вместо списка логов (см. pack_habit_history).
+        Сами данные в этом виде готовит представление (см. HabitsViewSet.is_compact_history), рендерер только кодирует их в JSON
+    '''
+    media_type = 'application/vnd.habit-tracker.compact+json'
+    format = 'compact'
+
+
+class _Echo:
+    '''Псевдо-файл для csv.writer: writerow возвращает строку вместо записи в буфер'''
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(records, batch_size=STREAM_BATCH_SIZE):
+    '''Записи (словари) в NDJSON - по строке JSON на запись, как их закодировал бы FastJSONRenderer, - кусками по batch_size строк'''
+    renderer = FastJSONRenderer()
+    return _join_lines((renderer.render(record) + b'\n' for record in records), batch_size)
+
+def stream_csv(header, rows, batch_size=STREAM_BATCH_SIZE):
+    '''Строки CSV с заголовком header - кусками по batch_size строк'''
+    writer = csv.writer(_Echo())
+    lines = (writer.writerow(row).encode() for row in chain([header], rows))
+    return _join_lines(lines, batch_size)
+
+def _join_lines(lines, batch_size):
+    # StreamingHttpResponse отправляет каждый кусок отдельно, поэтому строки склеиваются в куски покрупнее
+    while batch := b''.join(islice(lines, batch_size)):
+        yield batch
@@ -1,35 +1,91 @@
+from operator import itemgetter
+
+from django.urls import reverse
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 
-from ..models import Habit, HabitLog
-from ..helpers import divide_habit_logs_of_weekly_habit_by_week_blocks, set_habit_logs_status_forgot_to_mark, increase_habit_streak_field
+from .pagination import HabitHistoryCursorPagination
+from ..models import Habit, HabitLog, HabitCheckInRequest, get_local_now_date
+from ..helpers import start_new_habit_schedule_epoch, get_habit_logs_date_range, pack_habit_history
+from ..services import check_in_habit, HabitAlreadyCheckedIn
 
 class HabitSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     habit_logs = serializers.SerializerMethodField('habit_logs_divided_into_blocks', read_only=True)
+    weeks = serializers.SerializerMethodField('habit_week_summaries', read_only=True)
+    habit_logs_next = serializers.SerializerMethodField('habit_history_next_link', read_only=True)
     class Meta:
         model = Habit
-        fields = ['id', 'user', 'title', 'purpose', 'datetype', 'frequency', 'streak', 'habit_logs']
+        fields = ['id', 'user', 'title', 'purpose', 'datetype', 'frequency', 'streak', 'habit_logs', 'weeks', 'habit_logs_next']
         read_only_fields = ('streak', )
 
+    # дорогие поля: считаются только по запросу (?expand= или ?fields=), одна страница истории нужна им всем сразу
+    EXPANDABLE_FIELDS = {'habit_logs': ('habit_logs', 'weeks', 'habit_logs_next')}
+
     def __init__(self, *args, **kwargs):
         fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', ())
         super().__init__(*args, **kwargs)
 
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields)
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
+        allowed = set(self.fields) if fields is None else set(fields)
+        for name, expanded_fields in self.EXPANDABLE_FIELDS.items():
+            if name in expand:
+                allowed.update(expanded_fields)
+        for field_name in set(self.fields) - allowed:
+            self.fields.pop(field_name)
+
+    @extend_schema_field(serializers.ListField(child=serializers.JSONField()))
+    def habit_logs_divided_into_blocks(self, habit):
+        page, _ = self.get_history_page(habit)
+        if self.context.get('compact_history'):
+            return pack_habit_history(self.get_history_page_logs(habit, page))
+        if habit.datetype == 'weekly':
+            return [week['logs'] for week in page]
+        return HabitLogSerializer.serialize_rows(page)
 
-    def habit_logs_divided_into_blocks(self, *args):
-        habit = self.context.get('habit', '')
-        if habit == '':
+    @extend_schema_field(serializers.ListField(child=serializers.DictField()))
+    def habit_week_summaries(self, habit):
+        if habit.datetype != 'weekly':
             return []
-        habit_logs_json = HabitLogSerializer(HabitLog.objects.filter(habit=habit).order_by("-date"), many=True).data
+        page, _ = self.get_history_page(habit)
+        if self.context.get('compact_history'):
+            return [HabitWeekSerializer.serialize_summary(week) for week in page]
+        return [{field: week[field] for field in HabitWeekSerializer.SUMMARY_FIELDS} for week in page]
+
+    @extend_schema_field(OpenApiTypes.URI)
+    def habit_history_next_link(self, habit):
+        _, next_link = self.get_history_page(habit)
+        return next_link
+
+    def get_history_page(self, habit):
+        # в информации о привычке - только последняя страница истории, более ранние отдаёт HabitsViewSet.logs по ссылке habit_logs_next.
+        # Страница нужна и для habit_logs, и для weeks, и для habit_logs_next - читаем её один раз на привычку.
+        # Историю, уже собранную по предзагруженным логам (см. HabitsViewSet.details), передают в context['habit_history_pages'].
+        # В компактном формате (context['compact_history']) недели не сериализуются - логи с датами нужны для pack_habit_history
+        history_pages = self.__dict__.setdefault('_history_pages', dict(self.context.get('habit_history_pages', {})))
+        if habit.pk not in history_pages:
+            request = self.context['request']
+            date_range_serializer = self.context.get('habit_logs_date_range')
+            date_range = date_range_serializer.get_date_range(habit) if date_range_serializer is not None else (None, None)
+            history_url = request.build_absolute_uri(reverse('api:habit-logs', args=(habit.pk, )))
+            for param, value in zip(('from', 'to'), date_range):
+                if value is not None: # следующие страницы - в том же диапазоне дат
+                    history_url = replace_query_param(history_url, param, value.isoformat())
+            serialize_week = None if self.context.get('compact_history') else HabitWeekSerializer.serialize
+            history_pages[habit.pk] = HabitHistoryCursorPagination().paginate_habit_history(habit, request, history_url, date_range, serialize_week)
+        return history_pages[habit.pk]
+
+    @staticmethod
+    def get_history_page_logs(habit, page):
+        '''Логи страницы истории в порядке дат: страница ежедневной привычки - от новых логов к старым, еженедельной - недели с логами'''
         if habit.datetype == 'weekly':
-            divided_into_blocks = divide_habit_logs_of_weekly_habit_by_week_blocks(habit_logs_json, is_json=True)
-            return divided_into_blocks
-        return habit_logs_json
+            return [habit_log for week in page for habit_log in week['logs']]
+        return page[::-1]
     
     def validate(self, data):
         datetype = data.get('datetype')
@@ -42,8 +98,7 @@ class HabitSerializer(serializers.ModelSerializer):
         datetype = validated_data.get('datetype')
         frequency = validated_data.get('frequency')
         if (datetype != instance.datetype) or (frequency != instance.frequency):
-            HabitLog.objects.filter(habit=instance).delete()
-            instance.streak = 0
+            start_new_habit_schedule_epoch(instance)
         instance.title = validated_data.get('title')
         instance.purpose = validated_data.get('purpose')
         instance.datetype = datetype
@@ -51,26 +106,204 @@ class HabitSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
     
+class HabitSyncSerializer(serializers.ModelSerializer):
+    '''Привычка в ответе /api/sync/. При смене schedule_epoch клиент удаляет у себя логи прошлого расписания'''
+    class Meta:
+        model = Habit
+        fields = ['id', 'title', 'purpose', 'datetype', 'frequency', 'streak', 'schedule_epoch', 'updated_at']
+
+class HabitLogSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HabitLog
+        fields = ['id', 'habit', 'epoch', 'date', 'status', 'comment', 'updated_at']
+
 class HabitLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = HabitLog
         fields = ['id', 'status', 'comment']
 
+    get_row_values = itemgetter(*Meta.fields)
+
     def __init__(self, *args, **kwargs):
         self.habit = kwargs.pop('habit', None)
         super().__init__(*args, **kwargs)
 
-        self.habit_logs = HabitLog.objects.filter(habit=self.habit)
+    def validate(self, data):
+        if self.habit.last_log_date == get_local_now_date():
+            raise self.already_checked_in_error(self.habit.last_log_date)
+        return data
     
     def create(self, validated_data):
-        if self.habit_logs.count() > 0:
-            last_habit_log_date = self.habit_logs.last().date
-            set_habit_logs_status_forgot_to_mark(self.habit, last_habit_log_date)
-        increase_habit_streak_field(self.habit, self.habit_logs, self.validated_data['status'])
-
-        instance = HabitLog.objects.create(
-            habit=self.habit,
-            comment=validated_data['comment'],
-            status=validated_data['status']
-        )
-        return instance
+        try:
+            return check_in_habit(self.habit, validated_data['status'], validated_data['comment'])
+        except HabitAlreadyCheckedIn as e: # параллельный запрос успел создать лог раньше
+            raise self.already_checked_in_error(e.args[0])
+
+    @classmethod
+    def serialize_rows(cls, habit_logs):
+        '''
+            Логи (словари из .values(), см. fill_habit_log_gaps) в том же виде, что и HabitLogSerializer(habit_logs, many=True).data, но без конвейера полей DRF:
+            значения полей берутся из словарей как есть - это уже строки, числа и None, которые поля DRF вернули бы без изменений. Только для чтения истории
+        '''
+        return [dict(zip(cls.Meta.fields, cls.get_row_values(habit_log))) for habit_log in habit_logs]
+
+    @staticmethod
+    def already_checked_in_error(last_habit_log_date):
+        return serializers.ValidationError({
+            api_settings.NON_FIELD_ERRORS_KEY: [f'A log for this habit has already been created today ({last_habit_log_date}).']
+        })
+
+class HabitCheckInSerializer(serializers.ModelSerializer):
+    '''Элемент batch check-in /api/checkins/: лог за сегодня для привычки habit_id'''
+    MAX_COUNT = 500
+
+    habit_id = serializers.IntegerField()
+    class Meta:
+        model = HabitLog
+        fields = ['habit_id', 'status', 'comment']
+
+class HabitCheckInRequestSerializer(serializers.ModelSerializer):
+    '''Асинхронный check-in и его состояние: после обработки - id созданного лога или ошибка'''
+    status_url = serializers.SerializerMethodField()
+    class Meta:
+        model = HabitCheckInRequest
+        fields = ['id', 'habit', 'date', 'status', 'comment', 'state', 'habit_log_id', 'error', 'creation_date', 'processed_at', 'status_url']
+        read_only_fields = fields
+
+    def get_status_url(self, check_in_request) -> str:
+        return self.context['request'].build_absolute_uri(reverse('api:check-in-status', args=(check_in_request.pk, )))
+
+class HabitWeekSerializer(serializers.Serializer):
+    '''Итоги недели еженедельной привычки (см. get_habit_week_summaries) вместе с её логами'''
+    SUMMARY_FIELDS = ('start', 'end', 'complited', 'incomplited', 'forgot_to_mark', 'is_closed', 'is_complited')
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    complited = serializers.IntegerField()
+    incomplited = serializers.IntegerField()
+    forgot_to_mark = serializers.IntegerField()
+    is_closed = serializers.BooleanField()
+    is_complited = serializers.BooleanField()
+    logs = HabitLogSerializer(many=True)
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    @staticmethod
+    def serialize(week):
+        '''
+            Сериализованная неделя в виде, пригодном для хранения в кэше (см. get_serialized_habit_weeks).
+            Совпадает с HabitWeekSerializer(week).data, но собирается напрямую, без конвейера полей DRF
+        '''
+        return {**HabitWeekSerializer.serialize_summary(week), 'logs': HabitLogSerializer.serialize_rows(week['logs'])}
+
+    @staticmethod
+    def serialize_summary(week):
+        '''Итоги недели (SUMMARY_FIELDS) без её логов'''
+        return {
+            'start': week['start'].isoformat(),
+            'end': week['end'].isoformat(),
+            'complited': int(week['complited']),
+            'incomplited': int(week['incomplited']),
+            'forgot_to_mark': int(week['forgot_to_mark']),
+            'is_closed': bool(week['is_closed']),
+            'is_complited': bool(week['is_complited']),
+        }
+
+class HabitLogsDateRangeSerializer(serializers.Serializer):
+    '''Query-параметры диапазона дат истории привычки: from и to или last_n_weeks - последние недели, включая текущую'''
+    last_n_weeks = serializers.IntegerField(required=False, min_value=1, max_value=520)
+
+    def get_fields(self):
+        # from - зарезервированное слово, поэтому поля дат добавляются здесь
+        fields = super().get_fields()
+        fields['from'] = serializers.DateField(required=False)
+        fields['to'] = serializers.DateField(required=False)
+        return fields
+
+    def validate(self, data):
+        if data.get('last_n_weeks') and ('from' in data or 'to' in data):
+            raise serializers.ValidationError('Use either from/to or last_n_weeks, not both.')
+        if 'from' in data and 'to' in data and data['from'] > data['to']:
+            raise serializers.ValidationError({'from': 'The start date must not be later than the end date.'})
+        return data
+
+    def get_date_range(self, habit):
+        '''Границы (from, to) истории привычки, выровненные по неделям привычки (см. get_habit_logs_date_range)'''
+        return get_habit_logs_date_range(habit, self.validated_data.get('from'), self.validated_data.get('to'), self.validated_data.get('last_n_weeks'))
+
+
+class HabitFieldsQuerySerializer(serializers.Serializer):
+    '''Query-параметры состава полей привычки: fields - нужные поля, expand - дорогие поля, которые нужно посчитать (см. HabitSerializer.EXPANDABLE_FIELDS)'''
+    fields = serializers.CharField(required=False, help_text='Comma-separated list of habit fields to return.')
+    expand = serializers.CharField(required=False, help_text='Comma-separated list of expensive habit fields to compute: habit_logs.')
+
+    def validate_fields(self, value):
+        return self.split_field_names(value, HabitSerializer.Meta.fields)
+
+    def validate_expand(self, value):
+        return self.split_field_names(value, HabitSerializer.EXPANDABLE_FIELDS)
+
+    @staticmethod
+    def split_field_names(value, allowed):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed or name == 'user']
+        if unknown:
+            raise serializers.ValidationError(f'Unknown fields: {", ".join(unknown)}.')
+        return names
+
+class HabitIdsQuerySerializer(serializers.Serializer):
+    '''Query-параметр ids: id привычек через запятую или all - все привычки пользователя'''
+    ids = serializers.CharField(help_text='Comma-separated list of habit ids or "all".')
+
+    def validate_ids(self, value):
+        if value == 'all':
+            return None
+        try:
+            return [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError('Expected a comma-separated list of habit ids or "all".')
+
+class HabitExportQuerySerializer(serializers.Serializer):
+    '''Query-параметр формата выгрузки /api/export/ (format занят выбором рендерера DRF)'''
+    EXPORT_FORMATS = ('ndjson', 'csv')
+
+    export_format = serializers.ChoiceField(EXPORT_FORMATS, default='ndjson', help_text='Export file format: ndjson or csv.')
+
+class HabitImportQuerySerializer(serializers.Serializer):
+    '''Query-параметр формата файла импорта /api/import/ - те же форматы, что и у выгрузки'''
+    import_format = serializers.ChoiceField(HabitExportQuerySerializer.EXPORT_FORMATS, default='ndjson', help_text='Import file format: ndjson or csv.')
+
+class HabitImportFileSerializer(serializers.Serializer):
+    file = serializers.FileField(help_text='NDJSON or CSV file in the /api/export/ format.')
+
+class HabitImportSerializer(serializers.ModelSerializer):
+    '''Привычка в файле импорта: id - ссылка на неё из логов того же файла, сама привычка создаётся с новым id'''
+    id = serializers.IntegerField()
+    class Meta:
+        model = Habit
+        fields = ['id', 'title', 'purpose', 'datetype', 'frequency']
+
+    def validate(self, data):
+        if data.get('datetype') == 'daily' and data.get('frequency', 1) != 1:
+            raise serializers.ValidationError({'frequency': 'If you have chosen to perform a habit every day, the frequency field should be equal to 1.'})
+        return data
+
+class HabitLogImportSerializer(serializers.ModelSerializer):
+    '''Лог в файле импорта с явной датой: habit - ссылка на привычку из того же файла или id существующей привычки'''
+    habit = serializers.IntegerField()
+    class Meta:
+        model = HabitLog
+        fields = ['habit', 'date', 'status', 'comment']
+        # у модели дата по умолчанию - сегодня, но в импорте дата каждого лога должна быть явной
+        extra_kwargs = {'date': {'required': True}}
+
+    def validate_date(self, value):
+        if value > get_local_now_date():
+            raise serializers.ValidationError('The date must not be later than today.')
+        return value
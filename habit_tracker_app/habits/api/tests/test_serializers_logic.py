@@ -35,6 +35,22 @@ class HabitViewsAPITests(APITestCase):
         self.assertEqual(len(response.data["habit_logs"][0]), 7)
         self.assertEqual(len(response.data["habit_logs"][1]), logs_count-7)
 
+    def test_api_show_week_summaries_for_weekly_habit(self):
+        '''Проверка, что для недельной привычки api detail отдаёт итоги каждой недели, посчитанные в БД'''
+        habit = Habit.objects.get(datetype='weekly')
+        for _ in range(1, 10):
+            create_habit_log(habit, f'New log {_} день назад', HABIT_LOG_STATUS_COMPLITED if _ in (1, 2, 8) else HABIT_LOG_STATUS_INCOMPLITED, _)
+
+        self.client.login(username=self.username1, password=self.password1)
+        response = self.client.get(reverse("api:habit-detail", args=(habit.id, )))
+        weeks = response.data['weeks']
+
+        self.assertEqual([week['complited'] for week in weeks], [1, 2])
+        self.assertEqual([week['incomplited'] for week in weeks], [6, 0])
+        self.assertEqual([week['is_closed'] for week in weeks], [True, False])
+        self.assertEqual([week['is_complited'] for week in weeks], [False, True])
+        self.assertEqual([log['comment'] for log in response.data['habit_logs'][1]], ['New log 2 день назад', 'New log 1 день назад'])
+
     def test_api_creation_habitlogs_with_status_forgot_to_mark(self):
         '''
             Проверка api создания логов привычки, которые не были созданы пользователем в промежутке хотя бы в два дня между последним логом и текущей датой.
@@ -1,10 +1,36 @@
+import csv
+import io
+import json
+from base64 import b64decode
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import skipUnless
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
 
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 
-from ...models import Habit, HabitLog, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED
-from ...tests.factories import generate_habit_input_data, create_user, create_habit, create_habit_log, generate_habit_log_data
+from ..pagination import HabitSyncCursor
+from ..renderers import FastJSONRenderer
+from ..serializers import HabitLogSerializer, HabitWeekSerializer
+from ...cache import get_response_cache_stats, get_generation_key, invalidate_user_responses
+from ...models import (
+    Habit, HabitLog, HabitLogIdempotencyKey, HabitCheckInRequest, HABIT_LOG_STATUS, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_FORGOT_TO_MARK_COMMENT, get_local_now_date
+)
+from ...helpers import start_new_habit_schedule_epoch, fill_habit_log_gaps, get_habit_week_summaries, rebuild_habit_streak
+from ...admin import HabitLogAdmin
+from ...services import rollover_habits, process_check_in_queue, HABIT_TOMBSTONE_RETENTION
+from ...tests.factories import generate_habit_input_data, create_user, create_habit, create_habit_log, generate_habit_log_data, sync_habit_period_counters
 
 
 class HabitViewsAPITests(APITestCase):
@@ -36,10 +62,10 @@ class HabitViewsAPITests(APITestCase):
         other_user_response = self.client.get(reverse('api:habit-list'))
 
         self.assertEqual(owner_response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(owner_response.data), 2)
+        self.assertEqual(len(owner_response.data['results']), 2)
 
         self.assertEqual(other_user_response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(other_user_response.data), 0)
+        self.assertEqual(len(other_user_response.data['results']), 0)
 
     def test_api_habit_create_is_login_required(self):
         '''Проверка, что создать привычку может только залогиненный пользователь (POST)'''
@@ -233,3 +259,1207 @@ class HabitViewsAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(HabitLog.objects.filter(comment=data['comment']).exists())
         self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1)
+
+
+    def test_api_create_habit_log_twice_a_day_not_allowed(self):
+        '''Проверка, что второй лог привычки за день не создаётся (POST)'''
+        habit = Habit.objects.get(datetype="daily")
+        data = generate_habit_log_data('com', HABIT_LOG_STATUS_COMPLITED)
+
+        self.client.login(username=self.username1, password=self.password1)
+        first_response = self.client.post(reverse('api:api_create_habit_log', args=(habit.id, )), data)
+        second_response = self.client.post(reverse('api:api_create_habit_log', args=(habit.id, )), data)
+
+        self.assertEqual(first_response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1)
+        self.assertEqual(Habit.objects.get(pk=habit.pk).streak, 1)
+
+    def test_api_create_habit_log_retry_with_idempotency_key_returns_stored_response(self):
+        '''Проверка, что повтор запроса с тем же Idempotency-Key возвращает сохранённый ответ без новой записи (POST)'''
+        habit = Habit.objects.get(datetype="daily")
+        data = generate_habit_log_data('com', HABIT_LOG_STATUS_COMPLITED)
+        url = reverse('api:api_create_habit_log', args=(habit.id, ))
+
+        self.client.login(username=self.username1, password=self.password1)
+        first_response = self.client.post(url, data, headers={'Idempotency-Key': 'check-in-1'})
+        with self.assertNumQueries(3): # сессия, пользователь, сохранённый ответ
+            retry_response = self.client.post(url, data, headers={'Idempotency-Key': 'check-in-1'})
+
+        self.assertEqual(first_response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry_response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry_response.data, first_response.data)
+        self.assertEqual(retry_response.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1)
+        self.assertEqual(Habit.objects.get(pk=habit.pk).streak, 1)
+
+    def test_api_idempotency_key_cannot_be_reused_for_another_habit(self):
+        '''Проверка, что Idempotency-Key, использованный для одной привычки, нельзя использовать для другой (POST)'''
+        data = generate_habit_log_data('com', HABIT_LOG_STATUS_COMPLITED)
+
+        self.client.login(username=self.username1, password=self.password1)
+        self.client.post(reverse('api:api_create_habit_log', args=(self.habit_daily.id, )), data, headers={'Idempotency-Key': 'check-in-1'})
+        response = self.client.post(reverse('api:api_create_habit_log', args=(self.habit_weekly.id, )), data, headers={'Idempotency-Key': 'check-in-1'})
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(HabitLog.objects.filter(habit=self.habit_weekly).exists())
+
+    def save_idempotency_key_after_habit_is_read(self, habit, key):
+        '''
+            Имитирует параллельный запрос с тем же Idempotency-Key: ключ записывается сразу после чтения привычки,
+            т.е. после проверки сохранённого ответа, но до записи ключа этим запросом
+        '''
+        saved = []
+        def execute(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not saved and f'FROM "{Habit._meta.db_table}"' in sql:
+                saved.append(HabitLogIdempotencyKey.objects.create(user=self.user1, key=key, habit=habit, response_status=status.HTTP_201_CREATED, response_data={'id': 0}))
+            return result
+        return connection.execute_wrapper(execute)
+
+    def test_api_concurrent_idempotency_key_for_another_habit(self):
+        '''Проверка, что ключ, записанный параллельным запросом для другой привычки, даёт 422, а не ошибку сервера, и check-in откатывается (POST)'''
+        self.client.login(username=self.username1, password=self.password1)
+        with self.save_idempotency_key_after_habit_is_read(self.habit_daily, 'check-in-1'):
+            response = self.client.post(
+                reverse('api:api_create_habit_log', args=(self.habit_weekly.id, )), generate_habit_log_data('com', HABIT_LOG_STATUS_COMPLITED), headers={'Idempotency-Key': 'check-in-1'}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(HabitLog.objects.filter(habit=self.habit_weekly).exists())
+        self.assertIsNone(Habit.objects.get(pk=self.habit_weekly.pk).last_log_date)
+
+    def test_api_concurrent_async_retry_with_idempotency_key(self):
+        '''Проверка, что параллельный повтор асинхронного check-in с тем же ключом возвращает сохранённый ответ и не ставит запрос в очередь (POST)'''
+        self.client.login(username=self.username1, password=self.password1)
+        with self.save_idempotency_key_after_habit_is_read(self.habit_daily, 'check-in-1'):
+            response = self.client.post(
+                reverse('api:api_create_habit_log', args=(self.habit_daily.id, )), generate_habit_log_data('com', HABIT_LOG_STATUS_COMPLITED),
+                headers={'Idempotency-Key': 'check-in-1', 'Prefer': 'respond-async'}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'id': 0})
+        self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+        self.assertFalse(HabitCheckInRequest.objects.exists())
+
+
+class HabitHistoryPaginationAPITests(APITestCase):
+    def setUp(self):
+        self.username1 = 'admin_api_pagination'
+        self.password1 = 'api_pagination1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+
+    def create_habit_logs(self, habit, days_before_list):
+        today = get_local_now_date()
+        HabitLog.objects.bulk_create(
+            HabitLog(habit=habit, comment=f'Log {days_before}', status=HABIT_LOG_STATUS_COMPLITED, date=today - timedelta(days=days_before))
+            for days_before in days_before_list
+        )
+        sync_habit_period_counters(habit)
+
+    def get_all_pages(self, url):
+        pages = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data['results'])
+            url = response.data['next']
+        return pages
+
+    def test_api_habit_detail_shows_only_last_page_of_daily_habit_history(self):
+        '''Проверка, что в детальной информации о ежедневной привычке только последняя страница истории и ссылка на следующую (GET)'''
+        self.create_habit_logs(self.habit_daily, range(1, 46))
+
+        response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, )))
+        pages = self.get_all_pages(response.data['habit_logs_next'])
+
+        self.assertEqual([log['comment'] for log in response.data['habit_logs']], [f'Log {days_before}' for days_before in range(1, 31)])
+        self.assertEqual([[log['comment'] for log in page] for page in pages], [[f'Log {days_before}' for days_before in range(31, 46)]])
+
+    def test_api_habit_logs_pages_daily_habit_by_cursor(self):
+        '''Проверка, что история ежедневной привычки листается курсором без пропусков и повторов за фиксированное кол-во запросов (GET)'''
+        self.create_habit_logs(self.habit_daily, range(1, 401))
+        url = reverse('api:habit-logs', args=(self.habit_daily.id, ), query={'page_size': 50})
+
+        with self.assertNumQueries(4): # сессия, пользователь, привычка, страница логов
+            response = self.client.get(url)
+        pages = self.get_all_pages(url)
+
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertEqual(len(pages), 8)
+        self.assertEqual([log['comment'] for page in pages for log in page], [f'Log {days_before}' for days_before in range(1, 401)])
+
+    @override_settings(HABITS_STORE_FORGOT_TO_MARK_LOGS=False)
+    def test_api_habit_logs_pages_include_missed_days_not_stored_in_db(self):
+        '''Проверка, что пропущенные дни, не записанные в БД, попадают в страницы истории, в том числе на их границах (GET)'''
+        self.create_habit_logs(self.habit_daily, [1, 40])
+
+        pages = self.get_all_pages(reverse('api:habit-logs', args=(self.habit_daily.id, ), query={'page_size': 15}))
+        habit_logs = [log for page in pages for log in page]
+
+        self.assertEqual([len(page) for page in pages], [15, 15, 10])
+        self.assertEqual([log['status'] for log in habit_logs], [HABIT_LOG_STATUS_COMPLITED] + [HABIT_LOG_STATUS_FORGOT_TO_MARK] * 38 + [HABIT_LOG_STATUS_COMPLITED])
+
+    def test_api_habit_logs_pages_weekly_habit_by_whole_weeks(self):
+        '''Проверка, что история еженедельной привычки листается целыми неделями (GET)'''
+        self.create_habit_logs(self.habit_weekly, range(1, 141))
+        url = reverse('api:habit-logs', args=(self.habit_weekly.id, ), query={'page_size': 6})
+
+        with self.assertNumQueries(6): # сессия, пользователь, привычка, границы истории, итоги недель страницы, логи страницы
+            self.client.get(url)
+        pages = self.get_all_pages(url)
+        weeks = [week for page in reversed(pages) for week in page]
+        detail_response = self.client.get(reverse('api:habit-detail', args=(self.habit_weekly.id, )))
+
+        self.assertEqual([len(page) for page in pages], [6, 6, 6, 2])
+        self.assertEqual([len(week['logs']) for week in weeks], [7] * 20)
+        self.assertEqual([week['start'] for week in weeks], [(get_local_now_date() - timedelta(days=140 - 7 * i)).isoformat() for i in range(20)])
+        self.assertEqual([log['comment'] for week in weeks for log in week['logs']], [f'Log {days_before}' for days_before in range(140, 0, -1)])
+        self.assertEqual(len(detail_response.data['weeks']), 8)
+        self.assertEqual(detail_response.data['weeks'][-1]['start'], weeks[-1]['start'])
+
+    def test_api_habit_logs_invalid_cursor(self):
+        '''Проверка, что неверный курсор возвращает 404 (GET)'''
+        response = self.client.get(reverse('api:habit-logs', args=(self.habit_daily.id, ), query={'cursor': 'not a cursor'}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_api_habit_detail_filters_habit_logs_by_date_range(self):
+        '''Проверка, что детальная информация и следующие страницы истории ограничены диапазоном дат from/to (GET)'''
+        self.create_habit_logs(self.habit_daily, range(1, 101))
+        today = get_local_now_date()
+        query = {'from': (today - timedelta(days=80)).isoformat(), 'to': (today - timedelta(days=41)).isoformat()}
+
+        response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, ), query=query))
+        pages = self.get_all_pages(response.data['habit_logs_next'])
+
+        self.assertEqual([log['comment'] for log in response.data['habit_logs']], [f'Log {days_before}' for days_before in range(41, 71)])
+        self.assertEqual([log['comment'] for page in pages for log in page], [f'Log {days_before}' for days_before in range(71, 81)])
+
+    def test_api_habit_logs_last_n_weeks_of_weekly_habit_are_whole_weeks(self):
+        '''Проверка, что last_n_weeks у еженедельной привычки возвращает целые недели привычки, включая текущую (GET)'''
+        self.create_habit_logs(self.habit_weekly, range(1, 31))
+
+        response = self.client.get(reverse('api:habit-logs', args=(self.habit_weekly.id, ), query={'last_n_weeks': 2}))
+        weeks = response.data['results']
+
+        self.assertEqual([week['start'] for week in weeks], [(get_local_now_date() - timedelta(days=days_before)).isoformat() for days_before in (9, 2)])
+        self.assertEqual([len(week['logs']) for week in weeks], [7, 2])
+        self.assertIsNone(response.data['next'])
+
+    @override_settings(HABITS_STORE_FORGOT_TO_MARK_LOGS=False)
+    def test_api_habit_logs_date_range_inside_missed_days_not_stored_in_db(self):
+        '''Проверка, что диапазон дат внутри пропуска, не записанного в БД, состоит из пропущенных дней (GET)'''
+        self.create_habit_logs(self.habit_daily, [1, 40])
+        today = get_local_now_date()
+        query = {'from': (today - timedelta(days=30)).isoformat(), 'to': (today - timedelta(days=21)).isoformat()}
+
+        response = self.client.get(reverse('api:habit-logs', args=(self.habit_daily.id, ), query=query))
+
+        self.assertEqual([log['status'] for log in response.data['results']], [HABIT_LOG_STATUS_FORGOT_TO_MARK] * 10)
+
+    def test_api_habit_logs_invalid_date_range(self):
+        '''Проверка, что неверный диапазон дат возвращает 400 (GET)'''
+        reversed_range_response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, ), query={'from': '2025-02-01', 'to': '2025-01-01'}))
+        mixed_range_response = self.client.get(reverse('api:habit-logs', args=(self.habit_daily.id, ), query={'from': '2025-02-01', 'last_n_weeks': 2}))
+
+        self.assertEqual(reversed_range_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(mixed_range_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class HabitSparseFieldsetsAPITests(APITestCase):
+    def setUp(self):
+        self.username1 = 'admin_api_fields'
+        self.password1 = 'api_fields1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+        create_habit_log(self.habit_daily, 'Log daily', HABIT_LOG_STATUS_COMPLITED)
+
+    def test_api_habit_detail_with_fields_skips_habit_logs(self):
+        '''Проверка, что детальная информация с ?fields= содержит только запрошенные поля и не читает историю (GET)'''
+        url = reverse('api:habit-detail', args=(self.habit_daily.id, ), query={'fields': 'id,title'})
+
+        with self.assertNumQueries(3): # сессия, пользователь, привычка
+            response = self.client.get(url)
+
+        self.assertEqual(response.data, {'id': self.habit_daily.id, 'title': 'api habit every day'})
+
+    def test_api_habit_detail_with_fields_and_expand(self):
+        '''Проверка, что ?expand=habit_logs добавляет историю к полям из ?fields= (GET)'''
+        response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, ), query={'fields': 'id', 'expand': 'habit_logs'}))
+
+        self.assertEqual(set(response.data), {'id', 'habit_logs', 'weeks', 'habit_logs_next'})
+        self.assertEqual([log['comment'] for log in response.data['habit_logs']], ['Log daily'])
+
+    def test_api_habit_list_with_expand_habit_logs(self):
+        '''Проверка, что список привычек по умолчанию без истории, а с ?expand=habit_logs - с историей каждой привычки (GET)'''
+        default_response = self.client.get(reverse('api:habit-list'))
+        expanded_response = self.client.get(reverse('api:habit-list', query={'expand': 'habit_logs'}))
+
+        self.assertNotIn('habit_logs', default_response.data['results'][0])
+        expanded_habit_logs = {habit['id']: [log['comment'] for log in habit['habit_logs']] for habit in expanded_response.data['results']}
+        self.assertEqual(expanded_habit_logs, {self.habit_daily.id: ['Log daily'], self.habit_weekly.id: []})
+
+    def test_api_habit_list_with_expand_habit_logs_reads_logs_in_one_query(self):
+        '''Проверка, что история привычек в списке читается одним запросом на всю страницу, а не запросами для каждой привычки (GET)'''
+        for i in range(5):
+            create_habit_log(create_habit(self.user1, f'api habit {i}', 'api habit purpose', 'daily'), 'Log daily', HABIT_LOG_STATUS_COMPLITED)
+
+        with self.assertNumQueries(5): # сессия, пользователь, версия списка, страница привычек, логи
+            response = self.client.get(reverse('api:habit-list', query={'expand': 'habit_logs'}))
+
+        self.assertEqual({habit['id']: len(habit['habit_logs']) for habit in response.data['results']}, {habit.id: int(habit != self.habit_weekly) for habit in Habit.objects.all()})
+
+    def test_api_habit_list_with_fields(self):
+        '''Проверка, что ?fields= задаёт поля списка привычек (GET)'''
+        response = self.client.get(reverse('api:habit-list', query={'fields': 'id,streak'}))
+
+        self.assertEqual([set(habit) for habit in response.data['results']], [{'id', 'streak'}] * 2)
+
+    def test_api_habit_unknown_fields(self):
+        '''Проверка, что неизвестные поля в ?fields= и ?expand= возвращают 400 (GET)'''
+        unknown_fields_response = self.client.get(reverse('api:habit-list', query={'fields': 'id,password'}))
+        unknown_expand_response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, ), query={'expand': 'title'}))
+
+        self.assertEqual(unknown_fields_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(unknown_expand_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HabitBulkDetailsAPITests(APITestCase):
+    def setUp(self):
+        self.username1 = 'admin_api_bulk'
+        self.password1 = 'api_bulk1234'
+        self.username2 = 'admin2_api_bulk'
+        self.password2 = 'api_bulk1234_2'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.user2 = create_user(self.username2, self.password2)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+        self.habit_other_user = create_habit(self.user2, 'api habit other user', 'api habit purp', 'daily')
+        today = get_local_now_date()
+        for habit, days_before_list in ((self.habit_daily, [1, 2, 5, 9, 20, 40]), (self.habit_weekly, [0, 3, 4, 11, 25, 60]), (self.habit_other_user, [1])):
+            HabitLog.objects.bulk_create(
+                HabitLog(habit=habit, comment=f'Log {days_before}', status=HABIT_LOG_STATUS_COMPLITED, date=today - timedelta(days=days_before))
+                for days_before in days_before_list
+            )
+            sync_habit_period_counters(habit)
+
+    def test_api_habit_details_match_habit_detail(self):
+        '''Проверка, что массовая детальная информация о привычках совпадает с детальной информацией о каждой из них за тот же диапазон (GET)'''
+        query = {'last_n_weeks': 3}
+        response = self.client.get(reverse('api:habit-details', query={'ids': f'{self.habit_daily.id},{self.habit_weekly.id}', **query}))
+
+        expected = [
+            self.client.get(reverse('api:habit-detail', args=(habit.id, ), query=query)).data
+            for habit in (self.habit_weekly, self.habit_daily)
+        ]
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, expected)
+
+    def test_api_habit_details_read_logs_in_one_query(self):
+        '''Проверка, что логи всех привычек читаются одним запросом, и чужие привычки не попадают в ответ (GET)'''
+        with self.assertNumQueries(4): # сессия, пользователь, привычки, логи
+            response = self.client.get(reverse('api:habit-details', query={'ids': 'all'}))
+
+        self.assertEqual([habit['id'] for habit in response.data], [self.habit_weekly.id, self.habit_daily.id])
+        self.assertEqual([log['comment'] for log in response.data[1]['habit_logs'] if log['id'] is not None], ['Log 1', 'Log 2', 'Log 5', 'Log 9', 'Log 20'])
+
+    def test_api_habit_details_invalid_ids(self):
+        '''Проверка, что без ids или с неверными ids возвращается 400, а чужие привычки не возвращаются (GET)'''
+        missing_ids_response = self.client.get(reverse('api:habit-details'))
+        invalid_ids_response = self.client.get(reverse('api:habit-details', query={'ids': '1,abc'}))
+        other_user_response = self.client.get(reverse('api:habit-details', query={'ids': str(self.habit_other_user.id)}))
+
+        self.assertEqual(missing_ids_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(invalid_ids_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(other_user_response.data, [])
+
+
+class HabitSyncAPITests(APITestCase):
+    def setUp(self):
+        self.username1 = 'admin_api_sync'
+        self.password1 = 'api_sync1234'
+        self.username2 = 'admin2_api_sync'
+        self.password2 = 'api_sync1234_2'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.user2 = create_user(self.username2, self.password2)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+        self.habit_other_user = create_habit(self.user2, 'api habit other user', 'api habit purp', 'daily')
+        for habit in (self.habit_daily, self.habit_weekly, self.habit_other_user):
+            create_habit_log(habit, 'Log yesterday', HABIT_LOG_STATUS_COMPLITED, days_before=1)
+            sync_habit_period_counters(habit)
+        # данные созданы задолго до первой синхронизации
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Habit.objects.update(updated_at=hour_ago)
+        HabitLog.objects.update(updated_at=hour_ago)
+        self.cursor = self.client.get(reverse('api:sync')).data['cursor']
+
+    def sync(self):
+        response = self.client.get(reverse('api:sync', query={'since': self.cursor}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.cursor = response.data['cursor']
+        return response.data
+
+    def test_api_full_sync_returns_only_owner_habits_and_logs(self):
+        '''Проверка, что синхронизация без курсора возвращает все привычки и логи пользователя (GET)'''
+        response = self.client.get(reverse('api:sync'))
+
+        self.assertEqual({habit['id'] for habit in response.data['habits']}, {self.habit_daily.id, self.habit_weekly.id})
+        self.assertEqual({log['habit'] for log in response.data['habit_logs']}, {self.habit_daily.id, self.habit_weekly.id})
+        self.assertEqual(response.data['deleted_habits'], [])
+
+    def test_api_sync_without_changes(self):
+        '''Проверка, что синхронизация без изменений пуста и не читает логи (GET)'''
+        with self.assertNumQueries(4): # сессия, пользователь, изменённые привычки, удалённые привычки
+            data = self.sync()
+
+        self.assertEqual((data['habits'], data['habit_logs'], data['deleted_habits'], data['deleted_habit_logs']), ([], [], [], []))
+        self.assertFalse(data['full_sync'])
+
+    def test_api_sync_returns_check_in(self):
+        '''Проверка, что после check-in синхронизация возвращает только привычку и новый лог (GET)'''
+        self.client.post(reverse('api:api_create_habit_log', args=(self.habit_daily.id, )), data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED))
+
+        data = self.sync()
+
+        self.assertEqual([habit['id'] for habit in data['habits']], [self.habit_daily.id])
+        self.assertEqual([habit['streak'] for habit in data['habits']], [1])
+        self.assertEqual([log['comment'] for log in data['habit_logs']], ['Log today'])
+
+    def test_api_sync_returns_rollover(self):
+        '''Проверка, что ночной переход на новый день попадает в синхронизацию (GET)'''
+        rollover_habits(self.user1.id, self.user1.id, today=get_local_now_date() + timedelta(days=2))
+
+        data = self.sync()
+
+        self.assertEqual({habit['id'] for habit in data['habits']}, {self.habit_daily.id, self.habit_weekly.id})
+        self.assertEqual([habit['streak'] for habit in data['habits'] if habit['id'] == self.habit_daily.id], [0])
+
+    def test_api_sync_returns_deleted_habits(self):
+        '''Проверка, что удалённая привычка попадает в deleted_habits (GET)'''
+        self.client.delete(reverse('api:habit-detail', args=(self.habit_weekly.id, )))
+
+        data = self.sync()
+
+        self.assertEqual(data['deleted_habits'], [self.habit_weekly.id])
+        self.assertEqual(self.sync()['deleted_habits'], [self.habit_weekly.id]) # повторно - из-за перекрытия курсора
+
+    def test_api_sync_returns_log_deleted_in_admin(self):
+        '''Проверка, что лог, удалённый в админке, попадает в deleted_habit_logs, а streak привычки пересчитывается (GET)'''
+        habit_log = HabitLog.objects.get(habit=self.habit_daily)
+
+        HabitLogAdmin(HabitLog, admin.site).delete_queryset(None, HabitLog.objects.filter(pk=habit_log.pk))
+        data = self.sync()
+
+        self.assertEqual(data['deleted_habit_logs'], [habit_log.id])
+        self.assertEqual(data['deleted_habits'], [])
+        self.assertEqual([(habit['id'], habit['streak']) for habit in data['habits']], [(self.habit_daily.id, 0)])
+        self.assertIsNone(Habit.objects.get(pk=self.habit_daily.pk).last_log_date)
+
+    def test_api_sync_cursor_older_than_tombstones_retention(self):
+        '''Проверка, что по курсору старше срока хранения записей об удалениях возвращается полная синхронизация (GET)'''
+        old_cursor = HabitSyncCursor().get_next_cursor(timezone.now() - HABIT_TOMBSTONE_RETENTION - timedelta(days=1))
+
+        response = self.client.get(reverse('api:sync', query={'since': old_cursor}))
+
+        self.assertTrue(response.data['full_sync'])
+        self.assertEqual({habit['id'] for habit in response.data['habits']}, {self.habit_daily.id, self.habit_weekly.id})
+
+    def test_api_sync_invalid_cursor(self):
+        '''Проверка, что неверный курсор возвращает 404 (GET)'''
+        response = self.client.get(reverse('api:sync', query={'since': 'not a cursor'}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Курсор по самой старой незавершённой транзакции проверяется только на PostgreSQL')
+class HabitSyncLongTransactionAPITests(APITransactionTestCase):
+    def setUp(self):
+        self.user1 = create_user('admin_api_sync_long', 'api_sync_long1234')
+        self.client = APIClient()
+        self.client.login(username='admin_api_sync_long', password='api_sync_long1234')
+        self.habit = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+
+    @override_settings(HABITS_SYNC_CURSOR_OVERLAP_SECONDS=0)
+    def test_api_sync_returns_change_committed_after_cursor(self):
+        '''Проверка, что изменение транзакции, начавшейся до выдачи курсора, а завершившейся после, приходит в следующей синхронизации (GET)'''
+        other_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            other_connection.set_autocommit(False)
+            with other_connection.cursor() as cursor:
+                # как в _rollover_habits_with_sql: updated_at = now() - начало транзакции, а не момент фиксации
+                cursor.execute(f'UPDATE {Habit._meta.db_table} SET title = %s, updated_at = now() WHERE id = %s', ['Renamed habit', self.habit.pk])
+            cursor_response = self.client.get(reverse('api:sync'))
+            other_connection.commit()
+        finally:
+            other_connection.close()
+
+        response = self.client.get(reverse('api:sync', query={'since': cursor_response.data['cursor']}))
+
+        self.assertEqual(cursor_response.data['habits'][0]['title'], 'api habit every day')
+        self.assertEqual([habit['title'] for habit in response.data['habits']], ['Renamed habit'])
+
+
+
+class HabitListPaginationAPITests(APITestCase):
+    def setUp(self):
+        self.username1 = 'admin_api_list_pages'
+        self.password1 = 'api_list_pages1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        Habit.objects.bulk_create(Habit(user=self.user1, title=f'Habit {i}', datetype='daily') for i in range(10))
+        # у половины привычек одинаковое время создания - порядок внутри них задаёт id
+        Habit.objects.filter(title__in=[f'Habit {i}' for i in range(3, 8)]).update(creation_date=timezone.now() - timedelta(days=1))
+
+    def get_all_pages(self, url):
+        pages = []
+        while url is not None:
+            with self.assertNumQueries(4): # сессия, пользователь, версия списка, страница привычек
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([habit['id'] for habit in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_api_habit_list_pages_by_cursor(self):
+        '''Проверка, что список привычек листается курсором без пропусков и повторов, в порядке от новых к старым (GET)'''
+        pages = self.get_all_pages(reverse('api:habit-list', query={'page_size': 3}))
+
+        expected = list(Habit.objects.order_by('-creation_date', '-id').values_list('id', flat=True))
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_api_habit_list_invalid_cursor(self):
+        '''Проверка, что неверный курсор списка привычек возвращает 404 (GET)'''
+        response = self.client.get(reverse('api:habit-list', query={'cursor': 'abc'}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HabitConditionalGetAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_etag'
+        self.password1 = 'api_etag1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+        create_habit_log(self.habit_daily, 'Log yesterday', HABIT_LOG_STATUS_COMPLITED, days_before=1)
+        sync_habit_period_counters(self.habit_daily)
+
+    def test_api_habit_detail_not_modified(self):
+        '''Проверка, что неизменённая привычка возвращает 304 без чтения логов, а после check-in - новую версию (GET)'''
+        url = reverse('api:habit-detail', args=(self.habit_daily.id, ))
+        response = self.client.get(url)
+
+        with self.assertNumQueries(2): # сессия, пользователь - ответ и его ETag из кэша ответов
+            not_modified_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.client.post(reverse('api:api_create_habit_log', args=(self.habit_daily.id, )), data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED))
+        modified_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(not_modified_response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified_response['ETag'], response['ETag'])
+        self.assertEqual(modified_response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(modified_response['ETag'], response['ETag'])
+
+    def test_api_habit_detail_last_modified_is_not_before_today(self):
+        '''Проверка, что Last-Modified привычки, изменённой до начала дня, - начало текущего дня: с новым днём меняется и её история (GET)'''
+        Habit.objects.filter(pk=self.habit_daily.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        start_of_today = timezone.make_aware(datetime.combine(get_local_now_date(), time.min))
+
+        response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, )))
+
+        self.assertEqual(response['Last-Modified'], http_date(start_of_today.timestamp()))
+
+    def test_api_habit_detail_etag_depends_on_query(self):
+        '''Проверка, что ETag привычки зависит от query-параметров (GET)'''
+        response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, )))
+        fields_response = self.client.get(reverse('api:habit-detail', args=(self.habit_daily.id, ), query={'fields': 'id'}), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(fields_response.status_code, status.HTTP_200_OK)
+
+    def test_api_habit_list_not_modified(self):
+        '''Проверка, что неизменённый список привычек возвращает 304, а после удаления привычки - новую версию (GET)'''
+        url = reverse('api:habit-list')
+        response = self.client.get(url)
+
+        with self.assertNumQueries(2): # сессия, пользователь - ответ и его ETag из кэша ответов
+            not_modified_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.client.delete(reverse('api:habit-detail', args=(self.habit_weekly.id, )))
+        modified_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertNotIn('Last-Modified', response) # удаление привычки не меняет max(updated_at) - по If-Modified-Since список был бы 304
+        self.assertEqual(not_modified_response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(modified_response.status_code, status.HTTP_200_OK)
+        self.assertEqual([habit['id'] for habit in modified_response.data['results']], [self.habit_daily.id])
+
+
+class HabitWeeksCacheAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_weeks_cache'
+        self.password1 = 'api_weeks_cache1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+        today = get_local_now_date()
+        HabitLog.objects.bulk_create(
+            HabitLog(habit=self.habit_weekly, comment=f'Log {days_before}', status=HABIT_LOG_STATUS_COMPLITED, date=today - timedelta(days=days_before))
+            for days_before in range(34, 0, -3)
+        )
+        sync_habit_period_counters(self.habit_weekly)
+        self.url = reverse('api:habit-detail', args=(self.habit_weekly.id, ))
+
+    def test_api_closed_weeks_are_served_from_cache(self):
+        '''Проверка, что закрытые недели берутся из кэша, а открытая неделя пересчитывается (GET)'''
+        response = self.client.get(self.url)
+        # изменение в обход приложения видно только в открытой неделе - закрытые уже в кэше
+        HabitLog.objects.for_habit(self.habit_weekly).update(comment='Changed')
+        invalidate_user_responses(self.user1.id) # update() не отправляет сигналов, сбрасывающих кэш ответов
+        cached_response = self.client.get(self.url)
+
+        self.assertTrue(all(week['is_closed'] for week in response.data['weeks'][:-1]))
+        self.assertEqual(cached_response.data['habit_logs'][:-1], response.data['habit_logs'][:-1])
+        self.assertEqual({log['comment'] for log in cached_response.data['habit_logs'][-1] if log['id'] is not None}, {'Changed'})
+
+    def test_api_fully_cached_page_reads_only_history_bounds(self):
+        '''Проверка, что страница из одних закрытых недель из кэша не читает логи (GET)'''
+        HabitLog.objects.for_habit(self.habit_weekly).filter(date__gt=self.habit_weekly.period_start - timedelta(days=1)).delete()
+        sync_habit_period_counters(self.habit_weekly)
+        response = self.client.get(self.url)
+        invalidate_user_responses(self.user1.id)
+
+        with self.assertNumQueries(4): # сессия, пользователь, привычка, границы истории
+            cached_response = self.client.get(self.url)
+
+        self.assertTrue(all(week['is_closed'] for week in response.data['weeks']))
+        self.assertEqual(cached_response.data, response.data)
+
+    def test_api_schedule_change_invalidates_cached_weeks(self):
+        '''Проверка, что после смены расписания закрытые недели прошлого расписания не берутся из кэша (GET)'''
+        self.client.get(self.url)
+        start_new_habit_schedule_epoch(self.habit_weekly)
+        self.habit_weekly.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['habit_logs'], [])
+        self.assertEqual(response.data['weeks'], [])
+
+
+class HabitResponseCacheAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_response_cache'
+        self.password1 = 'api_response_cache1234'
+        self.username2 = 'admin2_api_response_cache'
+        self.password2 = 'api_response_cache5678'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.user2 = create_user(self.username2, self.password2)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 3)
+        create_habit_log(self.habit_daily, 'Log yesterday', HABIT_LOG_STATUS_COMPLITED, days_before=1)
+        sync_habit_period_counters(self.habit_daily)
+        self.url = reverse('api:habit-detail', args=(self.habit_daily.id, ))
+
+    def test_api_repeated_get_is_served_from_cache(self):
+        '''Проверка, что повторный запрос привычки и списка привычек отдаётся из кэша ответов без запросов к привычкам (GET)'''
+        response = self.client.get(self.url)
+        list_response = self.client.get(reverse('api:habit-list'))
+
+        with self.assertNumQueries(4): # сессия и пользователь для каждого из двух запросов
+            cached_response = self.client.get(self.url)
+            cached_list_response = self.client.get(reverse('api:habit-list'))
+
+        self.assertEqual(cached_response.data, response.data)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+        self.assertEqual(cached_response['Last-Modified'], response['Last-Modified'])
+        self.assertEqual(cached_list_response.data, list_response.data)
+        self.assertEqual(get_response_cache_stats(), {'hits': 2, 'misses': 2})
+
+    def test_api_cached_response_depends_on_query(self):
+        '''Проверка, что ответы с разными query-параметрами хранятся в кэше отдельно (GET)'''
+        self.client.get(self.url)
+        fields_response = self.client.get(self.url, {'fields': 'id,title'})
+
+        self.assertEqual(set(fields_response.data), {'id', 'title'})
+
+    def test_api_check_in_invalidates_cached_responses(self):
+        '''Проверка, что check-in, изменение и удаление привычки сбрасывают кэш ответов пользователя (POST, DELETE)'''
+        self.client.get(self.url)
+        self.client.get(reverse('api:habit-list'))
+        self.client.post(reverse('api:api_create_habit_log', args=(self.habit_daily.id, )), data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED))
+        checked_in_response = self.client.get(self.url)
+        self.habit_daily.title = 'Renamed habit'
+        self.habit_daily.save()
+        updated_list_response = self.client.get(reverse('api:habit-list'))
+        self.client.delete(reverse('api:habit-detail', args=(self.habit_weekly.id, )))
+        deleted_list_response = self.client.get(reverse('api:habit-list'))
+
+        self.assertEqual(checked_in_response.data['streak'], 1)
+        self.assertEqual(checked_in_response.data['habit_logs'][0]['comment'], 'Log today')
+        self.assertIn('Renamed habit', [habit['title'] for habit in updated_list_response.data['results']])
+        self.assertEqual([habit['id'] for habit in deleted_list_response.data['results']], [self.habit_daily.id])
+
+    def test_api_rollover_invalidates_cached_responses(self):
+        '''Проверка, что ночной переход на новый день сбрасывает кэш ответов владельцев привычек (GET)'''
+        three_days_ago = get_local_now_date() - timedelta(days=3)
+        HabitLog.objects.filter(habit=self.habit_daily).update(date=three_days_ago)
+        Habit.objects.filter(pk=self.habit_daily.pk).update(streak=5, period_start=three_days_ago, period_complited=1, last_log_date=three_days_ago)
+        invalidate_user_responses(self.user1.id) # update() не отправляет сигналов, сбрасывающих кэш ответов
+        cached_response = self.client.get(self.url)
+
+        rollover_habits(self.user1.id, self.user1.id)
+        response = self.client.get(self.url)
+
+        self.assertEqual(cached_response.data['streak'], 5)
+        self.assertEqual(response.data['streak'], 0)
+
+    def test_api_cached_responses_are_per_user(self):
+        '''Проверка, что кэш ответов одного пользователя не отдаётся другому (GET)'''
+        self.client.get(reverse('api:habit-list'))
+        client2 = APIClient()
+        client2.login(username=self.username2, password=self.password2)
+
+        response = client2.get(reverse('api:habit-list'))
+
+        self.assertEqual(response.data['results'], [])
+
+    def test_api_evicted_generation_does_not_restore_stale_responses(self):
+        '''Проверка, что после вытеснения ключа поколения из кэша не отдаются ответы, сохранённые до сброса кэша (GET)'''
+        cache.delete(get_generation_key(self.user1.pk))
+        self.client.get(self.url)
+        Habit.objects.filter(pk=self.habit_daily.pk).update(title='Renamed habit')
+        invalidate_user_responses(self.user1.pk)
+
+        cache.delete(get_generation_key(self.user1.pk))
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data['title'], 'Renamed habit')
+
+
+class HabitFastSerializationAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_fast_serialization'
+        self.password1 = 'api_fast_serialization1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'Привычка каждый день', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 2)
+        for habit in (self.habit_daily, self.habit_weekly):
+            create_habit_log(habit, 'Лог позавчера', HABIT_LOG_STATUS_COMPLITED, days_before=2)
+            create_habit_log(habit, 'Log 9 days ago', HABIT_LOG_STATUS_INCOMPLITED, days_before=9)
+            sync_habit_period_counters(habit)
+
+    @override_settings(HABITS_STORE_FORGOT_TO_MARK_LOGS=False)
+    def test_fast_serialization_matches_drf_serializers(self):
+        '''Проверка, что быстрая сериализация логов и недель совпадает с сериализаторами DRF, включая достроенные логи forgot_to_mark'''
+        habit_logs = list(fill_habit_log_gaps(HabitLog.objects.for_habit(self.habit_weekly).values('id', 'date', 'status', 'comment')))
+        week = {**get_habit_week_summaries(self.habit_weekly, HabitLog.objects.for_habit(self.habit_weekly))[0], 'logs': habit_logs[:3]}
+
+        self.assertEqual(HabitLogSerializer.serialize_rows(habit_logs), HabitLogSerializer(habit_logs, many=True).data)
+        self.assertEqual(JSONRenderer().render(HabitWeekSerializer.serialize(week)), JSONRenderer().render(HabitWeekSerializer(week).data))
+
+    def test_fast_json_renderer_output_matches_json_renderer(self):
+        '''Проверка, что ответы API, закодированные FastJSONRenderer, побайтно совпадают с JSONRenderer (GET)'''
+        for url in (
+            reverse('api:habit-list'),
+            reverse('api:habit-detail', args=(self.habit_daily.id, )),
+            reverse('api:habit-detail', args=(self.habit_weekly.id, )),
+            reverse('api:habit-details', query={'ids': 'all'}),
+            reverse('api:sync'),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+
+                self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_fast_json_renderer_falls_back_to_json_renderer(self):
+        '''Проверка, что данные, которые orjson не кодирует (нестроковые ключи), и запрошенный отступ кодирует JSONRenderer'''
+        data = {1: [timezone.now(), Decimal('1.50')]}
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4')
+        )
+
+
+class HabitCompactHistoryAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_compact'
+        self.password1 = 'api_compact1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 2)
+        for habit in (self.habit_daily, self.habit_weekly):
+            create_habit_log(habit, 'Log 2 days ago', HABIT_LOG_STATUS_INCOMPLITED, days_before=2)
+            create_habit_log(habit, 'Log 13 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=13)
+            sync_habit_period_counters(habit)
+        self.compact_media_type = 'application/vnd.habit-tracker.compact+json'
+
+    def unpack_habit_history(self, history):
+        '''Логи (status, comment) по дням из компактной истории - в том порядке, в каком их отдаёт pack_habit_history'''
+        statuses = b64decode(history['statuses'])
+        comments = dict(history['comments'])
+        habit_log_statuses = [status for status, _ in HABIT_LOG_STATUS]
+        habit_logs = []
+        for offset in range(history['days']):
+            status = habit_log_statuses[(statuses[offset // 4] >> 2 * (offset % 4)) & 3]
+            default_comment = HABIT_LOG_FORGOT_TO_MARK_COMMENT if status == HABIT_LOG_STATUS_FORGOT_TO_MARK else ''
+            habit_logs.append({'status': status, 'comment': comments.get(offset, default_comment)})
+        return habit_logs
+
+    @override_settings(HABITS_STORE_FORGOT_TO_MARK_LOGS=False)
+    def test_api_compact_daily_history_matches_json(self):
+        '''Проверка, что компактная история ежедневной привычки содержит те же логи, что и обычный ответ, включая достроенные forgot_to_mark (GET)'''
+        url = reverse('api:habit-detail', args=(self.habit_daily.id, ))
+        response = self.client.get(url)
+        compact_response = self.client.get(url, HTTP_ACCEPT=self.compact_media_type)
+
+        history = compact_response.data['habit_logs']
+        self.assertEqual(compact_response['Content-Type'], self.compact_media_type)
+        self.assertEqual(history['start'], str(get_local_now_date() - timedelta(days=13)))
+        self.assertEqual(history['days'], 12)
+        self.assertEqual(history['comments'], [[0, 'Log 13 days ago'], [11, 'Log 2 days ago']])
+        self.assertEqual(
+            self.unpack_habit_history(history),
+            [{'status': habit_log['status'], 'comment': habit_log['comment']} for habit_log in reversed(response.data['habit_logs'])]
+        )
+
+    def test_api_compact_weekly_history_matches_json(self):
+        '''Проверка, что компактная история еженедельной привычки содержит те же логи и итоги недель, что и обычный ответ (GET)'''
+        url = reverse('api:habit-detail', args=(self.habit_weekly.id, ))
+        response = self.client.get(url)
+        compact_response = self.client.get(url, {'format': 'compact'})
+
+        self.assertEqual(compact_response.data['weeks'], response.data['weeks'])
+        self.assertEqual(
+            self.unpack_habit_history(compact_response.data['habit_logs']),
+            [{'status': habit_log['status'], 'comment': habit_log['comment']} for week in response.data['habit_logs'] for habit_log in week]
+        )
+
+    def test_api_compact_history_pages(self):
+        '''Проверка, что страницы истории в компактном формате склеиваются в ту же историю, что и в обычном ответе (GET)'''
+        url = reverse('api:habit-logs', args=(self.habit_daily.id, ))
+        response = self.client.get(url)
+        first_page = self.client.get(url, {'page_size': 6}, HTTP_ACCEPT=self.compact_media_type)
+        second_page = self.client.get(first_page.data['next'], HTTP_ACCEPT=self.compact_media_type)
+
+        self.assertEqual(second_page.data['next'], None)
+        self.assertEqual(
+            self.unpack_habit_history(second_page.data['results']) + self.unpack_habit_history(first_page.data['results']),
+            [{'status': habit_log['status'], 'comment': habit_log['comment']} for habit_log in reversed(response.data['results'])]
+        )
+
+    def test_api_compact_and_json_responses_are_cached_separately(self):
+        '''Проверка, что ответы в обычном и компактном формате по одному адресу не подменяют друг друга в кэше и имеют разные ETag (GET)'''
+        url = reverse('api:habit-detail', args=(self.habit_daily.id, ))
+        response = self.client.get(url)
+        compact_response = self.client.get(url, HTTP_ACCEPT=self.compact_media_type)
+        not_modified_response = self.client.get(url, HTTP_ACCEPT=self.compact_media_type, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertIsInstance(response.data['habit_logs'], list)
+        self.assertIsInstance(compact_response.data['habit_logs'], dict)
+        self.assertNotEqual(compact_response['ETag'], response['ETag'])
+        self.assertEqual(not_modified_response.status_code, status.HTTP_200_OK)
+        self.assertIn('Accept', compact_response['Vary'])
+
+
+class HabitExportAPITests(APITestCase):
+    def setUp(self):
+        self.username1 = 'admin_api_export'
+        self.password1 = 'api_export1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.user2 = create_user('admin2_api_export', 'api_export5678')
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'Привычка, каждый день', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 2)
+        other_habit = create_habit(self.user2, 'other habit', 'other purpose', 'daily')
+        for habit in (self.habit_daily, self.habit_weekly, other_habit):
+            create_habit_log(habit, 'Log 1 day ago', HABIT_LOG_STATUS_COMPLITED, days_before=1)
+            create_habit_log(habit, 'Log 4 days ago', HABIT_LOG_STATUS_INCOMPLITED, days_before=4)
+
+    def get_content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(HABITS_STORE_FORGOT_TO_MARK_LOGS=False)
+    def test_api_export_ndjson(self):
+        '''Проверка, что NDJSON-выгрузка содержит все привычки пользователя и их логи, включая достроенные forgot_to_mark (GET)'''
+        response = self.client.get(reverse('api:export'))
+        records = [json.loads(line) for line in self.get_content(response).splitlines()]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([record['id'] for record in records if record['type'] == 'habit'], [self.habit_daily.id, self.habit_weekly.id])
+        self.assertEqual(records[0]['title'], 'Привычка, каждый день')
+        habit_logs = [record for record in records if record['type'] == 'habit_log']
+        self.assertEqual([habit_log['habit'] for habit_log in habit_logs], [self.habit_daily.id] * 4 + [self.habit_weekly.id] * 4)
+        self.assertEqual(
+            [(habit_log['date'], habit_log['status']) for habit_log in habit_logs[:4]],
+            [
+                (str(get_local_now_date() - timedelta(days=4)), HABIT_LOG_STATUS_INCOMPLITED),
+                (str(get_local_now_date() - timedelta(days=3)), HABIT_LOG_STATUS_FORGOT_TO_MARK),
+                (str(get_local_now_date() - timedelta(days=2)), HABIT_LOG_STATUS_FORGOT_TO_MARK),
+                (str(get_local_now_date() - timedelta(days=1)), HABIT_LOG_STATUS_COMPLITED),
+            ]
+        )
+        self.assertIsNone(habit_logs[1]['id'])
+
+    def test_api_export_csv(self):
+        '''Проверка CSV-выгрузки логов привычек пользователя (GET)'''
+        response = self.client.get(reverse('api:export'), {'export_format': 'csv'})
+        rows = list(csv.reader(io.StringIO(self.get_content(response))))
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(rows[0], ['habit_id', 'habit_title', 'date', 'status', 'comment'])
+        self.assertEqual(len(rows), 1 + 2 * 4) # заголовок и 4 дня истории каждой из двух привычек
+        self.assertEqual(rows[1], [str(self.habit_daily.id), 'Привычка, каждый день', str(get_local_now_date() - timedelta(days=4)), HABIT_LOG_STATUS_INCOMPLITED, 'Log 4 days ago'])
+
+    def test_api_export_reads_logs_with_one_query(self):
+        '''Проверка, что выгрузка читает все логи одним запросом независимо от их кол-ва (GET)'''
+        with self.assertNumQueries(4): # сессия, пользователь, привычки, логи
+            self.get_content(self.client.get(reverse('api:export')))
+
+    def test_api_export_skips_habits_created_after_habits_are_read(self):
+        '''Проверка, что привычка, созданная между чтением привычек и логов, не попадает в выгрузку и не обрывает её (GET)'''
+        created = []
+        def execute(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not created and f'FROM "{Habit._meta.db_table}" ' in sql:
+                created.append(True)
+                create_habit_log(create_habit(self.user1, 'new habit', 'new purpose', 'daily'), 'Log 1 day ago', HABIT_LOG_STATUS_COMPLITED, days_before=1)
+            return result
+        with connection.execute_wrapper(execute):
+            response = self.client.get(reverse('api:export'), {'export_format': 'csv'})
+            rows = list(csv.reader(io.StringIO(self.get_content(response))))
+
+        self.assertTrue(created)
+        self.assertEqual({row[0] for row in rows[1:]}, {str(self.habit_daily.id), str(self.habit_weekly.id)})
+
+    def test_api_export_wrong_format(self):
+        '''Проверка, что неизвестный формат выгрузки отклоняется (GET)'''
+        response = self.client.get(reverse('api:export'), {'export_format': 'xml'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HabitImportAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_import'
+        self.password1 = 'api_import1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+        self.today = get_local_now_date()
+
+    def import_file(self, lines, import_format='ndjson'):
+        content = '\n'.join(json.dumps(line, default=str) if isinstance(line, dict) else line for line in lines).encode()
+        upload = SimpleUploadedFile(f'habits.{import_format}', content)
+        return self.client.post(reverse('api:import') + f'?import_format={import_format}', {'file': upload}, format='multipart')
+
+    def test_api_import_ndjson(self):
+        '''Проверка импорта привычек и истории с явными датами: пропущенные дни заполняются, streak считается один раз по всей истории (POST)'''
+        response = self.import_file([
+            {'type': 'habit', 'id': 7, 'title': 'Imported habit', 'purpose': 'import', 'datetype': 'daily', 'frequency': 1},
+            *({'type': 'habit_log', 'habit': 7, 'date': self.today - timedelta(days=days_before), 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Done'} for days_before in (1, 2, 3)),
+            {'type': 'habit_log', 'habit': 7, 'date': self.today - timedelta(days=6), 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Old'},
+        ])
+        habit = Habit.objects.get(user=self.user1)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'habits': 1, 'habit_logs': 4})
+        self.assertEqual(habit.title, 'Imported habit')
+        self.assertEqual(habit.streak, 3)
+        self.assertEqual(habit.last_log_date, self.today - timedelta(days=1))
+        self.assertEqual(
+            list(HabitLog.objects.for_habit(habit).order_by('date').values_list('status', flat=True)),
+            [HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_STATUS_FORGOT_TO_MARK, *[HABIT_LOG_STATUS_COMPLITED] * 3]
+        )
+
+    def test_api_import_round_trip_of_export(self):
+        '''Проверка, что выгрузка /api/export/ импортируется обратно копией привычек с той же историей (GET, POST)'''
+        habit = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 2)
+        for days_before in range(1, 10):
+            create_habit_log(habit, f'Log {days_before}', HABIT_LOG_STATUS_COMPLITED if days_before % 3 else HABIT_LOG_STATUS_INCOMPLITED, days_before=days_before)
+        rebuild_habit_streak(habit)
+        export = b''.join(self.client.get(reverse('api:export')).streaming_content).decode().splitlines()
+
+        response = self.import_file(export)
+        imported_habit = Habit.objects.exclude(pk=habit.pk).get(user=self.user1)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((imported_habit.datetype, imported_habit.frequency, imported_habit.streak), (habit.datetype, habit.frequency, habit.streak))
+        self.assertEqual(
+            list(HabitLog.objects.for_habit(imported_habit).values_list('date', 'status', 'comment')),
+            list(HabitLog.objects.for_habit(habit).values_list('date', 'status', 'comment'))
+        )
+
+    def test_api_import_csv_into_existing_habit(self):
+        '''Проверка импорта CSV с логами существующей привычки и сброса кэша ответов (POST)'''
+        habit = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.client.get(reverse('api:habit-detail', args=(habit.id, )))
+
+        response = self.import_file([
+            'habit_id,habit_title,date,status,comment',
+            f'{habit.id},any title,{self.today - timedelta(days=2)},{HABIT_LOG_STATUS_INCOMPLITED},"Comment, with comma"',
+            f'{habit.id},any title,{self.today - timedelta(days=1)},{HABIT_LOG_STATUS_COMPLITED},Done',
+        ], import_format='csv')
+        detail_response = self.client.get(reverse('api:habit-detail', args=(habit.id, )))
+
+        self.assertEqual(response.data, {'habits': 0, 'habit_logs': 2})
+        self.assertEqual([habit_log['comment'] for habit_log in detail_response.data['habit_logs']], ['Done', 'Comment, with comma'])
+        self.assertEqual(detail_response.data['streak'], 1)
+
+    def test_api_import_error_rolls_back(self):
+        '''Проверка, что ошибка в любой строке отменяет весь импорт, а в ответе - номер строки (POST)'''
+        other_habit = create_habit(create_user('admin2_api_import', 'api_import5678'), 'other habit', 'other purpose', 'daily')
+        # ссылка на привычку в файле не должна совпасть с id чужой привычки - ссылки из файла важнее id существующих привычек
+        habit_line = {'type': 'habit', 'id': other_habit.id + 1, 'title': 'Imported habit', 'purpose': 'import', 'datetype': 'daily', 'frequency': 1}
+        habit_log_line = {'type': 'habit_log', 'habit': other_habit.id + 1, 'date': self.today - timedelta(days=1), 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Done'}
+
+        future_response = self.import_file([habit_line, habit_log_line, {**habit_log_line, 'date': self.today + timedelta(days=1)}])
+        other_user_response = self.import_file([habit_line, habit_log_line, {**habit_log_line, 'habit': other_habit.id}])
+        invalid_json_response = self.import_file([habit_line, '{"type":'])
+
+        self.assertEqual(future_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(future_response.data['line'], 3)
+        self.assertIn('date', future_response.data['errors'])
+        self.assertEqual(other_user_response.data['line'], 3)
+        self.assertIn('habit', other_user_response.data['errors'])
+        self.assertEqual(invalid_json_response.data['line'], 2)
+        self.assertFalse(Habit.objects.filter(user=self.user1).exists())
+
+    def test_api_import_log_without_date(self):
+        '''Проверка, что лог без даты отклоняется с номером строки и ошибкой поля date, а не падает (POST)'''
+        response = self.import_file([
+            {'type': 'habit', 'id': 1, 'title': 'Imported habit', 'purpose': 'import', 'datetype': 'daily', 'frequency': 1},
+            {'type': 'habit_log', 'habit': 1, 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Done'},
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['line'], 2)
+        self.assertIn('date', response.data['errors'])
+        self.assertFalse(Habit.objects.filter(user=self.user1).exists())
+
+    def test_api_import_habit_without_datetype(self):
+        '''Проверка, что привычка без datetype импортируется с типом по умолчанию (еженедельная) (POST)'''
+        response = self.import_file([
+            {'type': 'habit', 'id': 1, 'title': 'Imported habit', 'purpose': 'import', 'frequency': 3},
+            {'type': 'habit_log', 'habit': 1, 'date': self.today - timedelta(days=1), 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Done'},
+        ])
+        habit = Habit.objects.get(user=self.user1)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((habit.datetype, habit.frequency), ('weekly', 3))
+
+
+class HabitBatchCheckInAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_checkins'
+        self.password1 = 'api_checkins1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+        self.url = reverse('api:checkins')
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        self.habit_weekly = create_habit(self.user1, 'api habit weekly', 'api habit purp', 'weekly', 2)
+        for habit in (self.habit_daily, self.habit_weekly):
+            create_habit_log(habit, 'Log 3 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=3)
+            sync_habit_period_counters(habit)
+
+    def check_in_data(self, habit, comment='Log today', status=HABIT_LOG_STATUS_COMPLITED):
+        return {'habit_id': habit.id, 'status': status, 'comment': comment}
+
+    def test_api_batch_check_in(self):
+        '''Проверка, что batch check-in создаёт логи за сегодня, заполняет пропущенные дни и обновляет счётчики каждой привычки (POST)'''
+        response = self.client.post(self.url, [self.check_in_data(self.habit_daily), self.check_in_data(self.habit_weekly, status=HABIT_LOG_STATUS_INCOMPLITED)], format='json')
+        self.habit_daily.refresh_from_db()
+        self.habit_weekly.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['status_code'] for result in response.data['results']], [status.HTTP_201_CREATED] * 2)
+        self.assertEqual(response.data['results'][0]['habit_log']['id'], HabitLog.objects.for_habit(self.habit_daily).get(date=get_local_now_date()).id)
+        self.assertEqual(self.habit_daily.last_log_date, get_local_now_date())
+        self.assertEqual(self.habit_daily.streak, 1)
+        self.assertEqual(self.habit_weekly.last_log_date, get_local_now_date())
+        self.assertEqual(
+            list(HabitLog.objects.for_habit(self.habit_daily).values_list('status', flat=True)),
+            [HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_STATUS_COMPLITED]
+        )
+
+    def test_api_batch_check_in_per_item_errors(self):
+        '''Проверка, что чужая привычка, повтор привычки и уже отмеченная привычка не мешают check-in остальных (POST)'''
+        other_habit = create_habit(create_user('admin2_api_checkins', 'api_checkins5678'), 'other habit', 'other purpose', 'daily')
+        self.client.post(reverse('api:api_create_habit_log', args=(self.habit_weekly.id, )), data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED))
+
+        response = self.client.post(self.url, [
+            self.check_in_data(other_habit),
+            self.check_in_data(self.habit_daily),
+            self.check_in_data(self.habit_daily, comment='Second log'),
+            self.check_in_data(self.habit_weekly),
+        ], format='json')
+
+        self.assertEqual(
+            [(result['habit_id'], result['status_code']) for result in response.data['results']],
+            [
+                (other_habit.id, status.HTTP_404_NOT_FOUND),
+                (self.habit_daily.id, status.HTTP_201_CREATED),
+                (self.habit_daily.id, status.HTTP_400_BAD_REQUEST),
+                (self.habit_weekly.id, status.HTTP_400_BAD_REQUEST),
+            ]
+        )
+        self.assertEqual(HabitLog.objects.filter(habit=other_habit).count(), 0)
+        self.assertEqual(HabitLog.objects.for_habit(self.habit_daily).get(date=get_local_now_date()).comment, 'Log today')
+
+    def test_api_batch_check_in_query_budget_does_not_depend_on_habits_count(self):
+        '''Проверка, что кол-во запросов batch check-in не зависит от кол-ва привычек (POST)'''
+        habits = [create_habit(self.user1, f'api habit {i}', 'api habit purpose', 'daily') for i in range(5)]
+        for habit in habits:
+            create_habit_log(habit, 'Log 3 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=3)
+            sync_habit_period_counters(habit)
+
+        # сессия, пользователь, блокировка привычек, пропущенные дни, новые логи, счётчики привычек
+        with self.assertNumQueries(6):
+            self.client.post(self.url, [self.check_in_data(self.habit_daily)], format='json')
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, [self.check_in_data(habit) for habit in habits], format='json')
+
+        self.assertEqual([result['status_code'] for result in response.data['results']], [status.HTTP_201_CREATED] * len(habits))
+
+    def test_api_batch_check_in_validation(self):
+        '''Проверка, что пустой список и неверный статус отклоняются целиком (POST)'''
+        empty_response = self.client.post(self.url, [], format='json')
+        wrong_status_response = self.client.post(self.url, [self.check_in_data(self.habit_daily), self.check_in_data(self.habit_weekly, status='done')], format='json')
+
+        self.assertEqual(empty_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(wrong_status_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(HabitLog.objects.filter(date=get_local_now_date()).exists())
+
+
+class HabitAsyncCheckInAPITests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.username1 = 'admin_api_async_checkins'
+        self.password1 = 'api_async_checkins1234'
+
+        self.user1 = create_user(self.username1, self.password1)
+        self.client = APIClient()
+        self.client.login(username=self.username1, password=self.password1)
+
+        self.habit_daily = create_habit(self.user1, 'api habit every day', 'api habit purpose', 'daily')
+        create_habit_log(self.habit_daily, 'Log 3 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=3)
+        sync_habit_period_counters(self.habit_daily)
+        self.url = reverse('api:api_create_habit_log', args=(self.habit_daily.id, ))
+
+    def test_api_async_check_in_is_processed_by_worker(self):
+        '''Проверка, что check-in с Prefer: respond-async ставится в очередь (202 и ссылка на статус), а лог и streak появляются после обработки очереди (POST)'''
+        response = self.client.post(self.url, data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED), headers={'Prefer': 'respond-async'})
+        pending_response = self.client.get(response.data['status_url'])
+        self.habit_daily.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.assertEqual(pending_response.data['state'], 'pending')
+        self.assertFalse(HabitLog.objects.for_habit(self.habit_daily).filter(date=get_local_now_date()).exists())
+        self.assertNotEqual(self.habit_daily.last_log_date, get_local_now_date())
+
+        self.assertEqual(process_check_in_queue(), 1)
+        done_response = self.client.get(response.data['status_url'])
+        self.habit_daily.refresh_from_db()
+
+        habit_log = HabitLog.objects.for_habit(self.habit_daily).get(date=get_local_now_date())
+        self.assertEqual(done_response.data['state'], 'done')
+        self.assertEqual(done_response.data['habit_log_id'], habit_log.id)
+        self.assertEqual(habit_log.comment, 'Log today')
+        self.assertEqual(self.habit_daily.last_log_date, get_local_now_date())
+        self.assertEqual(self.habit_daily.streak, 1)
+        self.assertEqual(HabitLog.objects.for_habit(self.habit_daily).filter(status=HABIT_LOG_STATUS_FORGOT_TO_MARK).count(), 2)
+
+    @override_settings(HABITS_ASYNC_CHECK_IN=True)
+    def test_api_async_check_in_setting_and_duplicate(self):
+        '''Проверка асинхронного режима из настроек: второй check-in за тот же день принимается, но после обработки завершается ошибкой (POST)'''
+        first_response = self.client.post(self.url, data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED))
+        second_response = self.client.post(self.url, data=generate_habit_log_data('Second log', HABIT_LOG_STATUS_INCOMPLITED))
+        process_check_in_queue()
+
+        self.assertEqual((first_response.status_code, second_response.status_code), (status.HTTP_202_ACCEPTED, status.HTTP_202_ACCEPTED))
+        self.assertEqual(self.client.get(first_response.data['status_url']).data['state'], 'done')
+        second_status = self.client.get(second_response.data['status_url']).data
+        self.assertEqual(second_status['state'], 'failed')
+        self.assertIsNone(second_status['habit_log_id'])
+        self.assertEqual(HabitLog.objects.for_habit(self.habit_daily).get(date=get_local_now_date()).comment, 'Log today')
+
+    def test_api_async_check_in_idempotency_key_replays_accepted_response(self):
+        '''Проверка, что повтор асинхронного check-in с тем же Idempotency-Key возвращает тот же ответ 202 и не ставит запрос в очередь второй раз (POST)'''
+        headers = {'Prefer': 'respond-async', 'Idempotency-Key': 'async-check-in'}
+        first_response = self.client.post(self.url, data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED), headers=headers)
+        replayed_response = self.client.post(self.url, data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED), headers=headers)
+
+        self.assertEqual(replayed_response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(replayed_response.data['id'], first_response.data['id'])
+        self.assertEqual(HabitCheckInRequest.objects.count(), 1)
+
+    def test_api_check_in_status_only_owner_access(self):
+        '''Проверка, что статус асинхронного check-in доступен только его автору (GET)'''
+        response = self.client.post(self.url, data=generate_habit_log_data('Log today', HABIT_LOG_STATUS_COMPLITED), headers={'Prefer': 'respond-async'})
+        create_user('admin2_api_async_checkins', 'api_async_checkins5678')
+        other_client = APIClient()
+        other_client.login(username='admin2_api_async_checkins', password='api_async_checkins5678')
+
+        self.assertEqual(other_client.get(response.data['status_url']).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('api:check-in-status', args=(response.data['id'] + 1, ))).status_code, status.HTTP_404_NOT_FOUND)
@@ -3,7 +3,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
-from .views import HabitsViewSet, create_habit_log
+from .views import HabitsViewSet, create_habit_log, create_habit_logs, habit_check_in_status, sync_habits, export_habits, import_habits
 
 router = DefaultRouter()
 router.register(r'habits', HabitsViewSet, basename='habit')
@@ -12,6 +12,11 @@ app_name = 'api'
 urlpatterns = [
     path('', include(router.urls)),
     path('habits/<int:pk>/create_habit_log/', create_habit_log, name='api_create_habit_log'),
+    path('checkins/', create_habit_logs, name='checkins'),
+    path('checkins/<int:pk>/', habit_check_in_status, name='check-in-status'),
+    path('sync/', sync_habits, name='sync'),
+    path('export/', export_habits, name='export'),
+    path('import/', import_habits, name='import'),
 
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('swagger/', SpectacularSwaggerView.as_view(url_name='api:schema'), name='swagger-ui'),
@@ -1,40 +1,448 @@
+import codecs
+from collections import defaultdict
+from datetime import datetime, time
+from hashlib import md5
+from itertools import chain
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
 from rest_framework.viewsets import ModelViewSet
-from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework import serializers, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BrowsableAPIRenderer
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, inline_serializer, OpenApiParameter
 
-from .serializers import HabitSerializer, HabitLogSerializer
-from ..models import Habit
+from .parsers import read_habit_import
+from .renderers import FastJSONRenderer, CompactHistoryJSONRenderer, stream_csv, stream_ndjson
+from .pagination import HabitHistoryCursorPagination, HabitListCursorPagination, HabitSyncCursor
+from .serializers import HabitSerializer, HabitLogSerializer, HabitWeekSerializer, HabitLogsDateRangeSerializer, HabitFieldsQuerySerializer, HabitIdsQuerySerializer, HabitSyncSerializer, HabitLogSyncSerializer, HabitExportQuerySerializer, HabitImportQuerySerializer, HabitImportFileSerializer, HabitCheckInSerializer, HabitCheckInRequestSerializer
+from ..cache import get_response_cache_key, get_cached_response, set_cached_response
+from ..models import Habit, HabitLog, HabitLogIdempotencyKey, HabitCheckInRequest, get_local_now_date
+from ..services import check_in_habits, import_habit_history, HabitAlreadyCheckedIn, HabitImportError, HABIT_TOMBSTONE_RETENTION
+from ..helpers import get_habit_history_from_logs, get_habit_changes, get_habit_export, get_sync_cursor_time, pack_habit_history
 
 class HabitsViewSet(ModelViewSet):
     queryset = Habit.objects.all()
     serializer_class = HabitSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, CompactHistoryJSONRenderer, BrowsableAPIRenderer]
+    LIST_FIELDS = ('id', 'title', 'purpose', 'datetype', 'frequency', 'streak')
+    details_last_n_weeks = 4
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    @extend_schema(
+        parameters=[
+            HabitFieldsQuerySerializer,
+            HabitLogsDateRangeSerializer,
+            OpenApiParameter('cursor', OpenApiTypes.STR, description='Opaque cursor from the next link.'),
+            OpenApiParameter('page_size', OpenApiTypes.INT, description='Number of habits per page.'),
+        ],
+        # список отдаётся страницей, а не массивом, поэтому operation_id задан явно - иначе он совпал бы с retrieve (habits_retrieve)
+        operation_id='habits_list',
+        responses=inline_serializer('HabitListPage', {
+            'next': serializers.URLField(allow_null=True, help_text='Link to the next page or null on the last page.'),
+            'results': HabitSerializer(many=True),
+        }),
+    )
     def list(self, request):
-        serializer = self.get_serializer(self.get_queryset(), many=True, fields=('id', 'title', 'purpose', 'datetype', 'frequency', 'streak'))
-        return Response(serializer.data)
+        '''
+            Привычки пользователя по страницам от новых к старым (см. HabitListCursorPagination).
+            История привычек (?expand=habit_logs) собирается так же, как в details: логи всей страницы читаются одним запросом
+        '''
+        return self.get_cached_response(self.get_list_response)
+
+    def get_list_response(self):
+        list_state = self.get_queryset().aggregate(updated_at=Max('updated_at'), count=Count('id'))
+        # удаление привычки не меняет max(updated_at), поэтому у списка нет Last-Modified - только ETag, в который входит и кол-во привычек
+        validators = self.get_validators(list_state['updated_at'], self.request.user.pk, list_state['count'], send_last_modified=False)
+        not_modified_response = self.get_not_modified_response(*validators)
+        if not_modified_response is not None:
+            return not_modified_response, validators
+        # состав полей нужен до выборки страницы: для истории к привычкам добавляются даты их первого и последнего лога
+        serializer = self.get_habit_serializer(None, many=True, default_fields=self.LIST_FIELDS)
+        habits = self.get_queryset()
+        if self.is_history_requested(serializer):
+            habits = self.annotate_habit_logs_bounds(habits)
+        page, next_link = HabitListCursorPagination().paginate_habits(habits, self.request)
+        serializer.instance = page
+        if self.is_history_requested(serializer):
+            serializer.context['habit_history_pages'] = self.get_habit_history_pages(page, serializer.context['habit_logs_date_range'])
+        return self.set_validators(Response({'next': next_link, 'results': serializer.data}), *validators), validators
     
+    @extend_schema(parameters=[HabitFieldsQuerySerializer, HabitLogsDateRangeSerializer])
     def retrieve(self, request, pk):
+        return self.get_cached_response(self.get_retrieve_response)
+
+    def get_retrieve_response(self):
         habit = self.get_object()
-        serializer = self.get_serializer(habit, context={'habit': habit})
+        validators = self.get_validators(habit.updated_at, habit.pk, habit.schedule_epoch, habit.last_log_date)
+        not_modified_response = self.get_not_modified_response(*validators)
+        if not_modified_response is not None:
+            return not_modified_response, validators
+        serializer = self.get_habit_serializer(habit, default_expand=('habit_logs', ))
+        return self.set_validators(Response(serializer.data), *validators), validators
+
+    def get_cached_response(self, build_response):
+        '''
+            Ответ из кэша ответов пользователя (см. habits/cache.py) - без запросов к привычкам и логам,
+            или ответ build_response(), который сохраняется в кэш вместе с его ETag и Last-Modified
+        '''
+        key = get_response_cache_key(self.request)
+        cached = get_cached_response(key)
+        if cached is not None:
+            data, *validators = cached
+            not_modified_response = self.get_not_modified_response(*validators)
+            if not_modified_response is not None:
+                return not_modified_response
+            return self.set_validators(Response(data), *validators)
+        response, validators = build_response()
+        if response.status_code == status.HTTP_200_OK:
+            set_cached_response(key, response.data, *validators)
+        return response
+
+    def get_validators(self, updated_at, *state, send_last_modified=True):
+        '''
+            ETag и Last-Modified ресурса по времени его последнего изменения (Habit.updated_at обновляется при любом изменении привычки и её логов)
+            и его состоянию state. Ответ зависит и от query-параметров, формата (Accept) и текущей даты (last_n_weeks), поэтому они тоже входят в ETag.
+            С наступлением нового дня меняется и сам ответ (last_n_weeks, достроенные при чтении дни forgot_to_mark), поэтому Last-Modified - не раньше начала текущего дня
+        '''
+        today = get_local_now_date()
+        version = ':'.join(str(part) for part in (
+            updated_at and updated_at.isoformat(), *state, today, self.request.get_full_path(), self.request.accepted_media_type
+        ))
+        etag = quote_etag(md5(version.encode(), usedforsecurity=False).hexdigest())
+        if not send_last_modified or updated_at is None:
+            return etag, None
+        start_of_today = timezone.make_aware(datetime.combine(today, time.min))
+        return etag, int(max(updated_at, start_of_today).timestamp())
+
+    def get_not_modified_response(self, etag, last_modified):
+        '''Условный GET: 304 Not Modified, если версия ресурса у клиента актуальна. Проверяется до чтения логов и сериализации'''
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        return response if response is None else self.set_validators(response, etag, last_modified)
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    @extend_schema(
+        parameters=[
+            HabitLogsDateRangeSerializer,
+            OpenApiParameter('cursor', OpenApiTypes.STR, description='Opaque cursor from the next link.'),
+            OpenApiParameter('page_size', OpenApiTypes.INT, description='Number of logs (weeks for a weekly habit) per page.'),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=True, methods=['get'])
+    def logs(self, request, pk):
+        '''История привычки по страницам от новых логов к старым: у еженедельной привычки - целыми неделями'''
+        habit = self.get_object()
+        if self.is_compact_history():
+            page, next_link = HabitHistoryCursorPagination().paginate_habit_history(habit, request, date_range=self.get_habit_logs_date_range(habit))
+            response_data = {'next': next_link, 'results': pack_habit_history(HabitSerializer.get_history_page_logs(habit, page))}
+            if habit.datetype == 'weekly':
+                response_data['weeks'] = [HabitWeekSerializer.serialize_summary(week) for week in page]
+            return Response(response_data)
+        page, next_link = HabitHistoryCursorPagination().paginate_habit_history(
+            habit, request, date_range=self.get_habit_logs_date_range(habit), serialize_week=HabitWeekSerializer.serialize
+        )
+        if habit.datetype == 'weekly':
+            results = page
+        else:
+            results = HabitLogSerializer.serialize_rows(page)
+        return Response({'next': next_link, 'results': results})
+
+    @extend_schema(parameters=[HabitIdsQuerySerializer, HabitFieldsQuerySerializer, HabitLogsDateRangeSerializer])
+    @action(detail=False, methods=['get'])
+    def details(self, request):
+        '''
+            Детальная информация о нескольких привычках (?ids=1,2,3 или ?ids=all) за один запрос.
+            Логи всех привычек читаются одним запросом (словарями из .values()) в пределах диапазона дат, по умолчанию - последних details_last_n_weeks недель,
+            и раскладываются по привычкам и неделям в памяти, поэтому кол-во запросов не зависит от кол-ва привычек.
+        '''
+        ids_serializer = HabitIdsQuerySerializer(data=request.query_params)
+        ids_serializer.is_valid(raise_exception=True)
+        habits = self.get_queryset()
+        if ids_serializer.validated_data['ids'] is not None:
+            habits = habits.filter(id__in=ids_serializer.validated_data['ids'])
+        habits = list(self.annotate_habit_logs_bounds(habits))
+        serializer = self.get_habit_serializer(habits, many=True, default_expand=('habit_logs', ))
+        if self.is_history_requested(serializer):
+            serializer.context['habit_history_pages'] = self.get_habit_history_pages(habits, serializer.context['habit_logs_date_range'])
         return Response(serializer.data)
+
+    @staticmethod
+    def is_history_requested(serializer):
+        return bool(set(HabitSerializer.EXPANDABLE_FIELDS['habit_logs']) & set(serializer.child.fields))
+
+    @staticmethod
+    def annotate_habit_logs_bounds(habits):
+        '''Даты первого и последнего лога текущего расписания каждой привычки - в том же запросе, что и привычки (см. get_habit_history_pages)'''
+        current_habit_logs = HabitLog.objects.filter(habit=OuterRef('pk'), epoch=OuterRef('schedule_epoch')).values('date')
+        return habits.annotate(
+            first_log_date=Subquery(current_habit_logs.order_by('date')[:1]),
+            last_stored_log_date=Subquery(current_habit_logs.order_by('-date')[:1]),
+        )
+
+    def get_habit_history_pages(self, habits, date_range_serializer):
+        '''История каждой из привычек в виде страницы без ссылки на следующую (см. HabitSerializer.get_history_page) по логам, прочитанным одним запросом'''
+        if not date_range_serializer.validated_data:
+            date_range_serializer = HabitLogsDateRangeSerializer(data={'last_n_weeks': self.details_last_n_weeks})
+            date_range_serializer.is_valid(raise_exception=True)
+        date_ranges = {habit.pk: date_range_serializer.get_date_range(habit) for habit in habits}
+        # одна выборка на все привычки - по самому широкому из диапазонов, лишнее отсекается для каждой привычки в памяти
+        habit_logs = HabitLog.objects.filter(epoch=F('habit__schedule_epoch')).order_by('date')
+        if date_ranges and None not in (date_from for date_from, _ in date_ranges.values()):
+            habit_logs = habit_logs.filter(date__gte=min(date_from for date_from, _ in date_ranges.values()))
+        if date_ranges and None not in (date_to for _, date_to in date_ranges.values()):
+            habit_logs = habit_logs.filter(date__lte=max(date_to for _, date_to in date_ranges.values()))
+        # логи читаются словарями из .values(), без создания объектов HabitLog, и раскладываются по привычкам в памяти
+        habit_logs_by_habit = defaultdict(list)
+        for habit_log in habit_logs.filter(habit__in=[habit.pk for habit in habits]).values('habit_id', 'id', 'date', 'status', 'comment'):
+            habit_logs_by_habit[habit_log.pop('habit_id')].append(habit_log)
+
+        history_pages = {}
+        for habit in habits:
+            # границы истории - как у get_habit_logs_bounds, первый и последний лог привычки читаются в том же запросе, что и сами привычки
+            date_from, date_to = date_ranges[habit.pk]
+            if habit.first_log_date is None:
+                history_pages[habit.pk] = ([], None)
+                continue
+            first_date = habit.first_log_date if date_from is None else max(habit.first_log_date, date_from)
+            last_date = habit.last_stored_log_date if date_to is None else min(habit.last_stored_log_date, date_to)
+            habit_logs_list = [habit_log for habit_log in habit_logs_by_habit[habit.pk] if first_date <= habit_log['date'] <= last_date]
+            history = get_habit_history_from_logs(habit, habit_logs_list, first_date, last_date) if first_date <= last_date else []
+            if habit.datetype == 'weekly' and habit.period_start is not None and not self.is_compact_history():
+                history = [HabitWeekSerializer.serialize(week) for week in history]
+            history_pages[habit.pk] = (history, None)
+        return history_pages
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'compact_history': self.is_compact_history()}
+
+    def is_compact_history(self):
+        '''Запрошен ли компактный формат истории (см. CompactHistoryJSONRenderer и pack_habit_history)'''
+        return getattr(self.request, 'accepted_renderer', None) is not None and self.request.accepted_renderer.format == CompactHistoryJSONRenderer.format
+
+    def get_habit_logs_date_range(self, habit):
+        '''Диапазон дат истории из query-параметров from/to или last_n_weeks'''
+        return self.get_habit_logs_date_range_serializer().get_date_range(habit)
+
+    def get_habit_logs_date_range_serializer(self):
+        date_range_serializer = HabitLogsDateRangeSerializer(data=self.request.query_params)
+        date_range_serializer.is_valid(raise_exception=True)
+        return date_range_serializer
+
+    def get_habit_serializer(self, instance, many=False, default_fields=None, default_expand=()):
+        '''
+            Сериализатор привычки с составом полей из query-параметров fields и expand, без них - с полями по умолчанию для действия.
+            Дорогие поля (habit_logs, weeks, habit_logs_next) считаются, только если они запрошены.
+        '''
+        fields_serializer = HabitFieldsQuerySerializer(data=self.request.query_params)
+        fields_serializer.is_valid(raise_exception=True)
+        fields = fields_serializer.validated_data.get('fields')
+        expand = fields_serializer.validated_data.get('expand')
+        if fields is None and expand is None:
+            fields, expand = default_fields, default_expand
+        context = {**self.get_serializer_context(), 'habit_logs_date_range': self.get_habit_logs_date_range_serializer()}
+        return self.get_serializer(instance, many=many, fields=fields, expand=expand or (), context=context)
     
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def create_habit_log(request, pk):
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        replayed_response = replay_habit_log_creation(request.user, idempotency_key, pk)
+        if replayed_response is not None:
+            return replayed_response
     try:
         habit = Habit.objects.get(id=pk)
     except:
         return Response(status=status.HTTP_404_NOT_FOUND)
-    if habit.user != request.user:
+    if habit.user_id != request.user.id:
         return Response({"message": "You are not allowed to create log for this habit."}, status=status.HTTP_403_FORBIDDEN)
     
     habit_log_serializer = HabitLogSerializer(data=request.data, habit=habit)
-    if habit_log_serializer.is_valid(raise_exception=True):
-        habit_log_serializer.save()
-        return Response(habit_log_serializer.data, status=status.HTTP_201_CREATED)
+    respond_async = is_async_check_in(request)
+    try:
+        habit_log_serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            if respond_async:
+                check_in_request = HabitCheckInRequest.objects.create(user=request.user, habit=habit, **habit_log_serializer.validated_data)
+                response_status, response_data = status.HTTP_202_ACCEPTED, HabitCheckInRequestSerializer(check_in_request, context={'request': request}).data
+            else:
+                habit_log_serializer.save()
+                response_status, response_data = status.HTTP_201_CREATED, habit_log_serializer.data
+            if idempotency_key:
+                HabitLogIdempotencyKey.objects.create(
+                    user=request.user, 
+                    key=idempotency_key, 
+                    habit=habit, 
+                    response_status=response_status, 
+                    response_data=response_data
+                )
+    except (ValidationError, IntegrityError):
+        # повтор запроса, пришедший, пока первый ещё выполнялся: check-in отклонён как повторный или, если привычка не блокировалась
+        # (асинхронный режим, другая привычка), ключ уже записан первым запросом - тогда блок atomic откатывает и этот check-in
+        if idempotency_key:
+            replayed_response = replay_habit_log_creation(request.user, idempotency_key, pk)
+            if replayed_response is not None:
+                return replayed_response
+        raise
+    if respond_async:
+        return Response(response_data, status=response_status, headers={'Location': response_data['status_url']})
+    return Response(response_data, status=response_status)
+
+def is_async_check_in(request):
+    '''
+        Check-in ставится в очередь (см. process_check_in_queue), если асинхронный режим включён настройкой HABITS_ASYNC_CHECK_IN
+        или клиент попросил о нём заголовком Prefer: respond-async (RFC 7240)
+    '''
+    preferences = {preference.strip().lower() for preference in request.headers.get('Prefer', '').split(',')}
+    return settings.HABITS_ASYNC_CHECK_IN or 'respond-async' in preferences
+
+@extend_schema(responses=HabitCheckInRequestSerializer)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def habit_check_in_status(request, pk):
+    '''Состояние асинхронного check-in: pending, пока воркер его не обработал, затем done и id лога или failed и ошибка'''
+    try:
+        check_in_request = HabitCheckInRequest.objects.get(id=pk, user=request.user)
+    except HabitCheckInRequest.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(HabitCheckInRequestSerializer(check_in_request, context={'request': request}).data)
+
+@extend_schema(request=HabitCheckInSerializer(many=True), responses=OpenApiTypes.OBJECT)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def create_habit_logs(request):
+    '''
+        Batch check-in: логи за сегодня для нескольких привычек пользователя одним запросом (см. check_in_habits).
+        Результат - для каждого элемента запроса в том же порядке: код 201 и созданный лог или код ошибки и ошибки.
+    '''
+    serializer = HabitCheckInSerializer(data=request.data, many=True, allow_empty=False, max_length=HabitCheckInSerializer.MAX_COUNT)
+    serializer.is_valid(raise_exception=True)
+    results = check_in_habits(request.user, serializer.validated_data)
+    return Response({'results': [get_check_in_result(check_in, result) for check_in, result in zip(serializer.validated_data, results)]})
+
+def get_check_in_result(check_in, result):
+    if isinstance(result, HabitAlreadyCheckedIn):
+        errors = HabitLogSerializer.already_checked_in_error(result.args[0]).detail
+        return {'habit_id': check_in['habit_id'], 'status_code': status.HTTP_400_BAD_REQUEST, 'errors': errors}
+    if isinstance(result, Habit.DoesNotExist):
+        return {'habit_id': check_in['habit_id'], 'status_code': status.HTTP_404_NOT_FOUND, 'errors': {'habit_id': ['Habit not found.']}}
+    return {'habit_id': check_in['habit_id'], 'status_code': status.HTTP_201_CREATED, 'habit_log': HabitLogSerializer(result).data}
+
+def replay_habit_log_creation(user, idempotency_key, habit_id):
+    '''Возвращает сохранённый ответ на check-in с тем же Idempotency-Key или None, если ключ ещё не использовался'''
+    stored = HabitLogIdempotencyKey.objects.filter(user=user, key=idempotency_key).first()
+    if stored is None:
+        return None
+    if stored.habit_id != habit_id:
+        return Response({"message": "This Idempotency-Key has already been used for another habit."}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored.response_data, status=stored.response_status, headers={'Idempotent-Replayed': 'true'})
+
+@extend_schema(
+    parameters=[OpenApiParameter('since', OpenApiTypes.STR, description='Cursor from the previous sync response; omit for a full sync.')],
+    responses=OpenApiTypes.OBJECT,
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+def sync_habits(request):
+    '''
+        Инкрементальная синхронизация: привычки и логи, созданные или изменённые после курсора since, id удалённых привычек и логов (см. get_habit_changes).
+        Курсор для следующего запроса - в поле cursor. Записи об удалениях хранятся HABIT_TOMBSTONE_RETENTION, поэтому по более старому курсору
+        возвращается полная синхронизация (full_sync), после которой клиент заменяет свои данные ответом.
+        Курсор выдаётся до чтения изменений и не позже начала самой старой незавершённой транзакции (см. get_sync_cursor_time),
+        поэтому изменение, которое станет видно после ответа, придёт в одной из следующих синхронизаций, даже если его транзакция шла долго.
+    '''
+    sync_cursor = HabitSyncCursor()
+    since = sync_cursor.get_since(request)
+    now = get_sync_cursor_time()
+    full_sync = since is None or since < now - HABIT_TOMBSTONE_RETENTION
+    habits, habit_logs, deleted_habits, deleted_habit_logs = get_habit_changes(request.user, None if full_sync else since)
+    return Response({
+        'cursor': sync_cursor.get_next_cursor(now),
+        'full_sync': full_sync,
+        'habits': HabitSyncSerializer(habits, many=True).data,
+        'habit_logs': HabitLogSyncSerializer(habit_logs, many=True).data,
+        'deleted_habits': deleted_habits,
+        'deleted_habit_logs': deleted_habit_logs,
+    })
+
+EXPORT_CSV_HEADER = ('habit_id', 'habit_title', 'date', 'status', 'comment')
+EXPORT_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+
+@extend_schema(
+    parameters=[HabitExportQuerySerializer],
+    responses={(200, 'application/x-ndjson'): OpenApiTypes.STR, (200, 'text/csv'): OpenApiTypes.STR},
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_habits(request):
+    '''
+        Выгрузка всех привычек пользователя и всей их истории одним потоковым ответом - строки отправляются по мере чтения логов из БД (см. get_habit_export).
+        NDJSON: сначала строки привычек (type habit), затем логи (type habit_log) по привычкам и датам. CSV: логи с id и названием привычки.
+    '''
+    query_serializer = HabitExportQuerySerializer(data=request.query_params)
+    query_serializer.is_valid(raise_exception=True)
+    export_format = query_serializer.validated_data['export_format']
+    habits, habit_logs = get_habit_export(request.user)
+    if export_format == 'csv':
+        habit_titles = {habit['id']: habit['title'] for habit in habits}
+        content = stream_csv(EXPORT_CSV_HEADER, (
+            (habit_log['habit_id'], habit_titles[habit_log['habit_id']], habit_log['date'].isoformat(), habit_log['status'], habit_log['comment'])
+            for habit_log in habit_logs
+        ))
+    else:
+        content = stream_ndjson(chain(
+            ({'type': 'habit', **habit} for habit in habits),
+            (
+                {'type': 'habit_log', 'habit': habit_log['habit_id'], 'id': habit_log['id'], 'date': habit_log['date'], 'status': habit_log['status'], 'comment': habit_log['comment']}
+                for habit_log in habit_logs
+            ),
+        ))
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="habits.{export_format}"'
+    return response
+
+@extend_schema(
+    parameters=[HabitImportQuerySerializer],
+    request={'multipart/form-data': HabitImportFileSerializer},
+    responses={201: OpenApiTypes.OBJECT},
+)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def import_habits(request):
+    '''
+        Импорт привычек и их истории с явными датами из файла в формате /api/export/ (NDJSON или CSV, см. import_habit_history).
+        Файл читается и проверяется построчно; при ошибке ничего не сохраняется, а в ответе - номер строки и ошибки.
+    '''
+    query_serializer = HabitImportQuerySerializer(data=request.query_params)
+    query_serializer.is_valid(raise_exception=True)
+    file_serializer = HabitImportFileSerializer(data=request.data)
+    file_serializer.is_valid(raise_exception=True)
+    lines = codecs.iterdecode(file_serializer.validated_data['file'], 'utf-8')
+    try:
+        habits_count, habit_logs_count = import_habit_history(request.user, read_habit_import(lines, query_serializer.validated_data['import_format']))
+    except HabitImportError as e:
+        return Response({'line': e.line_number, 'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+    except UnicodeDecodeError:
+        raise ValidationError({'file': ['The file must be UTF-8 encoded.']})
+    return Response({'habits': habits_count, 'habit_logs': habit_logs_count}, status=status.HTTP_201_CREATED)
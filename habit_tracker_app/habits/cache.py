@@ -0,0 +1,77 @@
+from hashlib import md5
+from time import time_ns
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import get_local_now_date
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+RESPONSE_CACHE_STATS = ('hits', 'misses')
+
+
+def get_response_cache_key(request):
+    '''
+        Ключ ответа API в кэше ответов пользователя: адрес запроса с query-параметрами (поля, диапазон дат, курсор), формат ответа (Accept), текущая дата (last_n_weeks)
+        и поколение кэша пользователя - при любом изменении его привычек или логов поколение меняется, и старые ответы больше не читаются.
+        Время регистрации пользователя - в ключе, чтобы ответ не достался другому пользователю с тем же id (например, после восстановления БД)
+    '''
+    user = request.user
+    generation = get_generation(user.pk)
+    path = md5(f'{request.get_full_path()}:{getattr(request, "accepted_media_type", "")}'.encode(), usedforsecurity=False).hexdigest()
+    return f'habits:response:{user.pk}:{user.date_joined.timestamp()}:{generation}:{get_local_now_date()}:{path}'
+
+def get_generation_key(user_id):
+    return f'habits:response-generation:{user_id}'
+
+def get_generation(user_id):
+    '''
+        Текущее поколение кэша пользователя. Если ключ поколения вытеснен из кэша, начинается новое поколение, а не нулевое -
+        иначе снова стали бы доступны ответы, сохранённые до первого сброса
+    '''
+    key = get_generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+def get_cached_response(key):
+    '''Сохранённый ответ (данные, ETag, Last-Modified) или None. Попадания и промахи считаются (см. get_response_cache_stats)'''
+    cached = cache.get(key)
+    increment_response_cache_stat('misses' if cached is None else 'hits')
+    return cached
+
+def set_cached_response(key, data, etag, last_modified):
+    cache.set(key, (data, etag, last_modified), RESPONSE_CACHE_TIMEOUT)
+
+def invalidate_user_responses(*user_ids):
+    '''
+        Сбрасывает кэш ответов пользователей: новое поколение делает недоступными все их сохранённые ответы.
+        Ответ, сохранённый параллельным запросом до фиксации изменившей данные транзакции, устарел, поэтому поколение меняется ещё раз после неё
+    '''
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    start_new_generation(user_ids)
+    transaction.on_commit(lambda: start_new_generation(user_ids))
+
+def start_new_generation(user_ids):
+    generation = time_ns()
+    cache.set_many({get_generation_key(user_id): generation for user_id in user_ids}, timeout=None)
+
+def increment_response_cache_stat(stat: str):
+    key = f'habits:response-cache:{stat}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError: # счётчик вытеснен из кэша между add и incr
+        cache.set(key, 1, timeout=None)
+
+def get_response_cache_stats(reset=False):
+    '''Счётчики попаданий и промахов кэша ответов с момента последнего сброса'''
+    keys = {stat: f'habits:response-cache:{stat}' for stat in RESPONSE_CACHE_STATS}
+    stored = cache.get_many(keys.values())
+    if reset:
+        cache.delete_many(keys.values())
+    return {stat: stored.get(key, 0) for stat, key in keys.items()}
@@ -1,7 +1,7 @@
 from django import forms
-from django.utils import timezone
 
-from .models import Habit, HabitLog
+from .models import Habit, HabitLog, get_local_now_date
+from .helpers import start_new_habit_schedule_epoch, get_habit_logs_date_range
 
 class HabitForm(forms.ModelForm):
     class Meta:
@@ -23,8 +23,8 @@ class HabitForm(forms.ModelForm):
         instance = super().save(commit=False)
         instance.user = self.user
 
-        if upd:
-            instance.streak = 0
+        if upd: # если было изменено поле frequency или datetype
+            start_new_habit_schedule_epoch(instance)
             
         if commit:
             instance.save()
@@ -38,11 +38,39 @@ class CreateHabitLogForm(forms.ModelForm):
     def __init__(self, habit, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.habit = habit
-        self.habit_logs = HabitLog.objects.filter(habit=habit)
 
     def clean(self):
-        if len(self.habit_logs) > 0:
-            last_habit_log_date = self.habit_logs.first().date
-            if last_habit_log_date == timezone.localtime(timezone.now()).date():
-                raise forms.ValidationError(f'Нельзя создать отчёт о привычке в дату, в которую был создан последний отчёт ({last_habit_log_date}).')
+        last_habit_log_date = self.habit.last_log_date
+        if last_habit_log_date == get_local_now_date():
+            raise self.already_checked_in_error(last_habit_log_date)
+
+    @staticmethod
+    def already_checked_in_error(last_habit_log_date):
+        return forms.ValidationError(f'Нельзя создать отчёт о привычке в дату, в которую был создан последний отчёт ({last_habit_log_date}).')
+
+class HabitLogsDateRangeForm(forms.Form):
+    '''Фильтр истории привычки по датам (параметры from и to) или по последним неделям (last_n_weeks)'''
+    last_n_weeks = forms.IntegerField(label='Последние недели', required=False, min_value=1, max_value=520)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # from - зарезервированное слово, поэтому поля дат добавляются здесь
+        self.fields['from'] = forms.DateField(label='С', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+        self.fields['to'] = forms.DateField(label='По', required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+        self.order_fields(['from', 'to', 'last_n_weeks'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('from'), cleaned_data.get('to')
+        if cleaned_data.get('last_n_weeks') and (date_from or date_to):
+            raise forms.ValidationError('Укажите либо даты, либо кол-во последних недель')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('Дата начала не может быть позже даты конца')
+        return cleaned_data
+
+    def get_date_range(self, habit):
+        '''Границы (from, to) истории привычки, выровненные по неделям привычки (см. get_habit_logs_date_range)'''
+        if not self.is_valid():
+            return None, None
+        return get_habit_logs_date_range(habit, self.cleaned_data.get('from'), self.cleaned_data.get('to'), self.cleaned_data.get('last_n_weeks'))
 
@@ -1,67 +1,505 @@
+from base64 import b64encode
+from collections import Counter
 from datetime import timedelta
+from itertools import groupby, islice
+from operator import itemgetter
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, DateField, ExpressionWrapper, F, Max, Min, Q
+from django.db.models.functions import TruncWeek
 from django.utils import timezone
-from django.db.models import F
 
-from .models import Habit, HabitLog, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK
+from .models import Habit, HabitLog, HabitTombstone, HABIT_LOG_STATUS, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_FORGOT_TO_MARK_COMMENT, get_local_now_date
 
-def divide_habit_logs_of_weekly_habit_by_week_blocks(habit_logs, is_json=False):
+FORGOT_TO_MARK_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+HABIT_WEEKS_CACHE_TIMEOUT = 60 * 60 * 24 * 30 # закрытые недели не меняются, но срок нужен, чтобы недели удалённых привычек и старых расписаний не копились в кэше
+HABIT_STREAK_STATE_FIELDS = ['streak', 'period_start', 'period_complited', 'last_log_date']
+# двухбитные коды статусов в компактной истории (см. pack_habit_history): номер статуса в HABIT_LOG_STATUS, 3 - лога за день нет
+HABIT_LOG_STATUS_CODES = {status: code for code, (status, _) in enumerate(HABIT_LOG_STATUS)}
+HABIT_LOG_STATUS_CODE_NO_LOG = 3
+
+def get_habit_week_start(habit: Habit, date):
+    '''Возвращает первый день недели привычки, в которую попадает date. Недели отсчитываются от первого лога, т.е. от начала текущего периода'''
+    return date - timedelta(days=(date - habit.period_start).days % 7)
+
+def get_habit_week_summaries(habit: Habit, habit_logs, first_date=None, last_date=None):
     '''
-        Создаёт двумерный массив логов a, где a[i] - список логов за 1 неделю. Также создаёт список ck, где ck[i] - сколько логов a[i] имеет статус 'complited'
+        Агрегирует логи еженедельной привычки в БД: одна строка на неделю с кол-вом логов со статусами complited, incomplited и forgot_to_mark.
+        Недели привычки начинаются не с понедельника, а с дня первого лога, поэтому перед TruncWeek даты сдвигаются на день недели начала периода.
+        Дни между first_date и last_date (по умолчанию - первым и последним логом из habit_logs), для которых строки в БД нет,
+        считаются forgot_to_mark (см. fill_habit_log_gaps).
     '''
-    lk = list(habit_logs)
-    # разбиение логов на недельные блоки ( двумерный массив ) 
-    a = [[] for _ in range((len(lk) // 7)+1)]  
-    if len(lk) % 7 == 0:
-        a = [[] for _ in range((len(lk) // 7))]
-    ck = [0 for _ in range(len(a))]
-    for i in range(len(lk)):
-        a[(i // 7)].append(lk[i])
-        if is_json:
-            if lk[i]['status'] == HABIT_LOG_STATUS_COMPLITED:
-                ck[(i//7)] += 1
-        else:
-            if lk[i].status == HABIT_LOG_STATUS_COMPLITED:
-                ck[(i//7)] += 1
-    if is_json:
-        return a
-    return a, ck
-
-def set_habit_logs_status_forgot_to_mark(habit: Habit, last_habit_log_date):
-    '''
-        Создаёт модели HabitLog, которые не были созданы пользователем в промежутке хотя бы два дня между последним HabitLog (его датой) и текущей датой и присваивает им статус - forgot_to_mark 
-    '''
-    diff_in_days_between_last_log_date_and_now = (timezone.localtime(timezone.now()).date() - last_habit_log_date).days
-    if diff_in_days_between_last_log_date_and_now >= 2:
-        for i in range(diff_in_days_between_last_log_date_and_now-1):
-            date = timezone.localtime(timezone.now()) + timedelta(days=-(diff_in_days_between_last_log_date_and_now-i-1))
-            habitLog = HabitLog(habit=habit, comment='Забыли сделать отчёт!!', status=HABIT_LOG_STATUS_FORGOT_TO_MARK, date=date)
-            habitLog.save()
-
-def increase_habit_streak_field(habit: Habit, habit_logs, new_habit_log_status: str):
-    '''
-        Функция увеличивает или обнуляет значение streak у привычки
-    '''
-    datetype = habit.datetype
-    if datetype == 'weekly':
-        habit_logs_list, count_complited_habit_logs_in_each_block = divide_habit_logs_of_weekly_habit_by_week_blocks(habit_logs)
-        if len(habit_logs_list[-1])+1 == 7 and new_habit_log_status == HABIT_LOG_STATUS_COMPLITED: # +1 поскольку новый созданный (со статусом new_habit_log_status) нет в недельном блоке
-            if count_complited_habit_logs_in_each_block[-1] + 1 >= habit.frequency:
-                habit.streak = F("streak") + 1
-                habit.save()
-        elif new_habit_log_status != HABIT_LOG_STATUS_COMPLITED:
-            if count_complited_habit_logs_in_each_block[-1] >= habit.frequency:
-                habit.streak = F("streak") + 1
-                habit.save()
-    elif datetype == 'daily':
-        if habit_logs.count() == 0 and new_habit_log_status == HABIT_LOG_STATUS_COMPLITED:
-                habit.streak = F("streak") + 1
-                habit.save()
-        elif new_habit_log_status == HABIT_LOG_STATUS_COMPLITED and habit_logs.last().status == HABIT_LOG_STATUS_COMPLITED:
-                habit.streak = F("streak") + 1
-                habit.save()
+    if habit.period_start is None:
+        return []
+    shift = timedelta(days=habit.period_start.weekday())
+    shifted_date = ExpressionWrapper(F('date') - shift, output_field=DateField()) if shift else F('date')
+    weeks = (
+        habit_logs
+        .annotate(week=TruncWeek(shifted_date, output_field=DateField()))
+        .values('week')
+        .annotate(
+            complited=Count('id', filter=Q(status=HABIT_LOG_STATUS_COMPLITED)),
+            incomplited=Count('id', filter=Q(status=HABIT_LOG_STATUS_INCOMPLITED)),
+            forgot_to_mark=Count('id', filter=Q(status=HABIT_LOG_STATUS_FORGOT_TO_MARK)),
+            total=Count('id'),
+            first_date=Min('date'),
+            last_date=Max('date'),
+        )
+        .order_by('week')
+    )
+    weeks_by_start = {week.pop('week') + shift: week for week in weeks}
+    if first_date is None:
+        if not weeks_by_start:
+            return []
+        first_date = min(week['first_date'] for week in weeks_by_start.values())
+        last_date = max(week['last_date'] for week in weeks_by_start.values())
+    empty_week = {'complited': 0, 'incomplited': 0, 'forgot_to_mark': 0, 'total': 0}
+    week_summaries = []
+    start = get_habit_week_start(habit, first_date)
+    while start <= last_date:
+        end = start + timedelta(days=6)
+        week = {field: weeks_by_start.get(start, empty_week)[field] for field in empty_week}
+        # пропущенные дни, не записанные в БД, достраиваются так же, как это сделал бы set_habit_logs_status_forgot_to_mark
+        virtual_forgot_to_mark = (min(end, last_date) - max(start, first_date)).days + 1 - week['total']
+        week['forgot_to_mark'] += virtual_forgot_to_mark
+        week['total'] += virtual_forgot_to_mark
+        week_summaries.append(make_habit_week_summary(habit, start, week))
+        start += timedelta(days=7)
+    return week_summaries
+
+def make_habit_week_summary(habit: Habit, start, week):
+    '''Итоги недели привычки, начинающейся в start, по кол-ву логов week (complited, incomplited, forgot_to_mark и total)'''
+    return {
+        'start': start,
+        'end': start + timedelta(days=6),
+        **week,
+        'is_closed': week['total'] == 7,
+        'is_complited': week['complited'] >= habit.frequency,
+    }
+
+def fill_habit_log_gaps(habit_logs, newest_first=False, start=None, end=None):
+    '''
+        Дополняет логи (словари из .values() с ключом date, отсортированные по дате) логами forgot_to_mark за пропущенные дни между ними.
+        Такие логи не хранятся в БД (у них нет id) и генерируются лениво при обходе истории, если HABITS_STORE_FORGOT_TO_MARK_LOGS выключена.
+        Если пропущенные дни уже записаны в БД, между соседними логами нет разрывов и история возвращается без изменений.
+        start и end - первый и последний день обхода, если логи - только часть истории (страница), и пропущенные дни есть и по её краям.
+    '''
+    step = timedelta(days=-1 if newest_first else 1)
+    previous_date = start - step if start is not None else None
+    for habit_log in habit_logs:
+        if previous_date is not None:
+            yield from generate_forgot_to_mark_habit_logs(previous_date, habit_log['date'], step)
+        yield habit_log
+        previous_date = habit_log['date']
+    if end is not None and previous_date is not None:
+        yield from generate_forgot_to_mark_habit_logs(previous_date, end + step, step)
+
+def generate_forgot_to_mark_habit_logs(after_date, before_date, step):
+    '''Логи forgot_to_mark за дни строго между after_date и before_date, в направлении step'''
+    for days in range(1, abs((before_date - after_date).days)):
+        yield {
+            'id': None,
+            'date': after_date + step * days,
+            'status': HABIT_LOG_STATUS_FORGOT_TO_MARK,
+            'comment': HABIT_LOG_FORGOT_TO_MARK_COMMENT,
+        }
+
+def get_habit_logs_date_range(habit: Habit, date_from=None, date_to=None, last_n_weeks=None, today=None):
+    '''
+        Диапазон дат истории привычки (date_from, date_to) по параметрам from/to или last_n_weeks - последним неделям, включая текущую.
+        У еженедельной привычки границы расширяются до целых недель привычки, чтобы блоки недель совпадали с границами диапазона.
+        None в границе - без ограничения.
+    '''
+    weekly = habit.datetype == 'weekly' and habit.period_start is not None
+    if last_n_weeks:
+        if today is None:
+            today = get_local_now_date()
+        current_week_start = get_habit_week_start(habit, today) if weekly else today - timedelta(days=6)
+        date_from, date_to = current_week_start - timedelta(days=7 * (last_n_weeks - 1)), None
+    if weekly:
+        if date_from is not None:
+            date_from = get_habit_week_start(habit, date_from)
+        if date_to is not None:
+            date_to = get_habit_week_start(habit, date_to) + timedelta(days=6)
+    return date_from, date_to
+
+def get_habit_logs_bounds(habit_logs, date_from=None, date_to=None):
+    '''
+        Первый и последний день истории (дни первого и последнего лога) в пределах [date_from, date_to] или None, если в пределах нет ни одного дня истории.
+        Внутри этих границ дни без лога считаются forgot_to_mark, даже если в диапазон не попал ни один лог. Min и Max читаются по индексу (habit, epoch, date).
+    '''
+    bounds = habit_logs.aggregate(first_date=Min('date'), last_date=Max('date'))
+    if bounds['first_date'] is None:
+        return None
+    first_date = bounds['first_date'] if date_from is None else max(bounds['first_date'], date_from)
+    last_date = bounds['last_date'] if date_to is None else min(bounds['last_date'], date_to)
+    if first_date > last_date:
+        return None
+    return first_date, last_date
+
+def get_habit_logs_page(habit_logs, page_size: int, before=None, date_from=None, date_to=None):
+    '''
+        Страница истории ежедневной привычки от новых логов к старым: page_size записей (вместе с достроенными forgot_to_mark)
+        с датой раньше before в пределах [date_from, date_to].
+        Выборка идёт по ключу (date, id) индекса (habit, epoch, date) и читает не больше page_size + 1 строк, поэтому не зависит от длины истории.
+        Дата уникальна в рамках расписания привычки, поэтому для продолжения достаточно даты последней записи.
+        Возвращает записи страницы и дату, раньше которой начинается следующая страница, или None, если страница последняя.
+    '''
+    start = None if before is None else before - timedelta(days=1)
+    end = None
+    if date_from is not None or date_to is not None: # границы истории нужны, только чтобы достроить пропущенные дни по краям диапазона
+        bounds = get_habit_logs_bounds(habit_logs, date_from, date_to)
+        if bounds is None:
+            return [], None
+        end = bounds[0]
+        start = bounds[1] if start is None else min(start, bounds[1])
+        if start < end:
+            return [], None
+        habit_logs = habit_logs.filter(date__gte=end)
+    if start is not None:
+        habit_logs = habit_logs.filter(date__lte=start)
+    rows = habit_logs.order_by('-date', '-id').values('id', 'date', 'status', 'comment')[:page_size + 1]
+    entries = list(islice(fill_habit_log_gaps(rows, newest_first=True, start=start, end=end), page_size + 1))
+    if len(entries) <= page_size:
+        return entries, None
+    return entries[:page_size], entries[page_size - 1]['date']
+
+def get_habit_weeks_page(habit: Habit, habit_logs, weeks_count: int, before=None, date_from=None, date_to=None, serialize_week=None):
+    '''
+        Страница истории еженедельной привычки целыми неделями: weeks_count последних недель, начинающихся раньше before,
+        в пределах [date_from, date_to] (см. get_habit_logs_date_range), в порядке дат.
+        Читаются только логи этих недель, поэтому время не зависит от длины истории.
+        Возвращает итоги недель (см. get_habit_week_summaries) с логами каждой недели в 'logs' (или serialize_week от них, см. get_serialized_habit_weeks)
+        и начало самой ранней недели страницы, если есть более ранние недели, иначе None.
+    '''
+    if before is not None:
+        date_to = before - timedelta(days=1) if date_to is None else min(date_to, before - timedelta(days=1))
+    bounds = get_habit_logs_bounds(habit_logs, date_from, date_to)
+    if bounds is None:
+        return [], None
+    history_first_date, last_date = bounds
+    first_week_start = get_habit_week_start(habit, last_date) - timedelta(days=7 * (weeks_count - 1))
+    first_date = max(history_first_date, first_week_start)
+    if serialize_week is None:
+        weeks = get_habit_weeks(habit, habit_logs, first_date, last_date)
+    else:
+        weeks = get_serialized_habit_weeks(habit, habit_logs, first_date, last_date, serialize_week)
+    return weeks, (first_week_start if first_date > history_first_date else None)
+
+def get_habit_weeks(habit: Habit, habit_logs, first_date, last_date):
+    '''Итоги недель еженедельной привычки с first_date по last_date (см. get_habit_logs_bounds) с логами каждой недели в поле logs'''
+    habit_logs = habit_logs.filter(date__gte=first_date, date__lte=last_date)
+    weeks = get_habit_week_summaries(habit, habit_logs, first_date, last_date)
+    habit_logs_list = fill_habit_log_gaps(habit_logs.order_by('date').values('id', 'date', 'status', 'comment'), start=first_date, end=last_date)
+    for week, week_habit_logs in zip(weeks, divide_habit_logs_by_weeks(habit, habit_logs_list, weeks)):
+        week['logs'] = week_habit_logs
+    return weeks
+
+def get_habit_history_from_logs(habit: Habit, habit_logs, first_date, last_date):
+    '''
+        История привычки с first_date по last_date (см. get_habit_logs_bounds) по уже загруженным логам этих дней (словарям из .values(), отсортированным по дате)
+        без запросов к БД - в том же виде, что и страница HabitHistoryCursorPagination: у ежедневной привычки записи от новых к старым,
+        у еженедельной - итоги недель (см. get_habit_weeks), посчитанные в памяти, с логами каждой недели в 'logs'.
+    '''
+    if habit.datetype != 'weekly' or habit.period_start is None:
+        return list(fill_habit_log_gaps(reversed(habit_logs), newest_first=True, start=last_date, end=first_date))
+    week_starts = []
+    start = get_habit_week_start(habit, first_date)
+    while start <= last_date:
+        week_starts.append({'start': start})
+        start += timedelta(days=7)
+    habit_logs_list = fill_habit_log_gaps(habit_logs, start=first_date, end=last_date)
+    weeks = []
+    for week_start, week_habit_logs in zip(week_starts, divide_habit_logs_by_weeks(habit, habit_logs_list, week_starts)):
+        statuses = Counter(habit_log['status'] for habit_log in week_habit_logs)
+        week = {status: statuses[status] for status in (HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK)}
+        week['total'] = len(week_habit_logs)
+        weeks.append({**make_habit_week_summary(habit, week_start['start'], week), 'logs': week_habit_logs})
+    return weeks
+
+def get_serialized_habit_weeks(habit: Habit, habit_logs, first_date, last_date, serialize_week):
+    '''
+        То же, что get_habit_weeks, но каждая неделя - serialize_week(week). Закрытые недели (все 7 дней которых лежат в пределах истории)
+        больше не меняются до смены расписания, поэтому они сериализуются один раз и хранятся в кэше по ключу (привычка, расписание, неделя).
+        Из БД читаются только недели, которых нет в кэше, обычно - одна последняя, открытая.
+    '''
+    week_starts = []
+    start = get_habit_week_start(habit, first_date)
+    while start <= last_date:
+        week_starts.append(start)
+        start += timedelta(days=7)
+    closed_week_keys = {
+        start: get_habit_week_cache_key(habit, start)
+        for start in week_starts if start >= first_date and start + timedelta(days=6) <= last_date
+    }
+    serialized_weeks = {}
+    cached_weeks = cache.get_many(closed_week_keys.values())
+    missing_week_starts = [start for start in week_starts if closed_week_keys.get(start) not in cached_weeks]
+    if missing_week_starts:
+        missing_first_date = max(first_date, missing_week_starts[0])
+        missing_last_date = min(last_date, missing_week_starts[-1] + timedelta(days=6))
+        serialized_weeks = {week['start']: serialize_week(week) for week in get_habit_weeks(habit, habit_logs, missing_first_date, missing_last_date)}
+        cache.set_many(
+            {closed_week_keys[start]: data for start, data in serialized_weeks.items() if start in closed_week_keys},
+            timeout=HABIT_WEEKS_CACHE_TIMEOUT
+        )
+    return [serialized_weeks[start] if start in serialized_weeks else cached_weeks[closed_week_keys[start]] for start in week_starts]
+
+def get_habit_week_cache_key(habit: Habit, week_start):
+    # время создания привычки - в ключе, чтобы запись не досталась другой привычке с тем же id (например, после восстановления БД)
+    return f'habits:week:{habit.pk}:{habit.creation_date.timestamp()}:{habit.schedule_epoch}:{week_start.isoformat()}'
+
+def invalidate_habit_weeks_cache(habit: Habit, first_date, last_date):
+    '''
+        Удаляет из кэша недели привычки с first_date по last_date - при изменении логов уже закрытых недель (например, в админке).
+        При смене расписания (start_new_habit_schedule_epoch) удалять ничего не нужно: номер расписания входит в ключ
+    '''
+    start = get_habit_week_start(habit, first_date)
+    keys = []
+    while start <= last_date:
+        keys.append(get_habit_week_cache_key(habit, start))
+        start += timedelta(days=7)
+    cache.delete_many(keys)
+
+def divide_habit_logs_by_weeks(habit: Habit, habit_logs, week_summaries):
+    '''
+        Раскладывает логи (словари из .values(), отсортированные по дате) по неделям из get_habit_week_summaries.
+        Возвращает список логов для каждой недели
+    '''
+    logs_by_week_start = {week['start']: [] for week in week_summaries}
+    for habit_log in habit_logs:
+        logs_by_week_start[get_habit_week_start(habit, habit_log['date'])].append(habit_log)
+    return [logs_by_week_start[week['start']] for week in week_summaries]
+
+def pack_habit_history(habit_logs):
+    '''
+        Компактное представление истории привычки по логам (словарям из .values() с ключом date, отсортированным по дате):
+        start - первый день, days - кол-во дней, statuses - статусы по два бита на день (HABIT_LOG_STATUS_CODES) в base64,
+        день start + i - в битах 2 * (i % 4) байта i // 4; comments - пары [номер дня, комментарий] только для комментариев,
+        отличных от комментария по умолчанию (пустого, у forgot_to_mark - HABIT_LOG_FORGOT_TO_MARK_COMMENT). id логов не передаются.
+    '''
+    if not habit_logs:
+        return {'start': None, 'days': 0, 'statuses': '', 'comments': []}
+    start = habit_logs[0]['date']
+    days = (habit_logs[-1]['date'] - start).days + 1
+    statuses = bytearray(b'\xff' * ((days + 3) // 4)) # все дни - без лога, пока лог не найден
+    comments = []
+    for habit_log in habit_logs:
+        offset = (habit_log['date'] - start).days
+        shift = 2 * (offset % 4)
+        statuses[offset // 4] &= ~(HABIT_LOG_STATUS_CODE_NO_LOG << shift) | (HABIT_LOG_STATUS_CODES[habit_log['status']] << shift)
+        default_comment = HABIT_LOG_FORGOT_TO_MARK_COMMENT if habit_log['status'] == HABIT_LOG_STATUS_FORGOT_TO_MARK else ''
+        if habit_log['comment'] != default_comment:
+            comments.append([offset, habit_log['comment']])
+    return {'start': start.isoformat(), 'days': days, 'statuses': b64encode(statuses).decode('ascii'), 'comments': comments}
+
+def get_habits_page(habits, page_size: int, after=None):
+    '''
+        Страница привычек от новых к старым по ключу (creation_date, id) индекса (user, -creation_date, -id): page_size привычек после after -
+        ключа последней привычки предыдущей страницы. COUNT(*) не выполняется, поэтому далёкие страницы не дороже первой.
+        Возвращает привычки страницы и ключ последней из них, если есть следующая страница, иначе None.
+    '''
+    habits = habits.order_by('-creation_date', '-id')
+    if after is not None:
+        creation_date, pk = after
+        habits = habits.filter(Q(creation_date__lt=creation_date) | Q(creation_date=creation_date, id__lt=pk))
+    page = list(habits[:page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+    page = page[:page_size]
+    return page, (page[-1].creation_date, page[-1].pk)
+
+def get_sync_cursor_time():
+    '''
+        Момент для курсора /api/sync/: все изменения, которые не видны выборке после этого вызова, получат updated_at (deleted_at) не раньше него.
+        В PostgreSQL это начало самой старой незавершённой транзакции в БД (pg_stat_activity): изменения транзакции, которая завершится позже,
+        помечены временем не раньше её начала (now() в SQL-запросах - это и есть начало транзакции), сколько бы она ни шла.
+        Долгая транзакция только сдвигает курсор назад - часть изменений отдаётся повторно. В остальных БД - текущее время.
+    '''
+    now = timezone.now()
+    if connection.vendor != 'postgresql':
+        return now
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT min(xact_start) FROM pg_stat_activity WHERE datname = current_database() AND xact_start IS NOT NULL')
+        oldest_transaction_start, = cursor.fetchone()
+    return now if oldest_transaction_start is None else min(now, oldest_transaction_start)
+
+def get_habit_changes(user, since=None):
+    '''
+        Изменения привычек пользователя после момента since (None - все привычки) для /api/sync/:
+        созданные или изменённые привычки, логи их текущих расписаний, изменённые после since, id удалённых привычек и id удалённых логов.
+        Любое изменение логов обновляет и Habit.updated_at, поэтому логи ищутся только у изменённых привычек,
+        и если изменений нет, выполняются только две выборки по индексам (user, updated_at) и (user, deleted_at).
+    '''
+    habits = Habit.objects.filter(user=user)
+    tombstones = HabitTombstone.objects.filter(user=user)
+    if since is not None:
+        habits = habits.filter(updated_at__gt=since)
+        tombstones = tombstones.filter(deleted_at__gt=since)
+    habits = list(habits)
+    habit_logs = []
+    if habits:
+        habit_logs = HabitLog.objects.filter(habit__in=habits, epoch=F('habit__schedule_epoch')).order_by('habit', 'date')
+        if since is not None:
+            habit_logs = habit_logs.filter(updated_at__gt=since)
+    deleted_habits, deleted_habit_logs = [], []
+    for habit_id, habit_log_id in tombstones.values_list('habit_id', 'habit_log_id'):
+        if habit_log_id is None:
+            deleted_habits.append(habit_id)
         else:
-            habit.streak = 0
-            habit.save()
+            deleted_habit_logs.append(habit_log_id)
+    return habits, habit_logs, deleted_habits, deleted_habit_logs
+
+def get_habit_export(user, chunk_size=EXPORT_CHUNK_SIZE):
+    '''
+        Все привычки пользователя и логи их текущих расписаний для выгрузки (/api/export/): список привычек (словарей из .values())
+        и генератор логов по привычкам и датам - словарей с habit_id. Логи читаются одним запросом пачками по chunk_size (.iterator()),
+        поэтому расход памяти не зависит от длины истории. Пропущенные дни, не записанные в БД, достраиваются (см. fill_habit_log_gaps).
+        Логи читаются только для уже прочитанных привычек: привычка, созданная между двумя запросами, не попадает в выгрузку без своей строки.
+    '''
+    habits = list(Habit.objects.filter(user=user).order_by('id').values('id', 'title', 'purpose', 'datetype', 'frequency', 'streak'))
+    habit_logs = (
+        HabitLog.objects.filter(habit_id__in=[habit['id'] for habit in habits], epoch=F('habit__schedule_epoch'))
+        .order_by('habit_id', 'date')
+        .values('habit_id', 'id', 'date', 'status', 'comment')
+        .iterator(chunk_size=chunk_size)
+    )
+    return habits, _fill_exported_habit_log_gaps(habit_logs)
+
+def _fill_exported_habit_log_gaps(habit_logs):
+    for habit_id, logs in groupby(habit_logs, key=itemgetter('habit_id')):
+        for habit_log in fill_habit_log_gaps(logs):
+            habit_log['habit_id'] = habit_id # у достроенных логов habit_id нет
+            yield habit_log
+
+def set_habit_logs_status_forgot_to_mark(habit: Habit, last_habit_log_date, today=None):
+    '''
+        Создаёт модели HabitLog, которые не были созданы пользователем в промежутке хотя бы два дня между последним HabitLog (его датой) и текущей датой и присваивает им статус - forgot_to_mark.
+        Диапазон пропущенных дат вычисляется один раз и записывается одним INSERT ... SELECT generate_series (PostgreSQL) или пачками через bulk_create.
+        Логи создаются в текущем расписании привычки. Даты, для которых лог уже есть, пропускаются благодаря ограничению уникальности (habit, epoch, date),
+        поэтому повторный вызов ничего не меняет.
+    '''
+    if today is None:
+        today = get_local_now_date()
+    first_missed_date = last_habit_log_date + timedelta(days=1)
+    last_missed_date = today - timedelta(days=1)
+    if first_missed_date > last_missed_date:
+        return
+    if connection.vendor == 'postgresql':
+        _insert_forgot_to_mark_habit_logs_with_generate_series(habit, first_missed_date, last_missed_date)
+        return
+    bulk_create_forgot_to_mark_habit_logs(generate_missed_habit_logs(habit, last_habit_log_date, today))
+
+def generate_missed_habit_logs(habit: Habit, last_habit_log_date, today):
+    '''Несохранённые логи forgot_to_mark за дни строго между last_habit_log_date и today в текущем расписании привычки'''
+    for days in range(1, (today - last_habit_log_date).days):
+        yield HabitLog(
+            habit=habit, epoch=habit.schedule_epoch, comment=HABIT_LOG_FORGOT_TO_MARK_COMMENT,
+            status=HABIT_LOG_STATUS_FORGOT_TO_MARK, date=last_habit_log_date + timedelta(days=days)
+        )
 
+def bulk_create_forgot_to_mark_habit_logs(missed_habit_logs):
+    '''Записывает логи forgot_to_mark пачками, не собирая их все в память; даты, для которых лог уже есть, пропускаются'''
+    missed_habit_logs = iter(missed_habit_logs)
+    while True:
+        batch = list(islice(missed_habit_logs, FORGOT_TO_MARK_BATCH_SIZE))
+        if not batch:
+            break
+        HabitLog.objects.bulk_create(batch, batch_size=FORGOT_TO_MARK_BATCH_SIZE, ignore_conflicts=True)
 
+def _insert_forgot_to_mark_habit_logs_with_generate_series(habit: Habit, first_missed_date, last_missed_date):
+    table = connection.ops.quote_name(HabitLog._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+                INSERT INTO {table} (habit_id, epoch, status, date, comment)
+                SELECT %s, %s, %s, missed_date::date, %s
+                FROM generate_series(%s::date, %s::date, interval '1 day') AS missed_date
+                ON CONFLICT (habit_id, epoch, date) DO NOTHING
+            ''',
+            [habit.pk, habit.schedule_epoch, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_FORGOT_TO_MARK_COMMENT, first_missed_date, last_missed_date]
+        )
+
+def get_habit_period_length(habit: Habit):
+    '''Длина периода привычки в днях: неделя для еженедельной, день для ежедневной'''
+    return 7 if habit.datetype == 'weekly' else 1
+
+def apply_habit_log_to_streak_state(habit: Habit, log_date, new_habit_log_status: str):
+    '''
+        Учитывает новый лог в счётчиках привычки (streak, period_start, period_complited, last_log_date) за O(1), не обращаясь к истории логов.
+        Период считается выполненным, если кол-во логов со статусом complited в нём >= frequency (для ежедневной привычки frequency = 1).
+        Итог периода подводится по логу за его последний день; если последний день пропущен, итог подводится при переходе к следующему периоду.
+        Модель не сохраняется.
+    '''
+    period_length = get_habit_period_length(habit)
+    frequency = habit.frequency if habit.datetype == 'weekly' else 1
+    streak = habit.streak
+    if habit.period_start is None:
+        period_start, period_complited = log_date, 0
+    else:
+        period_start, period_complited = habit.period_start, habit.period_complited
+        elapsed_days = (log_date - period_start).days
+        if elapsed_days >= period_length:
+            period_end = period_start + timedelta(days=period_length-1)
+            if habit.last_log_date < period_end: # итог периода ещё не подведён
+                streak = streak + 1 if period_complited >= frequency else 0
+            if elapsed_days >= 2 * period_length: # целиком пропущенные периоды
+                streak = 0
+            period_start += timedelta(days=elapsed_days // period_length * period_length)
+            period_complited = 0
+    if new_habit_log_status == HABIT_LOG_STATUS_COMPLITED:
+        period_complited += 1
+    if (log_date - period_start).days == period_length - 1:
+        streak = streak + 1 if period_complited >= frequency else 0
+    habit.streak = streak
+    habit.period_start = period_start
+    habit.period_complited = period_complited
+    habit.last_log_date = log_date
+
+def update_habit_streak(habit: Habit, log_date, new_habit_log_status: str):
+    '''
+        Функция увеличивает или обнуляет значение streak у привычки, сохраняя только её счётчики (и время изменения для /api/sync/)
+    '''
+    apply_habit_log_to_streak_state(habit, log_date, new_habit_log_status)
+    habit.save(update_fields=[*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+
+def reset_habit_streak_state(habit: Habit):
+    '''Обнуляет streak и счётчики текущего периода (например, при смене расписания привычки). Модель не сохраняется'''
+    habit.streak = 0
+    habit.period_start = None
+    habit.period_complited = 0
+    habit.last_log_date = None
+
+def start_new_habit_schedule_epoch(habit: Habit):
+    '''
+        Начинает новое расписание привычки (при смене datetype или frequency) за O(1): логи прошлого расписания не удаляются,
+        а перестают учитываться, т.к. все выборки идут через HabitLog.objects.for_habit. Модель не сохраняется.
+    '''
+    habit.schedule_epoch += 1
+    reset_habit_streak_state(habit)
+
+def recompute_habit_streak_state(habit: Habit, habit_logs):
+    '''
+        Пересчитывает streak и счётчики привычки с нуля по истории habit_logs - итерируемому объекту пар (date, status), отсортированных по дате.
+        Модель не сохраняется.
+    '''
+    reset_habit_streak_state(habit)
+    for log_date, status in habit_logs:
+        apply_habit_log_to_streak_state(habit, log_date, status)
+    return habit
+
+def rebuild_habit_streak(habit: Habit, commit=True):
+    '''
+        Пересчитывает streak и счётчики привычки по всей истории логов и сверяет их с сохранёнными.
+        Возвращает True, если сохранённые значения расходились с историей.
+    '''
+    stored_state = [getattr(habit, field) for field in HABIT_STREAK_STATE_FIELDS]
+    habit_logs = HabitLog.objects.for_habit(habit).order_by('date').values_list('date', 'status')
+    recompute_habit_streak_state(habit, habit_logs.iterator())
+    changed = stored_state != [getattr(habit, field) for field in HABIT_STREAK_STATE_FIELDS]
+    if commit and changed:
+        habit.save(update_fields=[*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+    return changed
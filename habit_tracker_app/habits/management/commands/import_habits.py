@@ -0,0 +1,34 @@
+import codecs
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.api.parsers import read_habit_import
+from habits.services import import_habit_history, HabitImportError, IMPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports habits and their history with explicit dates from an NDJSON or CSV file in the /api/export/ format. '
+        'Logs are inserted in chunks inside one transaction and streaks are recomputed once per habit at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the imported habits.')
+        parser.add_argument('path', help='Path to the file to import.')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), default=None, help='File format, guessed from the file extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Number of logs inserted with one query.')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist.')
+        import_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        with open(options['path'], 'rb') as file:
+            lines = codecs.iterdecode(file, 'utf-8')
+            try:
+                habits_count, habit_logs_count = import_habit_history(user, read_habit_import(lines, import_format), options['chunk_size'])
+            except HabitImportError as e:
+                raise CommandError(f'Line {e.line_number}: {e.errors}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {habits_count} habits and {habit_logs_count} habit logs.'))
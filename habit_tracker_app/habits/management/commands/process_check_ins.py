@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from habits.services import process_check_in_queue, CHECK_IN_QUEUE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Processes check-ins accepted by the API with 202 Accepted. Habits with pending check-ins are claimed in batches, oldest check-in first, with '
+        'SELECT ... FOR UPDATE SKIP LOCKED, so several workers process different habits in parallel while check-ins of one habit are applied in order.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CHECK_IN_QUEUE_BATCH_SIZE, help='Number of habits with pending check-ins claimed per batch.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of waiting for new check-ins.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            batch_processed = process_check_in_queue(options['batch_size'])
+            processed += batch_processed
+            if batch_processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} check-ins.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from habits.services import purge_habit_logs_of_past_epochs, PURGE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Deletes habit logs left from previous habit schedules (epochs) in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Number of logs deleted in one transaction.')
+
+    def handle(self, *args, **options):
+        deleted = purge_habit_logs_of_past_epochs(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} habit logs of previous schedules.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from habits.cache import get_response_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Prints hit and miss counters of the habits API response cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them.')
+
+    def handle(self, *args, **options):
+        stats = get_response_cache_stats(reset=options['reset'])
+        requests = stats['hits'] + stats['misses']
+        hit_ratio = stats['hits'] / requests if requests else 0
+        self.stdout.write(f'Hits: {stats["hits"]}, misses: {stats["misses"]}, hit ratio: {hit_ratio:.1%}')
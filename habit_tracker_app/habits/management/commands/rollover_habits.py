@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Max, Min
+
+from habits.models import Habit, get_local_now_date
+from habits.services import rollover_habits, purge_expired_records
+from habits.workers import init_worker, rollover_users_range
+
+USERS_PER_BATCH = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Nightly rollover of habits to a new local day: fills missed days with forgot_to_mark logs, '
+        'resets broken daily streaks and closes finished weekly periods. Users are split into id ranges processed by a process pool. '
+        'Also purges expired service records (sync tombstones, idempotency keys, processed check-in requests).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, default=None, help='Local date to roll over to (YYYY-MM-DD), today by default.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes on PostgreSQL, 1 runs in the current process.')
+        parser.add_argument('--batch-size', type=int, default=USERS_PER_BATCH, help='Number of user ids processed in one transaction.')
+
+    def handle(self, *args, **options):
+        today = options['date'] or get_local_now_date()
+        purged = purge_expired_records()
+        self.stdout.write(f'Purged {purged} expired records.')
+        users_range = Habit.objects.aggregate(first_user_id=Min('user_id'), last_user_id=Max('user_id'))
+        if users_range['first_user_id'] is None:
+            self.stdout.write('No habits to roll over.')
+            return
+        batch_size = options['batch_size']
+        users_ranges = [
+            (first_user_id, min(first_user_id + batch_size - 1, users_range['last_user_id']))
+            for first_user_id in range(users_range['first_user_id'], users_range['last_user_id'] + 1, batch_size)
+        ]
+        # SQLite не допускает параллельной записи из нескольких процессов
+        workers = options['workers'] if connection.vendor == 'postgresql' else 1
+        if workers <= 1:
+            rolled_over = sum(rollover_habits(*batch, today=today) for batch in users_ranges)
+        else:
+            # открытые соединения не должны наследоваться процессами пула
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                rolled_over = sum(executor.map(rollover_users_range, users_ranges, [today] * len(users_ranges)))
+        self.stdout.write(self.style.SUCCESS(f'Rolled over {rolled_over} habits to {today}.'))
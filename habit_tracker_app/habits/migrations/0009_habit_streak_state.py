@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+from ._streak_state import HABIT_STREAK_STATE_FIELDS, recompute_habit_streak_state
+
+
+def fill_habit_streak_state(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    HabitLog = apps.get_model('habits', 'HabitLog')
+    for habit in Habit.objects.iterator():
+        habit_logs = HabitLog.objects.filter(habit=habit).order_by('date').values_list('date', 'status')
+        recompute_habit_streak_state(habit, habit_logs.iterator())
+        habit.save(update_fields=HABIT_STREAK_STATE_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0008_alter_habitlog_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='last_log_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='period_complited',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='period_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_habit_streak_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_habit_streak_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # сначала создаются составные индексы, и только потом удаляются покрываемые ими индексы внешних ключей
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['user', '-creation_date'], name='habit_user_creation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitlog',
+            index=models.Index(fields=['habit', 'date'], name='habitlog_habit_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitlog',
+            index=models.Index(condition=models.Q(('status', 'complited'), _negated=True), fields=['habit', 'date'], name='habitlog_not_complited_idx'),
+        ),
+        migrations.AlterField(
+            model_name='habit',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='habitlog',
+            name='habit',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='habits.habit'),
+        ),
+    ]
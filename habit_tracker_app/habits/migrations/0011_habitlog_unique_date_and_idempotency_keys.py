@@ -0,0 +1,68 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from ._streak_state import HABIT_STREAK_STATE_FIELDS, recompute_habit_streak_state
+
+
+def remove_duplicate_habit_logs(apps, schema_editor):
+    '''Оставляет по одному (самому раннему) логу на привычку и дату и пересчитывает streak затронутых привычек'''
+    Habit = apps.get_model('habits', 'Habit')
+    HabitLog = apps.get_model('habits', 'HabitLog')
+    duplicates = HabitLog.objects.values('habit_id', 'date').annotate(first_id=Min('id'), logs_count=Count('id')).filter(logs_count__gt=1)
+    affected_habit_ids = set()
+    for duplicate in duplicates.iterator():
+        HabitLog.objects.filter(habit_id=duplicate['habit_id'], date=duplicate['date']).exclude(id=duplicate['first_id']).delete()
+        affected_habit_ids.add(duplicate['habit_id'])
+    for habit in Habit.objects.filter(id__in=affected_habit_ids):
+        habit_logs = HabitLog.objects.filter(habit=habit).order_by('date').values_list('date', 'status')
+        recompute_habit_streak_state(habit, habit_logs.iterator())
+        habit.save(update_fields=HABIT_STREAK_STATE_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_habit_and_habitlog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitLogIdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('response_status', models.PositiveSmallIntegerField()),
+                ('response_data', models.JSONField()),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_habit_logs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='habitlog',
+            constraint=models.UniqueConstraint(fields=('habit', 'date'), name='habitlog_unique_habit_date'),
+        ),
+        # уникальный индекс (habit, date) заменяет обычный
+        migrations.RemoveIndex(
+            model_name='habitlog',
+            name='habitlog_habit_date_idx',
+        ),
+        migrations.AddField(
+            model_name='habitlogidempotencykey',
+            name='habit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='habits.habit'),
+        ),
+        migrations.AddField(
+            model_name='habitlogidempotencykey',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='habitlogidempotencykey',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='habitlog_idempotency_unique_key'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0011_habitlog_unique_date_and_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='schedule_epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='habitlog',
+            name='epoch',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='habitlog',
+            constraint=models.UniqueConstraint(fields=('habit', 'epoch', 'date'), name='habitlog_unique_habit_epoch_date'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='habitlog',
+            name='habitlog_unique_habit_date',
+        ),
+        migrations.RemoveIndex(
+            model_name='habitlog',
+            name='habitlog_not_complited_idx',
+        ),
+        migrations.AddIndex(
+            model_name='habitlog',
+            index=models.Index(condition=models.Q(('status', 'complited'), _negated=True), fields=['habit', 'epoch', 'date'], name='habitlog_not_complited_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_habitlog_habit_on_delete(apps, schema_editor, on_delete_sql):
+    '''
+        Пересоздаёт внешний ключ habits_habitlog.habit_id в PostgreSQL с заданным поведением при удалении привычки.
+        Имя ограничения, созданного Django, берётся из information_schema и сохраняется
+    '''
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'''
+            DO $$
+            DECLARE
+                foreign_key_name text;
+            BEGIN
+                FOR foreign_key_name IN
+                    SELECT table_constraints.constraint_name
+                    FROM information_schema.table_constraints
+                    JOIN information_schema.key_column_usage USING (constraint_schema, constraint_name, table_name)
+                    WHERE table_constraints.constraint_schema = current_schema()
+                        AND table_constraints.table_name = 'habits_habitlog'
+                        AND table_constraints.constraint_type = 'FOREIGN KEY'
+                        AND key_column_usage.column_name = 'habit_id'
+                LOOP
+                    EXECUTE 'ALTER TABLE habits_habitlog DROP CONSTRAINT ' || quote_ident(foreign_key_name);
+                    EXECUTE 'ALTER TABLE habits_habitlog ADD CONSTRAINT ' || quote_ident(foreign_key_name)
+                        || ' FOREIGN KEY (habit_id) REFERENCES habits_habit (id) {on_delete_sql} DEFERRABLE INITIALLY DEFERRED';
+                END LOOP;
+            END
+            $$
+        ''',
+        params=None,
+    )
+
+def set_habitlog_habit_db_cascade(apps, schema_editor):
+    set_habitlog_habit_on_delete(apps, schema_editor, 'ON DELETE CASCADE')
+
+def unset_habitlog_habit_db_cascade(apps, schema_editor):
+    set_habitlog_habit_on_delete(apps, schema_editor, '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0012_habit_schedule_epochs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='habitlog',
+            name='habit',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='habits.habit'),
+        ),
+        # логи удаляются вместе с привычкой самой БД, Django их не собирает (on_delete=DO_NOTHING)
+        migrations.RunPython(set_habitlog_habit_db_cascade, unset_habitlog_habit_db_cascade),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:30
+
+import django.db.models.deletion
+import habits.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0015_habit_list_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitCheckInRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=habits.models.get_local_now_date)),
+                ('status', models.CharField(choices=[('complited', 'Выполнено'), ('incomplited', 'Не выполнено'), ('forgot_to_mark', 'Забыли записать!')])),
+                ('comment', models.CharField(max_length=100)),
+                ('state', models.CharField(choices=[('pending', 'Ожидает обработки'), ('done', 'Лог создан'), ('failed', 'Ошибка')], default='pending')),
+                ('habit_log_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='habits.habit')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('state', 'pending')), fields=['id'], name='habitcheckin_pending_idx'), models.Index(condition=models.Q(('state', 'pending')), fields=['habit', 'id'], name='habitcheckin_habit_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0017_habit_log_tombstones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habitlogidempotencykey',
+            index=models.Index(fields=['creation_date'], name='habitlog_idempotency_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0018_habitlogidempotencykey_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habitcheckinrequest',
+            index=models.Index(condition=models.Q(('state', 'pending'), _negated=True), fields=['processed_at'], name='habitcheckin_processed_idx'),
+        ),
+    ]
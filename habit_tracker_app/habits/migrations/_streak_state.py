@@ -0,0 +1,45 @@
+'''
+    Правила подсчёта streak на момент миграций 0009 и 0011 (см. apply_habit_log_to_streak_state в habits/helpers.py) - одна копия для обеих миграций.
+    Модуль начинается с "_", поэтому загрузчик миграций не считает его миграцией. Менять его нельзя: миграция, которой понадобятся
+    другие правила, должна хранить свою копию. Функции работают и с историческими моделями из apps.get_model
+'''
+from datetime import timedelta
+
+HABIT_STREAK_STATE_FIELDS = ['streak', 'period_start', 'period_complited', 'last_log_date']
+HABIT_LOG_STATUS_COMPLITED = 'complited'
+
+
+def apply_habit_log_to_streak_state(habit, log_date, status):
+    period_length = 7 if habit.datetype == 'weekly' else 1
+    frequency = habit.frequency if habit.datetype == 'weekly' else 1
+    streak = habit.streak
+    if habit.period_start is None:
+        period_start, period_complited = log_date, 0
+    else:
+        period_start, period_complited = habit.period_start, habit.period_complited
+        elapsed_days = (log_date - period_start).days
+        if elapsed_days >= period_length:
+            period_end = period_start + timedelta(days=period_length-1)
+            if habit.last_log_date < period_end:
+                streak = streak + 1 if period_complited >= frequency else 0
+            if elapsed_days >= 2 * period_length:
+                streak = 0
+            period_start += timedelta(days=elapsed_days // period_length * period_length)
+            period_complited = 0
+    if status == HABIT_LOG_STATUS_COMPLITED:
+        period_complited += 1
+    if (log_date - period_start).days == period_length - 1:
+        streak = streak + 1 if period_complited >= frequency else 0
+    habit.streak = streak
+    habit.period_start = period_start
+    habit.period_complited = period_complited
+    habit.last_log_date = log_date
+
+
+def recompute_habit_streak_state(habit, habit_logs):
+    habit.streak = 0
+    habit.period_start = None
+    habit.period_complited = 0
+    habit.last_log_date = None
+    for log_date, status in habit_logs:
+        apply_habit_log_to_streak_state(habit, log_date, status)
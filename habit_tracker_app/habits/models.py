@@ -1,9 +1,15 @@
 from django.db import models
+from django.db.models.functions import Now
 from django.utils import timezone
 
 HABIT_LOG_STATUS_INCOMPLITED = 'incomplited'
 HABIT_LOG_STATUS_COMPLITED = 'complited'
 HABIT_LOG_STATUS_FORGOT_TO_MARK = 'forgot_to_mark'
+HABIT_LOG_FORGOT_TO_MARK_COMMENT = 'Забыли сделать отчёт!!'
+
+HABIT_CHECK_IN_STATE_PENDING = 'pending'
+HABIT_CHECK_IN_STATE_DONE = 'done'
+HABIT_CHECK_IN_STATE_FAILED = 'failed'
 
 HABIT_DATETYPES = [
     ('weekly', 'Кол-во раз в неделю'),
@@ -15,17 +21,29 @@ HABIT_LOG_STATUS = [
     (HABIT_LOG_STATUS_FORGOT_TO_MARK, 'Забыли записать!')
 ]
 
+HABIT_CHECK_IN_STATES = [
+    (HABIT_CHECK_IN_STATE_PENDING, 'Ожидает обработки'),
+    (HABIT_CHECK_IN_STATE_DONE, 'Лог создан'),
+    (HABIT_CHECK_IN_STATE_FAILED, 'Ошибка'),
+]
+
 def get_local_now_date():
     """Returns the current date in the local timezone."""
     return timezone.localtime(timezone.now()).date()
 
 class Habit(models.Model):
-    user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, db_index=False) # покрывается индексом (user, -creation_date)
     title = models.CharField('Название', max_length=100)
     purpose = models.CharField('Цель', max_length=150, blank=True)
     datetype = models.CharField('Как вы хотите выполнять привычку?', choices=HABIT_DATETYPES, default='weekly')
     streak = models.IntegerField(default=0) # сколько дней (недель) подряд выполнялась привычка
+    period_start = models.DateField(null=True, blank=True) # первый день текущего периода (дня или недели)
+    period_complited = models.PositiveSmallIntegerField(default=0) # сколько логов со статусом complited в текущем периоде
+    last_log_date = models.DateField(null=True, blank=True) # дата последнего лога
+    schedule_epoch = models.PositiveIntegerField(default=0) # номер текущего расписания, увеличивается при смене datetype или frequency
     creation_date = models.DateTimeField(auto_now_add=True)
+    # время последнего изменения привычки или её логов (логи не меняются без сохранения счётчиков привычки), по нему работает /api/sync/
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
     frequency = models.PositiveSmallIntegerField(
         'Сколько раз в неделю вы хотите выполнять привычку', 
         default=1, 
@@ -34,22 +52,109 @@ class Habit(models.Model):
 
     class Meta:
         ordering = ['-creation_date']
+        indexes = [
+            models.Index(fields=['user', '-creation_date', '-id'], name='habit_user_creation_idx'),
+            models.Index(fields=['user', 'updated_at'], name='habit_user_updated_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+class HabitLogQuerySet(models.QuerySet):
+    def for_habit(self, habit: Habit):
+        '''Логи текущего расписания привычки. Логи прошлых расписаний остаются в БД, но не учитываются в streak и истории'''
+        return self.filter(habit=habit, epoch=habit.schedule_epoch)
+
+    def of_past_epochs(self, habit: Habit):
+        '''Логи прошлых расписаний привычки (см. purge_habit_logs_of_past_epochs), выбираются по уникальному индексу (habit, epoch, date)'''
+        return self.filter(habit=habit, epoch__lt=habit.schedule_epoch)
+
 class HabitLog(models.Model):
-    habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+    # покрывается уникальным индексом (habit, epoch, date). Логи удаляются вместе с привычкой не Django, а самой БД (ON DELETE CASCADE в PostgreSQL)
+    # или пачками в обработчике pre_delete (см. signals.py), чтобы не загружать всю историю в память
+    habit = models.ForeignKey(Habit, on_delete=models.DO_NOTHING, db_index=False)
+    epoch = models.PositiveIntegerField(default=0) # номер расписания привычки (Habit.schedule_epoch), при котором создан лог
     status = models.CharField(choices=HABIT_LOG_STATUS)
     date = models.DateField(default=get_local_now_date)
     comment = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now()) # логи, записанные SQL-запросами в обход ORM, получают время из БД
+
+    objects = HabitLogQuerySet.as_manager()
 
     class Meta:
         ordering = ['date']
+        constraints = [
+            # не больше одного лога в день в рамках расписания; уникальный индекс также обслуживает выборки логов привычки по дате
+            models.UniqueConstraint(fields=['habit', 'epoch', 'date'], name='habitlog_unique_habit_epoch_date'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['habit', 'epoch', 'date'], 
+                condition=~models.Q(status=HABIT_LOG_STATUS_COMPLITED), 
+                name='habitlog_not_complited_idx'
+            ),
+            models.Index(fields=['habit', 'updated_at'], name='habitlog_habit_updated_idx'),
+        ]
 
     def __str__(self):
         if self.comment:
             return f'Лог: `{self.comment}` к привычке `{self.habit}` - {self.date}'
-        
-    
 
+class HabitLogIdempotencyKey(models.Model):
+    '''Результат check-in через API, сохранённый по заголовку Idempotency-Key, чтобы повторный запрос клиента вернул его без новой записи'''
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, db_index=False) # покрывается уникальным индексом (user, key)
+    key = models.CharField(max_length=255)
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+    response_status = models.PositiveSmallIntegerField()
+    response_data = models.JSONField()
+    creation_date = models.DateTimeField(auto_now_add=True) # ключи хранятся IDEMPOTENCY_KEY_RETENTION (см. purge_expired_records)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='habitlog_idempotency_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['creation_date'], name='habitlog_idempotency_date_idx'),
+        ]
+
+class HabitTombstone(models.Model):
+    '''
+        Запись об удалённой привычке (habit_log_id пуст) или об удалённом логе привычки для /api/sync/:
+        по ней клиент удаляет у себя привычку вместе с её логами или один лог. Хранится HABIT_TOMBSTONE_RETENTION (см. purge_expired_records)
+    '''
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, db_index=False) # покрывается индексом (user, deleted_at)
+    habit_id = models.PositiveBigIntegerField()
+    habit_log_id = models.PositiveBigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='habittombstone_user_idx'),
+            models.Index(fields=['deleted_at'], name='habittombstone_deleted_idx'),
+        ]
+
+class HabitCheckInRequest(models.Model):
+    '''
+        Check-in, принятый API в асинхронном режиме (202 Accepted) и ожидающий обработки воркером (см. process_check_in_queue).
+        Очередь хранится в БД: запросы одной привычки обрабатываются по порядку id, разные привычки - параллельно несколькими воркерами
+    '''
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, db_index=False) # покрывается частичным индексом (habit, id)
+    date = models.DateField(default=get_local_now_date) # день check-in - дата приёма запроса, а не обработки
+    status = models.CharField(choices=HABIT_LOG_STATUS)
+    comment = models.CharField(max_length=100)
+    state = models.CharField(choices=HABIT_CHECK_IN_STATES, default=HABIT_CHECK_IN_STATE_PENDING)
+    # логи удаляются пачками, не загружаясь в память (см. delete_habit_logs_in_batches), поэтому id созданного лога хранится без внешнего ключа
+    habit_log_id = models.PositiveBigIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    creation_date = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # очередь - только необработанные запросы, поэтому индексы частичные и не растут вместе с историей
+            models.Index(fields=['id'], condition=models.Q(state=HABIT_CHECK_IN_STATE_PENDING), name='habitcheckin_pending_idx'),
+            models.Index(fields=['habit', 'id'], condition=models.Q(state=HABIT_CHECK_IN_STATE_PENDING), name='habitcheckin_habit_pending_idx'),
+            # обработанные запросы удаляются по сроку хранения (см. purge_expired_records)
+            models.Index(fields=['processed_at'], condition=~models.Q(state=HABIT_CHECK_IN_STATE_PENDING), name='habitcheckin_processed_idx'),
+        ]
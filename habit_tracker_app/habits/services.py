@@ -0,0 +1,429 @@
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from .cache import invalidate_user_responses
+from .models import (
+    Habit, HabitLog, HabitLogIdempotencyKey, HabitTombstone, HabitCheckInRequest, HABIT_LOG_STATUS_FORGOT_TO_MARK, HABIT_LOG_FORGOT_TO_MARK_COMMENT,
+    HABIT_CHECK_IN_STATE_PENDING, HABIT_CHECK_IN_STATE_DONE, HABIT_CHECK_IN_STATE_FAILED, get_local_now_date
+)
+from .helpers import (
+    HABIT_STREAK_STATE_FIELDS, set_habit_logs_status_forgot_to_mark, update_habit_streak, apply_habit_log_to_streak_state,
+    fill_habit_log_gaps, rebuild_habit_streak, invalidate_habit_weeks_cache, generate_missed_habit_logs, bulk_create_forgot_to_mark_habit_logs
+)
+
+ROLLOVER_BATCH_SIZE = 500
+PURGE_BATCH_SIZE = 1000
+DELETE_BATCH_SIZE = 5000
+IMPORT_CHUNK_SIZE = 1000
+CHECK_IN_QUEUE_BATCH_SIZE = 200
+# клиент, не синхронизировавшийся дольше, получает полную синхронизацию (см. sync_habits)
+HABIT_TOMBSTONE_RETENTION = timedelta(days=90)
+# клиенты повторяют запрос с тем же Idempotency-Key в течение минут, поэтому сохранённые ответы хранятся с большим запасом
+IDEMPOTENCY_KEY_RETENTION = timedelta(days=7)
+# статус асинхронного check-in клиент опрашивает в течение секунд, обработанные запросы хранятся с запасом, как и ключи Idempotency-Key
+CHECK_IN_REQUEST_RETENTION = timedelta(days=7)
+
+
+class HabitAlreadyCheckedIn(Exception):
+    '''Лог привычки за сегодняшний день уже создан'''
+
+
+class HabitImportError(Exception):
+    '''Ошибка в записи импорта: номер строки файла и описание ошибки'''
+    def __init__(self, line_number, errors):
+        super().__init__(line_number, errors)
+        self.line_number = line_number
+        self.errors = errors
+
+
+def check_in_habit(habit: Habit, status: str, comment: str, today=None):
+    '''
+        Создаёт лог привычки за сегодняшний день. Общий путь записи для веб-приложения и API:
+        в одной транзакции заполняет пропущенные дни логами forgot_to_mark, обновляет счётчики streak и сохраняет новый лог.
+        Если HABITS_STORE_FORGOT_TO_MARK_LOGS выключена, пропущенные дни не записываются - они достраиваются при чтении истории.
+        История логов не читается - всё нужное хранится в счётчиках привычки, поэтому кол-во запросов не зависит от её длины.
+        Строка привычки блокируется (SELECT ... FOR UPDATE), поэтому параллельные check-in одной привычки выполняются по очереди,
+        и второй из них получает HabitAlreadyCheckedIn, а не второй лог и двойное увеличение streak.
+    '''
+    if today is None:
+        today = get_local_now_date()
+    with transaction.atomic(savepoint=False):
+        locked_habit = Habit.objects.select_for_update().only(*HABIT_STREAK_STATE_FIELDS, 'user', 'datetype', 'frequency', 'schedule_epoch').get(pk=habit.pk)
+        already_checked_in = locked_habit.last_log_date == today
+        if not already_checked_in:
+            if locked_habit.last_log_date is not None and settings.HABITS_STORE_FORGOT_TO_MARK_LOGS:
+                set_habit_logs_status_forgot_to_mark(locked_habit, locked_habit.last_log_date, today)
+            update_habit_streak(locked_habit, today, status)
+            habit_log = HabitLog.objects.create(habit=habit, epoch=locked_habit.schedule_epoch, comment=comment, status=status, date=today)
+    # исключение выбрасывается уже после выхода из блока atomic, чтобы не помечать внешнюю транзакцию к откату
+    if already_checked_in:
+        raise HabitAlreadyCheckedIn(locked_habit.last_log_date)
+    for field in [*HABIT_STREAK_STATE_FIELDS, 'updated_at']:
+        setattr(habit, field, getattr(locked_habit, field))
+    return habit_log
+
+
+def check_in_habits(user, check_ins, today=None):
+    '''
+        Check-in нескольких привычек пользователя за один запрос: check_ins - словари {habit_id, status, comment}.
+        Тот же результат, что и check_in_habit для каждой из них, но за постоянное кол-во запросов: принадлежность пользователю проверяется,
+        а строки привычек блокируются одним SELECT ... FOR UPDATE (в порядке id, чтобы параллельные запросы не ждали друг друга по кругу),
+        пропущенные дни и новые логи записываются bulk_create, счётчики всех привычек - одним bulk_update.
+        Возвращает результат для каждого элемента check_ins в том же порядке: созданный лог, HabitAlreadyCheckedIn или Habit.DoesNotExist.
+    '''
+    if today is None:
+        today = get_local_now_date()
+    results = []
+    with transaction.atomic(savepoint=False):
+        habits = Habit.objects.select_for_update().filter(user=user, pk__in={check_in['habit_id'] for check_in in check_ins})
+        habits = {habit.pk: habit for habit in habits.only(*HABIT_STREAK_STATE_FIELDS, 'user', 'datetype', 'frequency', 'schedule_epoch').order_by('pk')}
+        missed_habit_logs = []
+        habit_logs = []
+        checked_in_habits = []
+        for check_in in check_ins:
+            habit = habits.get(check_in['habit_id'])
+            if habit is None:
+                results.append(Habit.DoesNotExist(check_in['habit_id']))
+                continue
+            if habit.last_log_date == today: # в том числе повтор привычки в одном запросе
+                results.append(HabitAlreadyCheckedIn(habit.last_log_date))
+                continue
+            if habit.last_log_date is not None and settings.HABITS_STORE_FORGOT_TO_MARK_LOGS:
+                missed_habit_logs.append(generate_missed_habit_logs(habit, habit.last_log_date, today))
+            apply_habit_log_to_streak_state(habit, today, check_in['status'])
+            habit_log = HabitLog(habit=habit, epoch=habit.schedule_epoch, comment=check_in['comment'], status=check_in['status'], date=today)
+            habit_logs.append(habit_log)
+            checked_in_habits.append(habit)
+            results.append(habit_log)
+        bulk_create_forgot_to_mark_habit_logs(chain.from_iterable(missed_habit_logs))
+        HabitLog.objects.bulk_create(habit_logs)
+        now = timezone.now()
+        for habit in checked_in_habits:
+            habit.updated_at = now
+        Habit.objects.bulk_update(checked_in_habits, [*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+    # bulk_create и bulk_update не отправляют сигналов, поэтому кэш ответов сбрасывается здесь
+    if checked_in_habits:
+        invalidate_user_responses(user.pk)
+    return results
+
+
+def process_check_in_queue(batch_size=CHECK_IN_QUEUE_BATCH_SIZE):
+    '''
+        Обрабатывает пачку асинхронных check-in (HabitCheckInRequest). Воркер забирает до batch_size привычек с необработанными запросами
+        одним запросом SELECT ... ORDER BY id самого старого запроса LIMIT batch_size FOR UPDATE SKIP LOCKED: привычки, заблокированные другим воркером,
+        пропускаются, и вместо них берутся следующие по очереди, поэтому параллельные воркеры обрабатывают разные привычки,
+        а запросы одной привычки всегда обрабатывает один воркер по порядку id. Все запросы заблокированных привычек применяются как check_in_habit
+        за день приёма запроса, а записываются разом: пропущенные дни и логи - bulk_create, счётчики каждой привычки - одним bulk_update.
+        Запрос за день, который уже отмечен (или раньше последнего лога), помечается ошибкой. Привычки с необработанными запросами
+        ночной переход пропускает (см. rollover_habits), поэтому запрос, принятый до полуночи, а обработанный после, не упирается в лог forgot_to_mark.
+        Возвращает кол-во обработанных запросов.
+    '''
+    pending_check_ins = HabitCheckInRequest.objects.filter(state=HABIT_CHECK_IN_STATE_PENDING)
+    oldest_check_in_ids = pending_check_ins.filter(habit=OuterRef('pk')).order_by('id').values('id')[:1]
+    with transaction.atomic():
+        habits = (
+            Habit.objects.select_for_update(skip_locked=True).filter(pk__in=pending_check_ins.values('habit_id'))
+            .annotate(oldest_check_in_id=Subquery(oldest_check_in_ids)).order_by('oldest_check_in_id')
+            .only(*HABIT_STREAK_STATE_FIELDS, 'user', 'datetype', 'frequency', 'schedule_epoch')[:batch_size]
+        )
+        habits = {habit.pk: habit for habit in habits}
+        # запросы читаются после блокировки привычек, поэтому запросы, уже обработанные другим воркером, сюда не попадут
+        check_ins = list(pending_check_ins.filter(habit__in=habits).order_by('habit_id', 'id'))
+        missed_habit_logs = []
+        habit_logs = []
+        checked_in_habits = {}
+        now = timezone.now()
+        for check_in in check_ins:
+            habit = habits[check_in.habit_id]
+            check_in.processed_at = now
+            if habit.last_log_date is not None and habit.last_log_date >= check_in.date:
+                check_in.state = HABIT_CHECK_IN_STATE_FAILED
+                check_in.error = f'The habit already has a log for {check_in.date} or a later date ({habit.last_log_date}).'
+                continue
+            if habit.last_log_date is not None and settings.HABITS_STORE_FORGOT_TO_MARK_LOGS:
+                missed_habit_logs.append(generate_missed_habit_logs(habit, habit.last_log_date, check_in.date))
+            apply_habit_log_to_streak_state(habit, check_in.date, check_in.status)
+            habit.updated_at = now
+            checked_in_habits[habit.pk] = habit
+            habit_logs.append(HabitLog(habit=habit, epoch=habit.schedule_epoch, comment=check_in.comment, status=check_in.status, date=check_in.date))
+            check_in.state = HABIT_CHECK_IN_STATE_DONE
+        bulk_create_forgot_to_mark_habit_logs(chain.from_iterable(missed_habit_logs))
+        HabitLog.objects.bulk_create(habit_logs)
+        created_habit_logs = iter(habit_logs)
+        for check_in in check_ins:
+            if check_in.state == HABIT_CHECK_IN_STATE_DONE:
+                check_in.habit_log_id = next(created_habit_logs).pk
+        Habit.objects.bulk_update(checked_in_habits.values(), [*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+        HabitCheckInRequest.objects.bulk_update(check_ins, ['state', 'habit_log_id', 'error', 'processed_at'])
+    # bulk_create и bulk_update не отправляют сигналов, поэтому кэш ответов сбрасывается здесь
+    invalidate_user_responses(*(habit.user_id for habit in checked_in_habits.values()))
+    return len(check_ins)
+
+
+def rollover_habits(first_user_id: int, last_user_id: int, today=None):
+    '''
+        Ночной переход на новый день для привычек пользователей с id из [first_user_id, last_user_id].
+        Для привычек без лога за вчера заполняет пропущенные дни логами forgot_to_mark и учитывает их в счётчиках так же, как это сделал бы следующий check-in:
+        обнуляет прерванный ежедневный streak и подводит итоги закончившихся недель. Повторный запуск за тот же день ничего не меняет.
+        Привычки с необработанными асинхронными check-in пропускаются: пропущенные дни заполнит воркер очереди при обработке запроса (см. process_check_in_queue).
+        Возвращает кол-во обновлённых привычек.
+    '''
+    if today is None:
+        today = get_local_now_date()
+    yesterday = today - timedelta(days=1)
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            return _rollover_habits_with_sql(first_user_id, last_user_id, today)
+        habits = (
+            Habit.objects.select_for_update()
+            .filter(user__gte=first_user_id, user__lte=last_user_id, last_log_date__lt=yesterday)
+            .exclude(Exists(HabitCheckInRequest.objects.filter(habit=OuterRef('pk'), state=HABIT_CHECK_IN_STATE_PENDING)))
+            .only(*HABIT_STREAK_STATE_FIELDS, 'user', 'datetype', 'frequency', 'schedule_epoch')
+        )
+        rolled_over_habits = []
+        now = timezone.now()
+        for habit in habits:
+            if settings.HABITS_STORE_FORGOT_TO_MARK_LOGS:
+                set_habit_logs_status_forgot_to_mark(habit, habit.last_log_date, today)
+            apply_habit_log_to_streak_state(habit, yesterday, HABIT_LOG_STATUS_FORGOT_TO_MARK)
+            habit.updated_at = now
+            rolled_over_habits.append(habit)
+        Habit.objects.bulk_update(rolled_over_habits, [*HABIT_STREAK_STATE_FIELDS, 'updated_at'], batch_size=ROLLOVER_BATCH_SIZE)
+    # bulk_update не отправляет post_save, поэтому кэш ответов владельцев сбрасывается здесь
+    invalidate_user_responses(*(habit.user_id for habit in rolled_over_habits))
+    return len(rolled_over_habits)
+
+def _rollover_habits_with_sql(first_user_id: int, last_user_id: int, today):
+    '''
+        То же, что rollover_habits, двумя запросами на весь диапазон пользователей: INSERT ... SELECT generate_series для пропущенных дней
+        и UPDATE счётчиков, повторяющий apply_habit_log_to_streak_state для лога forgot_to_mark за вчера.
+        Условие last_log_date < вчера проверяется и в самом UPDATE, поэтому привычка, отмеченная параллельным check-in, не перезаписывается.
+    '''
+    habit_table = connection.ops.quote_name(Habit._meta.db_table)
+    habit_log_table = connection.ops.quote_name(HabitLog._meta.db_table)
+    check_in_request_table = connection.ops.quote_name(HabitCheckInRequest._meta.db_table)
+    params = {
+        'first_user_id': first_user_id,
+        'last_user_id': last_user_id,
+        'yesterday': today - timedelta(days=1),
+        'status': HABIT_LOG_STATUS_FORGOT_TO_MARK,
+        'comment': HABIT_LOG_FORGOT_TO_MARK_COMMENT,
+        'pending': HABIT_CHECK_IN_STATE_PENDING,
+    }
+    # привычки с необработанными check-in пропускаются, как и в rollover_habits
+    no_pending_check_ins = f'NOT EXISTS (SELECT 1 FROM {check_in_request_table} AS check_in WHERE check_in.habit_id = habit.id AND check_in.state = %(pending)s)'
+    with connection.cursor() as cursor:
+        if settings.HABITS_STORE_FORGOT_TO_MARK_LOGS:
+            cursor.execute(
+                f'''
+                    INSERT INTO {habit_log_table} (habit_id, epoch, status, date, comment)
+                    SELECT habit.id, habit.schedule_epoch, %(status)s, missed_date::date, %(comment)s
+                    FROM {habit_table} AS habit
+                    CROSS JOIN LATERAL generate_series(habit.last_log_date + 1, %(yesterday)s::date, interval '1 day') AS missed_date
+                    WHERE habit.user_id BETWEEN %(first_user_id)s AND %(last_user_id)s AND habit.last_log_date < %(yesterday)s::date
+                        AND {no_pending_check_ins}
+                    ON CONFLICT (habit_id, epoch, date) DO NOTHING
+                ''',
+                params
+            )
+        cursor.execute(
+            f'''
+                WITH habit_state AS (
+                    SELECT
+                        id, streak, period_start, period_complited, last_log_date,
+                        %(yesterday)s::date - period_start AS elapsed_days,
+                        CASE WHEN datetype = 'weekly' THEN 7 ELSE 1 END AS period_length,
+                        CASE WHEN datetype = 'weekly' THEN frequency ELSE 1 END AS frequency
+                    FROM {habit_table} AS habit
+                    WHERE user_id BETWEEN %(first_user_id)s AND %(last_user_id)s AND last_log_date < %(yesterday)s::date AND {no_pending_check_ins}
+                ), rolled_over AS (
+                    SELECT
+                        id, period_length, frequency,
+                        CASE
+                            WHEN elapsed_days < period_length THEN streak
+                            WHEN elapsed_days >= 2 * period_length THEN 0
+                            WHEN last_log_date < period_start + period_length - 1 THEN
+                                CASE WHEN period_complited >= frequency THEN streak + 1 ELSE 0 END
+                            ELSE streak
+                        END AS streak,
+                        CASE
+                            WHEN elapsed_days < period_length THEN period_start
+                            ELSE period_start + elapsed_days / period_length * period_length
+                        END AS period_start,
+                        CASE WHEN elapsed_days < period_length THEN period_complited ELSE 0 END AS period_complited
+                    FROM habit_state
+                )
+                UPDATE {habit_table} AS habit SET
+                    streak = CASE
+                        WHEN %(yesterday)s::date - rolled_over.period_start = rolled_over.period_length - 1 THEN
+                            CASE WHEN rolled_over.period_complited >= rolled_over.frequency THEN rolled_over.streak + 1 ELSE 0 END
+                        ELSE rolled_over.streak
+                    END,
+                    period_start = rolled_over.period_start,
+                    period_complited = rolled_over.period_complited,
+                    last_log_date = %(yesterday)s::date,
+                    updated_at = now()
+                FROM rolled_over
+                WHERE habit.id = rolled_over.id AND habit.last_log_date < %(yesterday)s::date
+                RETURNING habit.user_id
+            ''',
+            params
+        )
+        user_ids = [user_id for user_id, in cursor.fetchall()]
+    invalidate_user_responses(*user_ids)
+    return len(user_ids)
+
+def purge_habit_logs_of_past_epochs(batch_size=PURGE_BATCH_SIZE):
+    '''
+        Удаляет логи прошлых расписаний привычек (см. start_new_habit_schedule_epoch) пачками по batch_size,
+        каждая пачка в отдельной транзакции, чтобы не держать долгих блокировок. Возвращает кол-во удалённых логов.
+        Очистка идёт по привычкам, расписание которых менялось: логи каждой из них выбираются по индексу (habit, epoch, date),
+        а не сравнением epoch со schedule_epoch привычки для всей таблицы логов.
+    '''
+    deleted = 0
+    for habit in Habit.objects.filter(schedule_epoch__gt=0).only('schedule_epoch').order_by('pk').iterator():
+        deleted += delete_in_batches(HabitLog.objects.of_past_epochs(habit), batch_size)
+    return deleted
+
+def save_habit_log(habit_log: HabitLog):
+    '''
+        Сохраняет лог, изменённый в обход check-in (например, в админке). Если лог относится к текущему расписанию, streak и счётчики привычки
+        пересчитываются по истории, а закрытая неделя лога удаляется из кэша. Habit.updated_at обновляется в любом случае -
+        изменения логов видны /api/sync/ только через время изменения привычки.
+    '''
+    with transaction.atomic():
+        habit = Habit.objects.select_for_update().get(pk=habit_log.habit_id)
+        habit_log.habit = habit
+        habit_log.save()
+        if habit_log.epoch == habit.schedule_epoch:
+            # недели считаются от начала периода до пересчёта streak, как и в delete_habit_logs
+            if habit.period_start is not None:
+                invalidate_habit_weeks_cache(habit, habit_log.date, habit_log.date)
+            rebuild_habit_streak(habit, commit=False)
+        habit.save(update_fields=[*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+
+def delete_habit_logs(habit_logs):
+    '''
+        Удаляет выбранные логи (например, в админке) так же, как их изменение: streak и счётчики привычек пересчитываются по оставшейся истории,
+        Habit.updated_at обновляется, а удаление записывается в HabitTombstone - по ним /api/sync/ сообщает клиентам об удалённых логах.
+        Закрытые недели с удалёнными логами удаляются из кэша. Возвращает кол-во удалённых логов.
+    '''
+    habit_logs = list(habit_logs.select_related('habit').order_by('habit_id', 'date'))
+    if not habit_logs:
+        return 0
+    with transaction.atomic():
+        habits = {habit.pk: habit for habit in Habit.objects.select_for_update().filter(pk__in={habit_log.habit_id for habit_log in habit_logs}).order_by('pk')}
+        for habit_log in habit_logs:
+            habit = habits[habit_log.habit_id]
+            # недели считаются от начала периода до пересчёта streak - так же, как при записи в кэш
+            if habit.period_start is not None and habit_log.epoch == habit.schedule_epoch:
+                invalidate_habit_weeks_cache(habit, habit_log.date, habit_log.date)
+        deleted = HabitLog.objects.filter(pk__in=[habit_log.pk for habit_log in habit_logs]).delete()[0]
+        HabitTombstone.objects.bulk_create(
+            HabitTombstone(user_id=habits[habit_log.habit_id].user_id, habit_id=habit_log.habit_id, habit_log_id=habit_log.pk) for habit_log in habit_logs
+        )
+        now = timezone.now()
+        for habit in habits.values():
+            rebuild_habit_streak(habit, commit=False)
+            habit.updated_at = now
+        Habit.objects.bulk_update(habits.values(), [*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+    invalidate_user_responses(*(habit.user_id for habit in habits.values()))
+    return deleted
+
+def delete_in_batches(queryset, batch_size=PURGE_BATCH_SIZE):
+    '''
+        Удаляет строки queryset пачками запросами DELETE ... WHERE id IN (SELECT id ... LIMIT batch_size), не загружая их в память.
+        Удаление за один запрос возможно, только если у модели нет сигналов удаления и каскадно удаляемых связей - иначе Django соберёт строки сам.
+        Возвращает кол-во удалённых строк.
+    '''
+    deleted = 0
+    while True:
+        batch_deleted = queryset.filter(pk__in=Subquery(queryset.values('pk')[:batch_size])).delete()[0]
+        if not batch_deleted:
+            return deleted
+        deleted += batch_deleted
+
+def purge_expired_records(now=None, batch_size=PURGE_BATCH_SIZE):
+    '''
+        Удаляет служебные записи с истёкшим сроком хранения (HabitTombstone, HabitLogIdempotencyKey, обработанные HabitCheckInRequest) пачками.
+        Возвращает кол-во удалённых записей
+    '''
+    if now is None:
+        now = timezone.now()
+    expired_records = [
+        HabitTombstone.objects.filter(deleted_at__lt=now - HABIT_TOMBSTONE_RETENTION),
+        HabitLogIdempotencyKey.objects.filter(creation_date__lt=now - IDEMPOTENCY_KEY_RETENTION),
+        HabitCheckInRequest.objects.exclude(state=HABIT_CHECK_IN_STATE_PENDING).filter(processed_at__lt=now - CHECK_IN_REQUEST_RETENTION),
+    ]
+    return sum(delete_in_batches(queryset, batch_size) for queryset in expired_records)
+
+def delete_habit_logs_in_batches(habit: Habit, using='default', batch_size=DELETE_BATCH_SIZE):
+    '''
+        Удаляет все логи привычки пачками по batch_size (см. delete_in_batches): у HabitLog нет сигналов удаления,
+        поэтому id логов не загружаются в память и её расход не зависит от длины истории. Возвращает кол-во удалённых логов.
+    '''
+    return delete_in_batches(HabitLog.objects.using(using).filter(habit=habit), batch_size)
+
+def import_habit_history(user, records, chunk_size=IMPORT_CHUNK_SIZE):
+    '''
+        Импорт привычек и их истории с явными датами (из других трекеров или /api/export/) в одной транзакции.
+        records - проверенные записи (номер строки, тип, данные) в порядке файла: привычки ('habit', id - ссылка на неё в файле)
+        и логи ('habit_log', habit - ссылка на привычку из файла или id существующей привычки пользователя).
+        Записи читаются по одной, логи создаются bulk_create пачками по chunk_size, даты, для которых лог уже есть, пропускаются.
+        Пропущенные дни (если они хранятся в БД) и streak каждой затронутой привычки считаются один раз в конце, а не на каждую строку.
+        При ошибке выбрасывается HabitImportError, и ничего не сохраняется. Возвращает кол-во созданных привычек и прочитанных логов.
+        Привычки пользователя блокируются (в порядке id, как в check_in_habits) до конца импорта: иначе параллельный check-in или смена расписания
+        между чтением привычки и bulk_update были бы затёрты streak, посчитанным по устаревшему состоянию.
+    '''
+    imported_habits = {}
+    imported_dates = {} # привычка -> (первая, последняя) даты импортированных логов
+    habit_logs = []
+    habit_logs_count = 0
+    with transaction.atomic():
+        habits = {habit.pk: habit for habit in Habit.objects.select_for_update().filter(user=user).order_by('pk')}
+        for line_number, record_type, data in records:
+            if record_type == 'habit':
+                reference = data.pop('id')
+                imported_habits[reference] = Habit.objects.create(user=user, **data)
+                continue
+            habit = imported_habits.get(data['habit'], habits.get(data['habit']))
+            if habit is None:
+                raise HabitImportError(line_number, {'habit': [f'Unknown habit {data["habit"]}.']})
+            habit_logs.append(HabitLog(habit=habit, epoch=habit.schedule_epoch, date=data['date'], status=data['status'], comment=data['comment']))
+            first_date, last_date = imported_dates.get(habit, (data['date'], data['date']))
+            imported_dates[habit] = (min(first_date, data['date']), max(last_date, data['date']))
+            habit_logs_count += 1
+            if len(habit_logs) >= chunk_size:
+                HabitLog.objects.bulk_create(habit_logs, ignore_conflicts=True)
+                habit_logs = []
+        HabitLog.objects.bulk_create(habit_logs, ignore_conflicts=True)
+
+        now = timezone.now()
+        for habit, (first_date, last_date) in imported_dates.items():
+            if settings.HABITS_STORE_FORGOT_TO_MARK_LOGS:
+                _insert_forgot_to_mark_habit_logs_between(habit, first_date, last_date)
+            rebuild_habit_streak(habit, commit=False)
+            habit.updated_at = now # изменения логов видны /api/sync/ только через время изменения привычки
+        Habit.objects.bulk_update(imported_dates, [*HABIT_STREAK_STATE_FIELDS, 'updated_at'])
+    for habit, (first_date, last_date) in imported_dates.items():
+        invalidate_habit_weeks_cache(habit, first_date, last_date)
+    # bulk_create и bulk_update не отправляют сигналов, поэтому кэш ответов сбрасывается здесь
+    invalidate_user_responses(user.pk)
+    return len(imported_habits), habit_logs_count
+
+def _insert_forgot_to_mark_habit_logs_between(habit: Habit, first_date, last_date):
+    '''Создаёт логи forgot_to_mark за дни без логов с first_date по last_date - внутри импортированного отрезка истории'''
+    habit_logs = HabitLog.objects.for_habit(habit).filter(date__gte=first_date, date__lte=last_date).order_by('date').values('id', 'date', 'status', 'comment')
+    HabitLog.objects.bulk_create(
+        (
+            HabitLog(habit=habit, epoch=habit.schedule_epoch, date=habit_log['date'], status=habit_log['status'], comment=habit_log['comment'])
+            for habit_log in fill_habit_log_gaps(habit_logs) if habit_log['id'] is None
+        ),
+        batch_size=IMPORT_CHUNK_SIZE,
+        ignore_conflicts=True,
+    )
@@ -0,0 +1,43 @@
+from django.db import connections
+from django.db.models.signals import pre_delete, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_user_responses
+from .models import Habit, HabitLog, HabitTombstone
+from .services import delete_habit_logs_in_batches
+
+
+@receiver(pre_delete, sender=Habit)
+def delete_habit_logs(sender, instance, using, **kwargs):
+    '''
+        Удаляет логи привычки перед её удалением (DeleteHabit, HabitsViewSet.destroy, удаление пользователя).
+        В PostgreSQL их удаляет сама БД по ON DELETE CASCADE внешнего ключа, в остальных БД - пачками, без загрузки в память.
+    '''
+    if connections[using].vendor != 'postgresql':
+        delete_habit_logs_in_batches(instance, using)
+
+@receiver(post_delete, sender=Habit)
+def create_habit_tombstone(sender, instance, using, origin=None, **kwargs):
+    '''
+        Запоминает удалённую привычку для /api/sync/. При удалении пользователя запись не нужна -
+        синхронизировать больше некому, а его записи удаляются вместе с ним.
+    '''
+    if isinstance(origin, Habit) or getattr(origin, 'model', None) is Habit:
+        HabitTombstone.objects.using(using).create(user_id=instance.user_id, habit_id=instance.pk)
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def invalidate_habit_responses(sender, instance, **kwargs):
+    '''
+        Сбрасывает кэш ответов API владельца привычки (см. cache.py) при любом её сохранении, в том числе счётчиков streak при check-in.
+        Изменения в обход save() (bulk_update и SQL-запросы в rollover_habits) сбрасывают кэш сами
+    '''
+    invalidate_user_responses(instance.user_id)
+
+@receiver(post_save, sender=HabitLog)
+def invalidate_habit_log_responses(sender, instance, **kwargs):
+    '''
+        Обработчиков удаления у HabitLog нет, чтобы Django удалял логи одним запросом, не загружая их (см. delete_in_batches):
+        удаляющий логи код сам сбрасывает кэш ответов (delete_habit_logs, удаление привычки)
+    '''
+    invalidate_user_responses(instance.habit.user_id)
@@ -1,9 +1,9 @@
 from datetime import timedelta
 
 from django.contrib.auth import get_user_model
-from django.utils import timezone
 
-from ..models import Habit, HabitLog
+from ..models import Habit, HabitLog, get_local_now_date
+from ..helpers import recompute_habit_streak_state
 
 User = get_user_model()
 
@@ -24,12 +24,24 @@ def create_habit(owner, title: str, purpose: str, datetype: str, freq=1):
 def create_habit_log(habit, comment: str, status: bool, days_before=0):
     instance = HabitLog.objects.create(
         habit=habit, 
+        epoch=habit.schedule_epoch,
         comment=comment, 
         status=status, 
-        date=timezone.localtime(timezone.now()) + timedelta(days=-days_before)
+        date=get_local_now_date() - timedelta(days=days_before)
     )
+    sync_habit_period_counters(habit)
     return instance
 
+def sync_habit_period_counters(habit):
+    '''
+        Логи в тестах создаются напрямую, минуя check-in, поэтому счётчики текущего периода пересчитываются по истории.
+        Значение streak тесты выставляют сами, поэтому оно не меняется
+    '''
+    streak = habit.streak
+    recompute_habit_streak_state(habit, HabitLog.objects.for_habit(habit).order_by('date').values_list('date', 'status'))
+    habit.streak = streak
+    habit.save(update_fields=['period_start', 'period_complited', 'last_log_date'])
+
 def generate_habit_input_data(title: str, datetype: str, purpose='', frequency=1):
     return {
         'title': title,
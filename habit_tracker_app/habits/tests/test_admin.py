@@ -0,0 +1,58 @@
+from django.contrib import admin
+from django.test import TestCase
+
+from .factories import create_user, create_habit, create_habit_log
+from ..admin import HabitLogAdmin
+from ..helpers import rebuild_habit_streak, start_new_habit_schedule_epoch
+from ..models import Habit, HabitLog, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED
+
+
+class HabitLogAdminTests(TestCase):
+    def setUp(self):
+        self.user = create_user('admin_habit_log_admin', 'password123_habit_log_admin')
+        self.habit = create_habit(self.user, 'Habit admin', 'habit admin purpose', 'daily')
+        self.model_admin = HabitLogAdmin(HabitLog, admin.site)
+
+    def save_log(self, habit_log, change=True):
+        self.model_admin.save_model(None, habit_log, None, change)
+
+    def test_status_change_rebuilds_streak(self):
+        '''Проверка, что после смены статуса лога в админке streak и счётчики привычки пересчитываются по истории'''
+        create_habit_log(self.habit, 'Log 2 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=2)
+        habit_log = create_habit_log(self.habit, 'Log 1 day ago', HABIT_LOG_STATUS_INCOMPLITED, days_before=1)
+        rebuild_habit_streak(self.habit)
+
+        habit_log.status = HABIT_LOG_STATUS_COMPLITED
+        self.save_log(habit_log)
+        self.habit.refresh_from_db()
+
+        self.assertEqual(self.habit.streak, 2)
+        self.assertEqual(self.habit.last_log_date, habit_log.date)
+
+    def test_save_log_of_past_epoch(self):
+        '''Проверка, что лог прошлого расписания сохраняется в админке, а привычка попадает в /api/sync/'''
+        habit_log = create_habit_log(self.habit, 'Log 2 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=2)
+        start_new_habit_schedule_epoch(self.habit)
+        self.habit.save()
+        updated_at = Habit.objects.get(pk=self.habit.pk).updated_at
+
+        habit_log = HabitLog.objects.get(pk=habit_log.pk)
+        habit_log.comment = 'Edited in admin'
+        self.save_log(habit_log)
+
+        self.assertEqual(HabitLog.objects.get(pk=habit_log.pk).comment, 'Edited in admin')
+        self.assertGreater(Habit.objects.get(pk=self.habit.pk).updated_at, updated_at)
+
+    def test_added_log_gets_current_epoch(self):
+        '''Проверка, что лог, добавленный в админке после смены расписания, относится к текущему расписанию и учитывается в streak'''
+        create_habit_log(self.habit, 'Log 1 day ago', HABIT_LOG_STATUS_COMPLITED, days_before=1)
+        start_new_habit_schedule_epoch(self.habit)
+        self.habit.save()
+
+        habit_log = HabitLog(habit=self.habit, status=HABIT_LOG_STATUS_COMPLITED, comment='Added in admin')
+        self.save_log(habit_log, change=False)
+        self.habit.refresh_from_db()
+
+        self.assertEqual(habit_log.epoch, 1)
+        self.assertEqual(list(HabitLog.objects.for_habit(self.habit)), [habit_log])
+        self.assertEqual(self.habit.last_log_date, habit_log.date)
@@ -1,8 +1,11 @@
+from datetime import timedelta
+
 from django.test import TestCase
 from django.urls import reverse
 
 from .factories import create_user, create_habit, create_habit_log, generate_habit_log_data
-from ..models import Habit, HabitLog, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED
+from ..models import Habit, HabitLog, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, get_local_now_date
+from ..helpers import set_habit_logs_status_forgot_to_mark, update_habit_streak, rebuild_habit_streak, get_habit_week_summaries, fill_habit_log_gaps
 
 
 class HabitHelpersTests(TestCase):
@@ -35,6 +38,78 @@ class HabitHelpersTests(TestCase):
         self.assertTrue(HabitLog.objects.filter(status='forgot_to_mark').exists())
         self.assertEqual(HabitLog.objects.filter(status='forgot_to_mark').count(), days_before-1)
 
+    def test_creation_habitlogs_with_status_forgot_to_mark_is_idempotent(self):
+        '''Проверка, что повторный вызов set_habit_logs_status_forgot_to_mark не создаёт дубликаты логов со статусом forgot_to_mark'''
+        last_habit_log = create_habit_log(self.habit_daily, 'New log', HABIT_LOG_STATUS_INCOMPLITED, 10)
+
+        set_habit_logs_status_forgot_to_mark(self.habit_daily, last_habit_log.date)
+        set_habit_logs_status_forgot_to_mark(self.habit_daily, last_habit_log.date)
+        forgot_to_mark_dates = list(HabitLog.objects.filter(habit=self.habit_daily, status=HABIT_LOG_STATUS_FORGOT_TO_MARK).values_list('date', flat=True))
+
+        self.assertEqual(len(forgot_to_mark_dates), 9)
+        self.assertEqual(len(set(forgot_to_mark_dates)), 9)
+        self.assertEqual(forgot_to_mark_dates[-1], get_local_now_date() - timedelta(days=1))
+
+    def test_creation_habitlogs_with_status_forgot_to_mark_query_count_does_not_grow_with_gap(self):
+        '''Проверка, что кол-во запросов к БД при заполнении пропусков не зависит от длины пропуска'''
+        today = get_local_now_date()
+
+        with self.assertNumQueries(1):
+            set_habit_logs_status_forgot_to_mark(self.habit_daily, today - timedelta(days=5), today)
+        with self.assertNumQueries(1):
+            set_habit_logs_status_forgot_to_mark(self.habit_weekly, today - timedelta(days=150), today)
+
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_daily).count(), 4)
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_weekly).count(), 149)
+
+    def test_habit_week_summaries_are_aggregated_from_first_log(self):
+        '''Проверка, что логи еженедельной привычки агрегируются в БД по неделям, отсчитываемым от первого лога, с кол-вом логов каждого статуса'''
+        for days_before in range(1, 11):
+            status = HABIT_LOG_STATUS_COMPLITED if days_before % 2 else HABIT_LOG_STATUS_INCOMPLITED
+            create_habit_log(self.habit_weekly, f'New log {days_before}', status, days_before)
+        HabitLog.objects.filter(habit=self.habit_weekly, date=get_local_now_date() - timedelta(days=2)).update(status=HABIT_LOG_STATUS_FORGOT_TO_MARK)
+        first_log_date = get_local_now_date() - timedelta(days=10)
+
+        with self.assertNumQueries(1):
+            weeks = get_habit_week_summaries(self.habit_weekly, HabitLog.objects.filter(habit=self.habit_weekly))
+
+        self.assertEqual([week['start'] for week in weeks], [first_log_date, first_log_date + timedelta(days=7)])
+        self.assertEqual([week['total'] for week in weeks], [7, 3])
+        self.assertEqual([week['complited'] for week in weeks], [3, 2])
+        self.assertEqual([week['incomplited'] for week in weeks], [4, 0])
+        self.assertEqual([week['forgot_to_mark'] for week in weeks], [0, 1])
+        self.assertEqual([week['is_closed'] for week in weeks], [True, False])
+
+    def test_habit_week_summaries_count_missed_days_not_stored_in_db(self):
+        '''Проверка, что итоги недель одинаковы, если пропущенные дни записаны в БД логами forgot_to_mark и если они не хранятся'''
+        habit_weekly_stored = create_habit(self.user, 'Habit weekly stored test habit_helpers', 'habit helpers purpose', 'weekly', 2)
+        for habit in (self.habit_weekly, habit_weekly_stored):
+            create_habit_log(habit, 'Old log', HABIT_LOG_STATUS_COMPLITED, 20)
+            create_habit_log(habit, 'New log', HABIT_LOG_STATUS_INCOMPLITED, 1)
+        set_habit_logs_status_forgot_to_mark(habit_weekly_stored, get_local_now_date() - timedelta(days=20), get_local_now_date() - timedelta(days=1))
+
+        weeks = get_habit_week_summaries(self.habit_weekly, HabitLog.objects.filter(habit=self.habit_weekly))
+        weeks_stored = get_habit_week_summaries(habit_weekly_stored, HabitLog.objects.filter(habit=habit_weekly_stored))
+
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_weekly).count(), 2)
+        self.assertEqual(weeks, weeks_stored)
+        self.assertEqual([week['forgot_to_mark'] for week in weeks], [6, 7, 5])
+        self.assertEqual([week['is_closed'] for week in weeks], [True, True, False])
+
+    def test_fill_habit_log_gaps_generates_forgot_to_mark_logs_between_logs(self):
+        '''Проверка, что пропущенные дни между логами достраиваются логами forgot_to_mark без id в обоих порядках сортировки'''
+        create_habit_log(self.habit_daily, 'Old log', HABIT_LOG_STATUS_COMPLITED, 5)
+        create_habit_log(self.habit_daily, 'New log', HABIT_LOG_STATUS_COMPLITED, 1)
+        habit_logs = HabitLog.objects.filter(habit=self.habit_daily)
+
+        filled = list(fill_habit_log_gaps(habit_logs.values('id', 'date', 'status', 'comment')))
+        filled_newest_first = list(fill_habit_log_gaps(habit_logs.order_by('-date').values('id', 'date', 'status', 'comment'), newest_first=True))
+
+        self.assertEqual([habit_log['date'] for habit_log in filled], [get_local_now_date() - timedelta(days=days_before) for days_before in range(5, 0, -1)])
+        self.assertEqual([habit_log['status'] for habit_log in filled], [HABIT_LOG_STATUS_COMPLITED] + [HABIT_LOG_STATUS_FORGOT_TO_MARK] * 3 + [HABIT_LOG_STATUS_COMPLITED])
+        self.assertEqual([habit_log['id'] for habit_log in filled[1:4]], [None] * 3)
+        self.assertEqual(filled_newest_first, filled[::-1])
+
     def test_increase_streak_for_habit_datetype_daily_with_no_logs_added_before(self):
         '''Проверка увеличения поля streak при создании лога у ежедневной привычки, у которой до этого не было логов. При этом статус созданного лога - complited'''
         habit = Habit.objects.get(datetype='daily')
@@ -162,4 +237,65 @@ class HabitHelpersTests(TestCase):
         self.client.login(username=self.username1, password=self.password1)
         self.client.post(url_status_complited, data)
 
-        self.assertEqual(Habit.objects.get(datetype='weekly').streak, 0)
\ No newline at end of file
+        self.assertEqual(Habit.objects.get(datetype='weekly').streak, 0)
+
+class HabitStreakEngineTests(TestCase):
+    def setUp(self):
+        self.user = create_user('admin1_streak_engine', 'password123_streak_engine')
+        self.habit_weekly = create_habit(self.user, 'Habit weekly test streak engine', 'streak engine purpose', 'weekly', 2)
+        self.habit_daily = create_habit(self.user, 'Habit every day test streak engine', 'streak engine purpose', 'daily')
+
+    def check_in(self, habit, statuses_by_days_before):
+        '''Создаёт логи так же, как check-in: сначала обновляет счётчики привычки, затем сохраняет лог'''
+        today = get_local_now_date()
+        for days_before, status in statuses_by_days_before:
+            date = today - timedelta(days=days_before)
+            update_habit_streak(habit, date, status)
+            HabitLog.objects.create(habit=habit, comment='log', status=status, date=date)
+
+    def test_update_habit_streak_does_not_read_habit_logs(self):
+        '''Проверка, что обновление streak выполняет один UPDATE независимо от длины истории'''
+        self.check_in(self.habit_daily, [(days_before, HABIT_LOG_STATUS_COMPLITED) for days_before in range(60, 0, -1)])
+
+        with self.assertNumQueries(1):
+            update_habit_streak(self.habit_daily, get_local_now_date(), HABIT_LOG_STATUS_COMPLITED)
+
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, 61)
+
+    def test_daily_streak_restarts_after_missed_days(self):
+        '''Проверка, что пропущенный день обнуляет streak ежедневной привычки, а следующий выполненный день начинает его заново'''
+        self.check_in(self.habit_daily, [(6, HABIT_LOG_STATUS_COMPLITED), (5, HABIT_LOG_STATUS_COMPLITED), (2, HABIT_LOG_STATUS_COMPLITED), (1, HABIT_LOG_STATUS_COMPLITED)])
+
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, 2)
+
+    def test_weekly_streak_counts_weeks_with_enough_complited_logs(self):
+        '''Проверка, что streak еженедельной привычки растёт за каждую неделю, где логов complited >= frequency, и обнуляется за неделю, где их меньше'''
+        statuses = [HABIT_LOG_STATUS_COMPLITED if day % 7 in (0, 3) else HABIT_LOG_STATUS_INCOMPLITED for day in range(14)]
+        statuses += [HABIT_LOG_STATUS_INCOMPLITED for _ in range(7)]
+        statuses += [HABIT_LOG_STATUS_COMPLITED for _ in range(7)]
+        self.check_in(self.habit_weekly, [(len(statuses) - day, status) for day, status in enumerate(statuses)])
+
+        self.assertEqual(Habit.objects.get(pk=self.habit_weekly.pk).streak, 1)
+
+    def test_rebuild_habit_streak_matches_incremental_state(self):
+        '''Проверка, что пересчёт streak по всей истории совпадает с инкрементально посчитанными счётчиками'''
+        statuses = [HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_COMPLITED]
+        history = [(days_before, statuses[days_before % len(statuses)]) for days_before in range(40, 0, -1) if days_before % 9 != 0]
+        self.check_in(self.habit_weekly, history)
+        self.check_in(self.habit_daily, history)
+
+        for habit in (self.habit_weekly, self.habit_daily):
+            habit = Habit.objects.get(pk=habit.pk)
+            self.assertFalse(rebuild_habit_streak(habit))
+
+    def test_rebuild_habit_streak_fixes_stale_state(self):
+        '''Проверка, что пересчёт восстанавливает streak и счётчики, если они разошлись с историей логов'''
+        self.check_in(self.habit_daily, [(2, HABIT_LOG_STATUS_COMPLITED), (1, HABIT_LOG_STATUS_COMPLITED)])
+        Habit.objects.filter(pk=self.habit_daily.pk).update(streak=10, period_start=None)
+
+        habit = Habit.objects.get(pk=self.habit_daily.pk)
+        self.assertTrue(rebuild_habit_streak(habit))
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.streak, 2)
+        self.assertEqual(habit.last_log_date, get_local_now_date() - timedelta(days=1))
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+
+from .factories import create_user, create_habit
+from ..models import Habit, HabitLog, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, get_local_now_date
+
+HABITS_COUNT = 20
+DAYS_COUNT = 365
+
+
+class HabitIndexesTests(TestCase):
+    '''
+        Проверка, что горячие запросы к Habit и HabitLog используют составные индексы.
+        Миллионы строк в тестовой БД не создаются: на PostgreSQL последовательное сканирование отключается,
+        чтобы планировщик выбирал план так же, как на больших таблицах.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('admin_indexes', 'password123_indexes')
+        other_user = create_user('admin2_indexes', 'password123_indexes')
+        Habit.objects.bulk_create([Habit(user=other_user, title=f'Other habit {i}') for i in range(HABITS_COUNT)])
+        cls.habit = create_habit(cls.user, 'Habit indexes', 'habit indexes purpose', 'daily')
+        statuses = [HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK]
+        today = get_local_now_date()
+        HabitLog.objects.bulk_create(
+            HabitLog(habit=habit, comment='log', status=statuses[day % len(statuses)], date=today - timedelta(days=day))
+            for habit in Habit.objects.all() for day in range(DAYS_COUNT)
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            elif connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+
+    def assertQueryUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(self.get_backing_index_name(queryset.model, index_name), plan)
+
+    def get_backing_index_name(self, model, index_name):
+        '''SQLite создаёт уникальные ограничения как часть таблицы, и в плане запроса виден автоматически созданный для них индекс'''
+        constraint = next((c for c in model._meta.constraints if c.name == index_name), None)
+        if connection.vendor != 'sqlite' or constraint is None:
+            return index_name
+        columns = [model._meta.get_field(field).column for field in constraint.fields]
+        with connection.cursor() as cursor:
+            for _, name, unique, origin, _ in cursor.execute(f'PRAGMA index_list({model._meta.db_table})').fetchall():
+                if unique and origin == 'u':
+                    index_columns = [row[2] for row in cursor.execute(f'PRAGMA index_info({name})').fetchall()]
+                    if index_columns == columns:
+                        return name
+        return index_name
+
+    def test_habit_logs_ordered_by_date_use_unique_habit_epoch_date_index(self):
+        '''Проверка, что выборка логов текущего расписания привычки, отсортированных по дате, использует уникальный индекс (habit, epoch, date)'''
+        self.assertQueryUsesIndex(HabitLog.objects.for_habit(self.habit), 'habitlog_unique_habit_epoch_date')
+        self.assertQueryUsesIndex(HabitLog.objects.for_habit(self.habit).order_by('-date')[:1], 'habitlog_unique_habit_epoch_date')
+
+    def test_user_habits_ordered_by_creation_date_use_user_creation_date_index(self):
+        '''Проверка, что список привычек пользователя, отсортированный по дате создания, использует индекс (user, -creation_date)'''
+        self.assertQueryUsesIndex(Habit.objects.filter(user=self.user), 'habit_user_creation_idx')
+
+    def test_habit_logs_of_past_epochs_use_unique_habit_epoch_date_index(self):
+        '''Проверка, что выборка логов прошлых расписаний привычки для очистки использует уникальный индекс (habit, epoch, date)'''
+        self.habit.schedule_epoch = 1
+        self.assertQueryUsesIndex(HabitLog.objects.of_past_epochs(self.habit).values('pk'), 'habitlog_unique_habit_epoch_date')
+
+    def test_not_complited_habit_logs_use_partial_index(self):
+        '''Проверка, что выборка невыполненных логов привычки использует частичный индекс'''
+        queryset = HabitLog.objects.for_habit(self.habit).exclude(status=HABIT_LOG_STATUS_COMPLITED)
+        self.assertQueryUsesIndex(queryset, 'habitlog_not_complited_idx')
@@ -0,0 +1,453 @@
+import json
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from .factories import create_user, create_habit, create_habit_log, generate_habit_log_data, sync_habit_period_counters
+from ..helpers import rebuild_habit_streak, start_new_habit_schedule_epoch
+from ..models import Habit, HabitLog, HabitLogIdempotencyKey, HabitTombstone, HabitCheckInRequest, HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_INCOMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK, get_local_now_date
+from ..services import check_in_habit, rollover_habits, purge_habit_logs_of_past_epochs, delete_habit_logs_in_batches, import_habit_history, process_check_in_queue, purge_expired_records, HabitAlreadyCheckedIn, HABIT_TOMBSTONE_RETENTION, IDEMPOTENCY_KEY_RETENTION, CHECK_IN_REQUEST_RETENTION
+
+# SELECT ... FOR UPDATE привычки, UPDATE привычки, INSERT лога + INSERT пропущенных дней
+CHECK_IN_QUERIES = 3
+CHECK_IN_WITH_GAP_QUERIES = CHECK_IN_QUERIES + 1
+# сессия и пользователь, привычка
+REQUEST_QUERIES = 3
+# в API check-in и сохранение Idempotency-Key выполняются в транзакции view; внутри TestCase это SAVEPOINT и RELEASE SAVEPOINT
+API_TRANSACTION_QUERIES = 2
+
+
+class CheckInServiceTests(TestCase):
+    def setUp(self):
+        self.username1 = 'admin_services'
+        self.password1 = 'password123_services'
+
+        self.user = create_user(self.username1, self.password1)
+        self.habit_weekly = create_habit(self.user, 'Habit weekly test services', 'habit services purpose', 'weekly', 2)
+        self.habit_daily = create_habit(self.user, 'Habit every day test services', 'habit services purpose', 'daily')
+
+    def test_check_in_habit_creates_log_for_today(self):
+        '''Проверка, что check-in создаёт лог за сегодня, заполняет пропущенные дни и обновляет streak'''
+        create_habit_log(self.habit_daily, 'Old log', HABIT_LOG_STATUS_COMPLITED, 3)
+
+        habit_log = check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+
+        self.assertEqual(habit_log.date, get_local_now_date())
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_daily, status=HABIT_LOG_STATUS_FORGOT_TO_MARK).count(), 2)
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, 1)
+
+    def test_check_in_habit_twice_a_day_is_not_allowed(self):
+        '''Проверка, что второй check-in за день не создаёт лог'''
+        check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+
+        with self.assertRaises(HabitAlreadyCheckedIn):
+            check_in_habit(self.habit_daily, HABIT_LOG_STATUS_INCOMPLITED, 'Log for today again')
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_daily).count(), 1)
+
+    def test_parallel_check_in_with_stale_habit_does_not_create_second_log(self):
+        '''Проверка, что параллельный check-in, прочитавший привычку до записи первого, не создаёт второй лог и не увеличивает streak повторно'''
+        stale_habit = Habit.objects.get(pk=self.habit_daily.pk)
+        check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'First request')
+
+        with self.assertRaises(HabitAlreadyCheckedIn):
+            check_in_habit(stale_habit, HABIT_LOG_STATUS_COMPLITED, 'Second request')
+
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_daily).count(), 1)
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, 1)
+
+    def test_check_in_after_schedule_change_starts_new_history(self):
+        '''Проверка, что после смены расписания логи прошлого расписания не учитываются, и за сегодня можно отметиться заново'''
+        create_habit_log(self.habit_weekly, 'Old log', HABIT_LOG_STATUS_COMPLITED, 1)
+        check_in_habit(self.habit_weekly, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+        start_new_habit_schedule_epoch(self.habit_weekly)
+        self.habit_weekly.save()
+
+        check_in_habit(self.habit_weekly, HABIT_LOG_STATUS_INCOMPLITED, 'Log for today in new schedule')
+
+        self.assertEqual(list(HabitLog.objects.for_habit(self.habit_weekly).values_list('comment', flat=True)), ['Log for today in new schedule'])
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_weekly).count(), 3)
+        self.assertFalse(rebuild_habit_streak(self.habit_weekly, commit=False))
+
+    def test_purge_habit_logs_of_past_epochs(self):
+        '''Проверка, что пачечная очистка удаляет только логи прошлых расписаний'''
+        for days_before in range(5, 0, -1):
+            create_habit_log(self.habit_weekly, 'Old log', HABIT_LOG_STATUS_COMPLITED, days_before)
+        create_habit_log(self.habit_daily, 'Daily log', HABIT_LOG_STATUS_COMPLITED, 1)
+        start_new_habit_schedule_epoch(self.habit_weekly)
+        self.habit_weekly.save()
+        check_in_habit(self.habit_weekly, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+
+        self.assertEqual(purge_habit_logs_of_past_epochs(batch_size=2), 5)
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_weekly).count(), 1)
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_daily).count(), 1)
+        call_command('purge_habit_epochs', stdout=StringIO())
+        self.assertEqual(HabitLog.objects.count(), 2)
+
+    def test_check_in_query_budget_does_not_depend_on_history(self):
+        '''Проверка, что check-in выполняет фиксированное кол-во запросов независимо от длины истории и пропуска'''
+        create_habit_log(self.habit_daily, 'Yesterday log', HABIT_LOG_STATUS_COMPLITED, 1)
+        for days_before in range(400, 150, -1):
+            HabitLog.objects.create(habit=self.habit_weekly, comment='log', status=HABIT_LOG_STATUS_COMPLITED, date=get_local_now_date() - timedelta(days=days_before))
+        create_habit_log(self.habit_weekly, 'Old log', HABIT_LOG_STATUS_COMPLITED, 150)
+
+        with self.assertNumQueries(CHECK_IN_QUERIES):
+            check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+        with self.assertNumQueries(CHECK_IN_WITH_GAP_QUERIES):
+            check_in_habit(self.habit_weekly, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+
+    def test_web_check_in_query_budget(self):
+        '''Проверка кол-ва запросов при создании лога через веб-приложение'''
+        create_habit_log(self.habit_daily, 'Yesterday log', HABIT_LOG_STATUS_COMPLITED, 1)
+        url = reverse('habits:set_habit_status_for_today', args=(self.habit_daily.id, ), query={'status': HABIT_LOG_STATUS_COMPLITED})
+        self.client.login(username=self.username1, password=self.password1)
+
+        with self.assertNumQueries(REQUEST_QUERIES + CHECK_IN_QUERIES):
+            response = self.client.post(url, generate_habit_log_data('Log for today', HABIT_LOG_STATUS_COMPLITED))
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_api_check_in_query_budget(self):
+        '''Проверка кол-ва запросов при создании лога через API'''
+        create_habit_log(self.habit_daily, 'Yesterday log', HABIT_LOG_STATUS_COMPLITED, 1)
+        client = APIClient()
+        client.login(username=self.username1, password=self.password1)
+
+        with self.assertNumQueries(REQUEST_QUERIES + API_TRANSACTION_QUERIES + CHECK_IN_QUERIES):
+            response = client.post(reverse('api:api_create_habit_log', args=(self.habit_daily.id, )), generate_habit_log_data('Log for today', HABIT_LOG_STATUS_COMPLITED))
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_check_in_without_storing_forgot_to_mark_logs(self):
+        '''Проверка, что без хранения логов forgot_to_mark check-in не записывает пропущенные дни, а streak и история в API такие же, как при их хранении'''
+        habit_daily_stored = create_habit(self.user, 'Habit every day stored test services', 'habit services purpose', 'daily')
+        for habit in (self.habit_daily, habit_daily_stored):
+            create_habit_log(habit, 'Old log', HABIT_LOG_STATUS_COMPLITED, 4)
+        check_in_habit(habit_daily_stored, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+        with override_settings(HABITS_STORE_FORGOT_TO_MARK_LOGS=False), self.assertNumQueries(CHECK_IN_QUERIES):
+            check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+        client = APIClient()
+        client.login(username=self.username1, password=self.password1)
+
+        habit_logs = client.get(reverse('api:habit-detail', args=(self.habit_daily.id, ))).data['habit_logs']
+        habit_logs_stored = client.get(reverse('api:habit-detail', args=(habit_daily_stored.id, ))).data['habit_logs']
+
+        self.assertFalse(HabitLog.objects.filter(habit=self.habit_daily, status=HABIT_LOG_STATUS_FORGOT_TO_MARK).exists())
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, Habit.objects.get(pk=habit_daily_stored.pk).streak)
+        self.assertEqual(
+            [(habit_log['status'], habit_log['comment']) for habit_log in habit_logs],
+            [(habit_log['status'], habit_log['comment']) for habit_log in habit_logs_stored],
+        )
+        self.assertEqual(len(habit_logs), 5)
+
+
+class RolloverServiceTests(TestCase):
+    def setUp(self):
+        self.user = create_user('admin_rollover', 'password123_rollover')
+        self.habit_weekly = create_habit(self.user, 'Habit weekly test rollover', 'habit rollover purpose', 'weekly', 2)
+        self.habit_daily = create_habit(self.user, 'Habit every day test rollover', 'habit rollover purpose', 'daily')
+
+    def rollover(self):
+        return rollover_habits(self.user.id, self.user.id)
+
+    def test_rollover_resets_broken_daily_streak_and_fills_missed_days(self):
+        '''Проверка, что ночной переход обнуляет прерванный ежедневный streak и заполняет пропущенные дни логами forgot_to_mark'''
+        for days_before in (5, 4, 3):
+            check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Old log', today=get_local_now_date() - timedelta(days=days_before))
+
+        self.assertEqual(self.rollover(), 1)
+
+        habit = Habit.objects.get(pk=self.habit_daily.pk)
+        self.assertEqual(habit.streak, 0)
+        self.assertEqual(habit.last_log_date, get_local_now_date() - timedelta(days=1))
+        self.assertEqual(HabitLog.objects.filter(habit=habit, status=HABIT_LOG_STATUS_FORGOT_TO_MARK).count(), 2)
+        self.assertFalse(rebuild_habit_streak(habit, commit=False))
+
+    def test_rollover_closes_finished_weekly_period(self):
+        '''Проверка, что ночной переход подводит итог закончившейся недели, последний день которой не был отмечен'''
+        for days_before in (9, 8):
+            check_in_habit(self.habit_weekly, HABIT_LOG_STATUS_COMPLITED, 'Old log', today=get_local_now_date() - timedelta(days=days_before))
+
+        self.rollover()
+
+        habit = Habit.objects.get(pk=self.habit_weekly.pk)
+        self.assertEqual(habit.streak, 1)
+        self.assertEqual(habit.period_start, get_local_now_date() - timedelta(days=2))
+        self.assertFalse(rebuild_habit_streak(habit, commit=False))
+
+    def test_rollover_is_idempotent_and_skips_habits_checked_in_yesterday(self):
+        '''Проверка, что привычки с логом за вчера не меняются, а повторный переход за тот же день ничего не делает'''
+        check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Yesterday log', today=get_local_now_date() - timedelta(days=1))
+        check_in_habit(self.habit_weekly, HABIT_LOG_STATUS_COMPLITED, 'Old log', today=get_local_now_date() - timedelta(days=3))
+
+        self.assertEqual(self.rollover(), 1)
+        self.assertEqual(self.rollover(), 0)
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, 1)
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_weekly).count(), 3)
+
+    def test_check_in_after_rollover_gives_same_streak(self):
+        '''Проверка, что check-in после ночного перехода даёт тот же streak, что и без него'''
+        habit_daily_without_rollover = create_habit(create_user('admin2_rollover', 'password123_rollover'), 'Habit without rollover', 'habit rollover purpose', 'daily')
+        for habit in (self.habit_daily, habit_daily_without_rollover):
+            check_in_habit(habit, HABIT_LOG_STATUS_COMPLITED, 'Old log', today=get_local_now_date() - timedelta(days=3))
+
+        self.rollover()
+        for habit in (self.habit_daily, habit_daily_without_rollover):
+            check_in_habit(habit, HABIT_LOG_STATUS_COMPLITED, 'Log for today')
+
+        self.assertEqual(Habit.objects.get(pk=self.habit_daily.pk).streak, Habit.objects.get(pk=habit_daily_without_rollover.pk).streak)
+        self.assertEqual(HabitLog.objects.filter(habit=self.habit_daily).count(), HabitLog.objects.filter(habit=habit_daily_without_rollover).count())
+
+    def test_rollover_command(self):
+        '''Проверка management-команды ночного перехода на заданную дату'''
+        check_in_habit(self.habit_daily, HABIT_LOG_STATUS_COMPLITED, 'Old log', today=get_local_now_date() - timedelta(days=3))
+        tomorrow = get_local_now_date() + timedelta(days=1)
+
+        call_command('rollover_habits', date=tomorrow, workers=1, stdout=StringIO())
+
+        habit = Habit.objects.get(pk=self.habit_daily.pk)
+        self.assertEqual(habit.last_log_date, get_local_now_date())
+        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 4)
+
+    def test_rollover_workers_module_imports_before_django_setup(self):
+        '''Проверка, что модуль функций пула импортируется до django.setup() - так его импортируют процессы, запущенные через spawn и forkserver'''
+        result = subprocess.run([sys.executable, '-c', 'import habits.workers'], cwd=settings.BASE_DIR, capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class HabitDeletionTests(TestCase):
+    def setUp(self):
+        self.username1 = 'admin_deletion'
+        self.password1 = 'password123_deletion'
+
+        self.user = create_user(self.username1, self.password1)
+        self.habit_daily = create_habit(self.user, 'Habit every day test deletion', 'habit deletion purpose', 'daily')
+        today = get_local_now_date()
+        HabitLog.objects.bulk_create(
+            HabitLog(habit=self.habit_daily, comment='log', status=HABIT_LOG_STATUS_COMPLITED, date=today - timedelta(days=days_before))
+            for days_before in range(1, 31)
+        )
+
+    def assertHabitLogsAreNotLoaded(self, queries):
+        habit_log_table = HabitLog._meta.db_table
+        for query in queries:
+            if habit_log_table in query['sql']:
+                self.assertTrue(query['sql'].startswith('DELETE'), query['sql'])
+
+    def test_delete_habit_logs_in_batches(self):
+        '''Проверка, что логи привычки удаляются пачками без загрузки их в память'''
+        with CaptureQueriesContext(connection) as context:
+            deleted = delete_habit_logs_in_batches(self.habit_daily, batch_size=7)
+
+        self.assertEqual(deleted, 30)
+        self.assertEqual(len(context.captured_queries), 6) # 5 пачек и пустая
+        self.assertHabitLogsAreNotLoaded(context.captured_queries)
+        self.assertFalse(HabitLog.objects.exists())
+
+    def test_delete_habit_does_not_load_habit_logs(self):
+        '''Проверка, что удаление привычки через веб-приложение удаляет её логи, не загружая их'''
+        self.client.login(username=self.username1, password=self.password1)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('habits:delete_habit', args=(self.habit_daily.id, )))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertHabitLogsAreNotLoaded(context.captured_queries)
+        self.assertFalse(Habit.objects.exists())
+        self.assertFalse(HabitLog.objects.exists())
+
+    def test_delete_user_deletes_habits_and_habit_logs(self):
+        '''Проверка, что удаление пользователя удаляет его привычки и их логи, не загружая логи'''
+        create_habit_log(create_habit(self.user, 'Habit weekly test deletion', 'habit deletion purpose', 'weekly', 2), 'Log', HABIT_LOG_STATUS_COMPLITED)
+
+        with CaptureQueriesContext(connection) as context:
+            self.user.delete()
+
+        self.assertHabitLogsAreNotLoaded(context.captured_queries)
+        self.assertFalse(Habit.objects.exists())
+        self.assertFalse(HabitLog.objects.exists())
+
+
+class HabitImportServiceTests(TestCase):
+    def setUp(self):
+        self.user = create_user('admin_import_services', 'password123_import_services')
+        self.today = get_local_now_date()
+
+    def test_import_inserts_logs_in_chunks_and_recomputes_streak_once(self):
+        '''Проверка, что кол-во запросов импорта зависит от кол-ва пачек, а не строк, и streak считается по всей импортированной истории'''
+        records = [(1, 'habit', {'id': 1, 'title': 'Imported habit', 'purpose': 'import', 'datetype': 'daily', 'frequency': 1})]
+        records += [
+            (line_number, 'habit_log', {'habit': 1, 'date': self.today - timedelta(days=days_before), 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Done'})
+            for line_number, days_before in enumerate(range(30, 0, -1), start=2)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            import_habit_history(self.user, records, chunk_size=10)
+        habit = Habit.objects.get(user=self.user)
+
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT') and f'INTO "{HabitLog._meta.db_table}"' in query['sql']]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(habit.streak, 30)
+        self.assertEqual(HabitLog.objects.for_habit(habit).count(), 30)
+
+    def test_import_command(self):
+        '''Проверка команды импорта из NDJSON-файла'''
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8') as file:
+            file.write(json.dumps({'type': 'habit', 'id': 1, 'title': 'Привычка из файла', 'purpose': 'import', 'datetype': 'weekly', 'frequency': 2}) + '\n')
+            for days_before in (2, 1):
+                file.write(json.dumps({'type': 'habit_log', 'habit': 1, 'date': str(self.today - timedelta(days=days_before)), 'status': HABIT_LOG_STATUS_COMPLITED, 'comment': 'Done'}) + '\n')
+            file.flush()
+
+            call_command('import_habits', self.user.username, file.name, stdout=StringIO())
+        habit = Habit.objects.get(user=self.user)
+
+        self.assertEqual((habit.title, habit.datetype, habit.frequency), ('Привычка из файла', 'weekly', 2))
+        self.assertEqual(habit.period_complited, 2)
+
+
+class CheckInQueueServiceTests(TestCase):
+    def setUp(self):
+        self.user = create_user('admin_check_in_queue', 'password123_check_in_queue')
+        self.today = get_local_now_date()
+
+    def create_habit_with_log(self, title):
+        habit = create_habit(self.user, title, 'check-in queue', 'daily')
+        create_habit_log(habit, 'Log 4 days ago', HABIT_LOG_STATUS_COMPLITED, days_before=4)
+        sync_habit_period_counters(habit)
+        return habit
+
+    def queue_check_in(self, habit, days_before=0, status=HABIT_LOG_STATUS_COMPLITED):
+        return HabitCheckInRequest.objects.create(user=self.user, habit=habit, date=self.today - timedelta(days=days_before), status=status, comment='Queued')
+
+    def test_check_ins_of_habit_are_applied_in_order_with_one_update(self):
+        '''Проверка, что запросы одной привычки применяются по порядку id, а кол-во запросов к БД не зависит от кол-ва check-in и привычек'''
+        habit = self.create_habit_with_log('Queued habit')
+        for days_before in (2, 1, 0):
+            self.queue_check_in(habit, days_before)
+        stale_check_in = self.queue_check_in(habit, days_before=3)
+
+        with CaptureQueriesContext(connection) as single_habit_queries:
+            processed = process_check_in_queue()
+        habit.refresh_from_db()
+        stale_check_in.refresh_from_db()
+
+        self.assertEqual(processed, 4)
+        self.assertEqual(habit.streak, 3)
+        self.assertEqual(habit.last_log_date, self.today)
+        self.assertEqual(list(HabitLog.objects.for_habit(habit).values_list('status', flat=True)), [HABIT_LOG_STATUS_COMPLITED, HABIT_LOG_STATUS_FORGOT_TO_MARK] + [HABIT_LOG_STATUS_COMPLITED] * 3)
+        self.assertEqual(stale_check_in.state, 'failed')
+        self.assertFalse(HabitCheckInRequest.objects.filter(state='pending').exists())
+
+        habits = [self.create_habit_with_log(f'Queued habit {i}') for i in range(5)]
+        for habit in habits:
+            self.queue_check_in(habit, days_before=1)
+            self.queue_check_in(habit)
+        with CaptureQueriesContext(connection) as many_habits_queries:
+            process_check_in_queue()
+
+        self.assertEqual(len(many_habits_queries), len(single_habit_queries))
+        self.assertEqual(Habit.objects.filter(pk__in=[habit.pk for habit in habits], streak=2).count(), len(habits))
+
+    def test_batch_size_limits_claimed_check_ins(self):
+        '''Проверка, что воркер за раз забирает batch_size привычек с самыми старыми запросами, а команда обрабатывает очередь до конца'''
+        habits = [self.create_habit_with_log(f'Queued habit {i}') for i in range(3)]
+        for habit in habits:
+            self.queue_check_in(habit)
+
+        self.assertEqual(process_check_in_queue(batch_size=2), 2)
+        self.assertEqual(HabitCheckInRequest.objects.get(habit=habits[2]).state, 'pending')
+
+        stdout = StringIO()
+        call_command('process_check_ins', once=True, batch_size=2, stdout=stdout)
+
+        self.assertIn('Processed 1 check-ins.', stdout.getvalue())
+        self.assertEqual(HabitLog.objects.filter(habit__in=habits, date=self.today).count(), len(habits))
+
+    def test_rollover_waits_for_check_in_accepted_before_midnight(self):
+        '''Проверка, что ночной переход пропускает привычку с необработанным check-in за вчера, и запрос, обработанный после полуночи, применяется'''
+        habit = self.create_habit_with_log('Queued habit')
+        check_in = self.queue_check_in(habit, days_before=1)
+
+        self.assertEqual(rollover_habits(self.user.id, self.user.id), 0)
+        self.assertEqual(process_check_in_queue(), 1)
+        check_in.refresh_from_db()
+        habit.refresh_from_db()
+
+        self.assertEqual(check_in.state, 'done')
+        self.assertEqual(habit.last_log_date, self.today - timedelta(days=1))
+        self.assertEqual(HabitLog.objects.get(pk=check_in.habit_log_id).status, HABIT_LOG_STATUS_COMPLITED)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SELECT ... FOR UPDATE SKIP LOCKED проверяется только на PostgreSQL')
+class CheckInQueueConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user('admin_check_in_queue_concurrency', 'password123_check_in_queue')
+        self.habits = [create_habit(self.user, f'Queued habit {i}', 'check-in queue', 'daily') for i in range(2)]
+        for habit in self.habits:
+            HabitCheckInRequest.objects.create(user=self.user, habit=habit, status=HABIT_LOG_STATUS_COMPLITED, comment='Queued')
+
+    def test_workers_claim_different_habits(self):
+        '''Проверка, что воркер пропускает привычку, заблокированную другим воркером, и забирает следующую по очереди'''
+        other_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            other_connection.set_autocommit(False)
+            with other_connection.cursor() as cursor:
+                cursor.execute(f'SELECT id FROM {Habit._meta.db_table} WHERE id = %s FOR UPDATE', [self.habits[0].pk])
+
+                self.assertEqual(process_check_in_queue(batch_size=1), 1)
+        finally:
+            other_connection.rollback()
+            other_connection.close()
+
+        self.assertEqual(
+            dict(HabitCheckInRequest.objects.values_list('habit_id', 'state')),
+            {self.habits[0].pk: 'pending', self.habits[1].pk: 'done'}
+        )
+
+
+class PurgeExpiredRecordsTests(TestCase):
+    def setUp(self):
+        self.user = create_user('admin_purge_records', 'password123_purge_records')
+
+    def test_purge_expired_tombstones(self):
+        '''Проверка, что удаляются только записи об удалениях старше срока хранения'''
+        HabitTombstone.objects.bulk_create(HabitTombstone(user=self.user, habit_id=habit_id) for habit_id in range(1, 6))
+        HabitTombstone.objects.filter(habit_id__lte=3).update(deleted_at=timezone.now() - HABIT_TOMBSTONE_RETENTION - timedelta(days=1))
+
+        self.assertEqual(purge_expired_records(batch_size=2), 3)
+        self.assertEqual(set(HabitTombstone.objects.values_list('habit_id', flat=True)), {4, 5})
+
+    def test_purge_expired_idempotency_keys(self):
+        '''Проверка, что удаляются только сохранённые ответы по Idempotency-Key старше срока хранения'''
+        habit = create_habit(self.user, 'Habit purge records', 'purge', 'daily')
+        HabitLogIdempotencyKey.objects.bulk_create(
+            HabitLogIdempotencyKey(user=self.user, key=f'key-{i}', habit=habit, response_status=201, response_data={}) for i in range(3)
+        )
+        HabitLogIdempotencyKey.objects.filter(key='key-0').update(creation_date=timezone.now() - IDEMPOTENCY_KEY_RETENTION - timedelta(days=1))
+
+        self.assertEqual(purge_expired_records(), 1)
+        self.assertEqual(set(HabitLogIdempotencyKey.objects.values_list('key', flat=True)), {'key-1', 'key-2'})
+
+    def test_purge_expired_check_in_requests(self):
+        '''Проверка, что удаляются только обработанные асинхронные check-in старше срока хранения, а необработанные остаются'''
+        habit = create_habit(self.user, 'Habit purge records', 'purge', 'daily')
+        expired = timezone.now() - CHECK_IN_REQUEST_RETENTION - timedelta(days=1)
+        for state, processed_at in (('done', expired), ('failed', expired), ('done', timezone.now()), ('pending', None)):
+            HabitCheckInRequest.objects.create(user=self.user, habit=habit, status=HABIT_LOG_STATUS_COMPLITED, comment=state, state=state, processed_at=processed_at)
+        HabitCheckInRequest.objects.filter(state='pending').update(creation_date=expired)
+
+        self.assertEqual(purge_expired_records(), 2)
+        self.assertEqual(sorted(HabitCheckInRequest.objects.values_list('state', flat=True)), ['done', 'pending'])
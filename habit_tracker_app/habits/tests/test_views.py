@@ -33,6 +33,19 @@ class HabitViewTests(TestCase):
 
         self.assertQuerySetEqual(response.context['habits'], [Habit.objects.get(datetype='daily'), Habit.objects.get(datetype='weekly')])
 
+    def test_habitslist_is_paginated_by_cursor(self):
+        '''Проверка, что список привычек выводится по страницам со ссылкой на следующую страницу.'''
+        self.client.login(username=self.username1, password=self.password1)
+        first_page_response = self.client.get(reverse('habits:habits_list', query={'page_size': 1}))
+        second_page_response = self.client.get(first_page_response.context['next_page_url'])
+        invalid_cursor_response = self.client.get(reverse('habits:habits_list', query={'cursor': 'abc'}))
+
+        self.assertEqual(list(first_page_response.context['habits']), [self.habit_daily])
+        self.assertContains(first_page_response, 'Следующие привычки')
+        self.assertEqual(list(second_page_response.context['habits']), [self.habit_weekly])
+        self.assertIsNone(second_page_response.context['next_page_url'])
+        self.assertEqual(invalid_cursor_response.status_code, 404)
+
     def test_habitslist_dont_display_other_user_habits(self):
         '''Проверка, что пользователь не может видеть привычки других пользователей, а только свои.'''
         self.client.login(username=self.username2, password=self.password2)
@@ -247,7 +260,8 @@ class HabitViewTests(TestCase):
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Habit.objects.get(datetype='weekly').frequency, data['frequency'])
-        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 0) # логи удалились
+        self.assertEqual(HabitLog.objects.for_habit(Habit.objects.get(pk=habit.pk)).count(), 0) # логи прошлого расписания не учитываются
+        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1) # но остаются в БД
 
     def test_update_habit_with_changed_datetype(self):
         '''Проверка обновления привычки, у которой изменено поле типа даты'''
@@ -261,7 +275,8 @@ class HabitViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Habit.objects.get(title=habit).frequency, 1)
         self.assertEqual(Habit.objects.get(title=habit).datetype, data['datetype'])
-        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 0) # логи удалились
+        self.assertEqual(HabitLog.objects.for_habit(Habit.objects.get(pk=habit.pk)).count(), 0) # логи прошлого расписания не учитываются
+        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1) # но остаются в БД
 
     def test_update_habit_with_changed_title_or_purpose(self):
         '''Проверка обновления привычки, у которой изменено название или цель'''
@@ -276,4 +291,48 @@ class HabitViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(edited_habit.title, data['title'])
         self.assertEqual(edited_habit.purpose, data['purpose'])
-        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1) # логи не удалились
\ No newline at end of file
+        self.assertEqual(HabitLog.objects.filter(habit=habit).count(), 1) # логи не удалились
+
+    def test_habit_detail_page_shows_weekly_habit_logs_by_weeks(self):
+        '''Проверка, что на странице еженедельной привычки логи разбиты по неделям вместе с итогами каждой недели'''
+        habit = Habit.objects.get(datetype='weekly')
+        for days_before in range(1, 10):
+            create_habit_log(habit, f'New log {days_before}', HABIT_LOG_STATUS_COMPLITED if days_before < 3 else HABIT_LOG_STATUS_INCOMPLITED, days_before)
+
+        self.client.login(username=self.username1, password=self.password1)
+        response = self.client.get(reverse('habits:detail_habit', args=(habit.id, )))
+        weeks = response.context['weeks']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(week['logs']) for week in weeks], [7, 2])
+        self.assertEqual([week['complited'] for week in weeks], [0, 2])
+        self.assertEqual(weeks[1]['logs'][-1]['comment'], 'New log 1')
+        self.assertContains(response, 'Вы не смогли выполнить привычку за 1 неделю')
+
+    def test_habit_detail_page_filters_habit_logs_by_date_range(self):
+        '''Проверка, что на странице привычки показываются только логи за последние недели, выровненные по неделям еженедельной привычки'''
+        habit_daily = Habit.objects.get(datetype='daily')
+        habit_weekly = Habit.objects.get(datetype='weekly')
+        for days_before in range(20, 0, -1):
+            create_habit_log(habit_daily, f'New log {days_before}', HABIT_LOG_STATUS_COMPLITED, days_before)
+            create_habit_log(habit_weekly, f'New log {days_before}', HABIT_LOG_STATUS_COMPLITED, days_before)
+
+        self.client.login(username=self.username1, password=self.password1)
+        daily_response = self.client.get(reverse('habits:detail_habit', args=(habit_daily.id, )), {'last_n_weeks': 1})
+        weekly_response = self.client.get(reverse('habits:detail_habit', args=(habit_weekly.id, )), {'last_n_weeks': 2})
+
+        self.assertEqual([log['comment'] for log in daily_response.context['habitLogs']], [f'New log {days_before}' for days_before in range(6, 0, -1)])
+        self.assertEqual([len(week['logs']) for week in weekly_response.context['weeks']], [7, 6])
+        self.assertEqual([week['is_closed'] for week in weekly_response.context['weeks']], [True, False])
+
+    def test_habit_detail_page_ignores_invalid_date_range(self):
+        '''Проверка, что при неверном диапазоне дат показывается вся история и ошибка формы'''
+        habit = Habit.objects.get(datetype='daily')
+        create_habit_log(habit, 'New log', HABIT_LOG_STATUS_COMPLITED, 1)
+
+        self.client.login(username=self.username1, password=self.password1)
+        response = self.client.get(reverse('habits:detail_habit', args=(habit.id, )), {'from': '2025-02-01', 'to': '2025-01-01'})
+
+        self.assertEqual(len(response.context['habitLogs']), 1)
+        self.assertContains(response, 'Дата начала не может быть позже даты конца')
+
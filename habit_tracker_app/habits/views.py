@@ -4,9 +4,13 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse, reverse_lazy
 
+from rest_framework.exceptions import NotFound
+
 from .models import Habit, HabitLog
-from .forms import HabitForm, CreateHabitLogForm
-from .helpers import set_habit_logs_status_forgot_to_mark, increase_habit_streak_field, divide_habit_logs_of_weekly_habit_by_week_blocks
+from .forms import HabitForm, CreateHabitLogForm, HabitLogsDateRangeForm
+from .helpers import get_habit_logs_bounds, get_habit_weeks, fill_habit_log_gaps
+from .services import check_in_habit, HabitAlreadyCheckedIn
+from .api.pagination import HabitListCursorPagination
 
 
 def redirect_to_habits(request):
@@ -19,11 +23,17 @@ class HabitsList(LoginRequiredMixin, generic.ListView):
     success_url = reverse_lazy('habits:habits_list')
     
     def get_queryset(self):
-        return Habit.objects.filter(user=self.request.user)
+        # привычки - по страницам, как в API (см. HabitListCursorPagination)
+        try:
+            habits, self.next_page_url = HabitListCursorPagination().paginate_habits(Habit.objects.filter(user=self.request.user), self.request)
+        except NotFound:
+            raise Http404('Неверный курсор')
+        return habits
     
     def get_context_data(self, **kwargs):
         data =  super().get_context_data(**kwargs)
         data['habitlog_form'] = CreateHabitLogForm
+        data['next_page_url'] = self.next_page_url
         return data
 
 class CreateHabit(LoginRequiredMixin, generic.CreateView):
@@ -55,9 +65,9 @@ class UpdateHabit(LoginRequiredMixin, generic.UpdateView):
         return super().dispatch(request, *args, **kwargs)
     
     def form_valid(self, form):
-        if (self.get_object().frequency != form.cleaned_data.get('frequency')) or (self.get_object().datetype != form.cleaned_data.get('datetype')): # если было изменено поле frequency или datetype
-            HabitLog.objects.filter(habit=self.get_object()).delete()
-        instance = form.save(commit=False, upd=True)
+        habit = self.get_object()
+        schedule_changed = (habit.frequency != form.cleaned_data.get('frequency')) or (habit.datetype != form.cleaned_data.get('datetype'))
+        form.save(commit=False, upd=schedule_changed)
         return super().form_valid(form)
     
     def handle_habit_not_found(self):
@@ -90,11 +100,19 @@ class HabitDetail(LoginRequiredMixin, generic.DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        habit_logs_list = HabitLog.objects.filter(habit=self.get_object())
-        if self.get_object().datetype == 'weekly':
-            habit_logs_list, amount_complited_habit_logs_in_each_week_block = divide_habit_logs_of_weekly_habit_by_week_blocks(habit_logs_list)
-            context['c'] = amount_complited_habit_logs_in_each_week_block
+        habit = self.object
+        date_range_form = HabitLogsDateRangeForm(self.request.GET)
+        habit_logs = HabitLog.objects.for_habit(habit)
+        # читаются только логи из запрошенного диапазона дат
+        bounds = get_habit_logs_bounds(habit_logs, *date_range_form.get_date_range(habit))
+        habit_logs_list = []
+        if bounds is not None and habit.datetype == 'weekly':
+            context['weeks'] = get_habit_weeks(habit, habit_logs, *bounds)
+        elif bounds is not None:
+            habit_logs_in_range = habit_logs.filter(date__gte=bounds[0], date__lte=bounds[1]).values('id', 'date', 'status', 'comment')
+            habit_logs_list = list(fill_habit_log_gaps(habit_logs_in_range, start=bounds[0], end=bounds[1]))
         context['habitLogs'] = habit_logs_list
+        context['date_range_form'] = date_range_form
         return context
     
     def handle_habit_not_found(self):
@@ -107,19 +125,17 @@ def create_habitlog(request, pk):
         habit = get_object_or_404(Habit, user=request.user, pk=pk)
     except Http404:
         return HttpResponseRedirect(reverse('habits:habits_list'))
-    habit_logs = HabitLog.objects.filter(habit=habit)
     if status == 'complited' or status == 'incomplited':
         form = CreateHabitLogForm(habit=habit)
         if request.method == "POST":
             form = CreateHabitLogForm(habit=habit, data=request.POST)
             if form.is_valid():
-                if habit_logs.count() > 0:
-                    last_habit_log_date = habit_logs.last().date
-                    set_habit_logs_status_forgot_to_mark(habit, last_habit_log_date)
-                increase_habit_streak_field(habit, habit_logs, status)
-                habitLog = HabitLog(habit=habit, comment=form.cleaned_data.get('comment'), status=status)
-                habitLog.save()
-                return HttpResponseRedirect(reverse("habits:habits_list"))
+                try:
+                    check_in_habit(habit, status, form.cleaned_data.get('comment'))
+                except HabitAlreadyCheckedIn as e: # параллельный запрос успел создать лог раньше
+                    form.add_error(None, form.already_checked_in_error(e.args[0]))
+                else:
+                    return HttpResponseRedirect(reverse("habits:habits_list"))
             
         return render(request, 'habits/set_habit_log_status.html', {'habit': habit, 'form': form, 'status': status})
     else:
@@ -0,0 +1,18 @@
+'''
+    Функции процессов пула rollover_habits. При запуске через spawn или forkserver (по умолчанию в Linux с Python 3.14) процесс пула
+    импортирует этот модуль до django.setup(), поэтому модели и сервисы здесь импортируются только внутри функций
+'''
+import django
+from django.db import connections
+
+
+def init_worker():
+    '''В процессе, запущенном через fork, Django уже настроен, и повторный вызов ничего не делает'''
+    django.setup()
+
+def rollover_users_range(users_range, today):
+    from .services import rollover_habits
+    try:
+        return rollover_habits(*users_range, today=today)
+    finally:
+        connections.close_all()